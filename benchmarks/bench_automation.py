@@ -0,0 +1,95 @@
+''' bench_automation.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# A controller sweeping the three parameters of an oscillator at a given
+# update rate through automation.Automation, against a sink that counts
+# the edit messages that reach it.
+#
+#   python benchmarks/bench_automation.py [updates per second] [seconds]
+
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pycyperus import automation
+from pycyperus import pycyperus
+
+PORT_SINK = 27213
+
+
+class _Sink():
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('127.0.0.1', PORT_SINK))
+        self.sock.settimeout(0.2)
+        self.received = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.running = True
+        self.thread.start()
+
+    def _run(self):
+        while self.running:
+            try:
+                self.sock.recv(65536)
+            except OSError:
+                continue
+            self.received += 1
+
+    def close(self):
+        self.running = False
+        self.thread.join()
+        self.sock.close()
+
+
+def _run(rate, updates_per_second, seconds):
+    sink = _Sink()
+    client = pycyperus._Client(PORT_SINK, pycyperus._PendingTable())
+    sender = automation.Automation(client, rate)
+    sender.add('oscillator_sine', 'module-0', frequency=440.0, amplitude=1.0, phase=0.0)
+    period = 1 / updates_per_second
+    start = time.perf_counter()
+    start_cpu = time.process_time()
+    count = 0
+    while time.perf_counter() - start < seconds:
+        sender.update('module-0',
+                      frequency=440.0 + count % 100,
+                      amplitude=(count % 10) / 10,
+                      phase=0.0)
+        count += 1
+        time.sleep(max(start + count * period - time.perf_counter(), 0))
+    sender.close()
+    cpu = time.process_time() - start_cpu
+    time.sleep(0.3)
+    sink.close()
+    stats = sender.stats()[('module-0', 'frequency')]
+    return count, stats['sent'], stats['dropped'], sink.received, cpu
+
+def main(updates_per_second=1000, seconds=2):
+    print(f"{'rate cap':>9}{'updates':>9}{'sent':>7}{'dropped':>9}{'received':>10}{'cpu s':>7}")
+    for rate in (50, 200, 1000):
+        updates, sent, dropped, received, cpu = _run(rate, updates_per_second, seconds)
+        print(f"{rate:>9}{updates:>9}{sent:>7}{dropped:>9}{received:>10}{cpu:>7.2f}")
+
+if __name__ == '__main__':
+    main(*(float(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,73 @@
+''' bench_bundle.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Cost of sending a patch load of add_connection requests one datagram
+# each against packing them into MTU-sized OSC bundles.  Datagrams go to
+# a bound socket nobody reads.
+#
+#   python benchmarks/bench_bundle.py [requests] [repeats]
+
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pycyperus import pycyperus
+
+PORT_SINK = 27213
+
+
+def _plain(sock, address, encoder, request_ids):
+    for request_id in request_ids:
+        sock.sendto(encoder.encode('/cyperus/add/connection',
+                                   (request_id, 'out-0', 'in-0')),
+                    address)
+    return len(request_ids)
+
+def _bundled(sock, address, encoder, request_ids):
+    bundler = pycyperus._Bundler(sock, address)
+    for request_id in request_ids:
+        bundler.add(encoder.encode('/cyperus/add/connection',
+                                   (request_id, 'out-0', 'in-0')))
+    bundler.flush()
+    return bundler.datagrams
+
+def main(requests=200, repeats=500):
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(('127.0.0.1', PORT_SINK))
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    address = ('127.0.0.1', PORT_SINK)
+    encoder = pycyperus._MessageEncoder()
+    request_ids = [pycyperus._next_request_id() for _ in range(requests)]
+
+    print(f"{'sender':<10}{'datagrams':>10}{'us/load':>10}")
+    for label, run in (('plain', _plain), ('bundled', _bundled)):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            datagrams = run(sock, address, encoder, request_ids)
+        elapsed = time.perf_counter() - start
+        print(f"{label:<10}{datagrams:>10}{elapsed / repeats * 1e6:>10.1f}")
+    sock.close()
+    sink.close()
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
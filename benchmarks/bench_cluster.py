@@ -0,0 +1,74 @@
+''' bench_cluster.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Wall time to deploy the same small patch (a pipelined batch of
+# add_connection calls) to 1, 5 and 20 responders through a Cluster,
+# with the slowest node's latency.  The responders run in this process
+# and share its interpreter lock, so the spread over many nodes is worse
+# than against real servers.
+#
+#   python benchmarks/bench_cluster.py [connections]
+
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from pycyperus import cluster
+from responder import Responder
+
+PORT_RECEIVE = 27212
+PORT_NODES = 27400
+
+
+def _deploy(api, connections):
+    with api.batch() as batch:
+        for index in range(connections):
+            batch.add_connection('out-0', f"in-{index}")
+    return batch.results
+
+def _run(nodes, connections):
+    responders = [Responder(PORT_NODES + i, PORT_RECEIVE) for i in range(nodes)]
+    with cluster.Cluster({f"node-{i}": ('127.0.0.1', PORT_NODES + i)
+                          for i in range(nodes)},
+                         PORT_RECEIVE) as nodes_cluster:
+        start = time.perf_counter()
+        results = nodes_cluster.map(lambda api: _deploy(api, connections))
+        elapsed = time.perf_counter() - start
+    for responder in responders:
+        responder.close()
+    return elapsed, max(result.latency for result in results.values())
+
+def main(connections=50):
+    stdout = sys.stdout
+    print(f"{'nodes':>6}{'wall ms':>10}{'slowest ms':>12}")
+    for nodes in (1, 5, 20):
+        sys.stdout = io.StringIO()
+        try:
+            elapsed, slowest = _run(nodes, connections)
+        finally:
+            sys.stdout = stdout
+        print(f"{nodes:>6}{elapsed * 1e3:>10.1f}{slowest * 1e3:>12.1f}")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,66 @@
+''' bench_loss.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Latency of list_bus against a responder that drops a fraction of the
+# requests, with adaptive retransmission.  Without it every loss costs
+# the full 20 second timeout.
+#
+#   python benchmarks/bench_loss.py [iterations]
+
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from pycyperus import pycyperus
+from responder import Responder
+
+PORT_RECEIVE = 27212
+PORT_SEND = 27211
+
+
+def _run(loss, iterations):
+    responder = Responder(PORT_SEND, PORT_RECEIVE, loss)
+    api = pycyperus.Api(PORT_RECEIVE, PORT_SEND, retransmit=True)
+    samples = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(iterations):
+            start = time.perf_counter()
+            api.list_bus('', 'ALL_DESCENDANTS')
+            samples.append((time.perf_counter() - start) * 1e3)
+    retransmits = api.stats()['/cyperus/list/bus']['retransmits']
+    api.close()
+    responder.close()
+    quantiles = statistics.quantiles(samples, n=100)
+    return quantiles[49], quantiles[98], max(samples), retransmits
+
+def main(iterations=2000):
+    print(f"{'loss':>6}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'resent':>8}")
+    for loss in (0.0, 0.01, 0.05, 0.2):
+        p50, p99, worst, retransmits = _run(loss, iterations)
+        print(f"{loss:>6.2f}{p50:>10.3f}{p99:>10.3f}{worst:>10.3f}{retransmits:>8}")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,86 @@
+''' bench_names.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Resolving 'main/bus_<i>/oscillator_sine:out' to a port id against the
+# emulator: by listing buses, modules and module ports and scanning them
+# for the names, as wiring code does without an index, and through
+# Api.names().  The index is crawled once, which is timed separately.
+#
+#   python benchmarks/bench_names.py [buses]
+
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pycyperus import emulator
+from pycyperus import pycyperus
+
+PORT_RECEIVE = 27212
+PORT_SEND = 27211
+LOOKUPS = 200
+
+
+def _scan(api, main, i):
+    bus = next(bus for bus in api.list_bus(main, 'DIRECT_DESCENDANT')
+               if bus['name'] == f"bus_{i}")
+    module = next(module for module in api.list_module(bus['id'])
+                  if module['name'] == 'oscillator_sine')
+    return next(port for port in api.list_module_port(module['id'])['out']
+                if port['name'] == 'out')['id']
+
+def main(buses=500):
+    server = emulator.Emulator(PORT_SEND, PORT_RECEIVE)
+    api = pycyperus.Api(PORT_RECEIVE, PORT_SEND)
+    with contextlib.redirect_stdout(io.StringIO()):
+        main_id = api.add_bus('', 'main', 'in_0', 'out_0')
+        with api.batch() as b:
+            for i in range(buses):
+                b.add_bus(main_id, f"bus_{i}", 'in_0', 'out_0')
+        with api.batch() as b:
+            for bus in api.list_bus(main_id, 'DIRECT_DESCENDANT'):
+                b.add_modules_oscillator_sine(bus['id'], 440.0, 1.0, 0.0)
+
+        targets = [i * 7919 % buses for i in range(LOOKUPS)]
+        start = time.perf_counter()
+        scanned = [_scan(api, main_id, i) for i in targets]
+        scan = time.perf_counter() - start
+
+        start = time.perf_counter()
+        names = api.names()
+        crawl = time.perf_counter() - start
+
+        start = time.perf_counter()
+        resolved = [names.resolve(f"main/bus_{i}/oscillator_sine:out") for i in targets]
+        resolve = time.perf_counter() - start
+    api.close()
+    server.close()
+
+    assert scanned == resolved
+    print(f"{'method':<12}{'us/lookup':>12}{'requests':>10}")
+    print(f"{'scan':<12}{scan / LOOKUPS * 1e6:>12.1f}{3 * LOOKUPS:>10}")
+    print(f"{'index':<12}{resolve / LOOKUPS * 1e6:>12.1f}{0:>10}")
+    print(f"crawl of {len(names)} entries: {crawl * 1e3:.1f} ms")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,95 @@
+''' bench_patch.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Saves a patch of envelope followers spread over buses with `connections`
+# random connections between them, then restores it into a fresh
+# emulator, timing each and reporting the file size.
+#
+#   python benchmarks/bench_patch.py [connections]
+
+import contextlib
+import io
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pycyperus import emulator
+from pycyperus import pycyperus
+
+PORT_RECEIVE = 27212
+PORT_SEND = 27211
+BUSES = 50
+MODULES = 1000
+
+
+def _build(api, connections, seed=1):
+    rng = random.Random(seed)
+    main = api.add_bus('', 'main', 'in_0,in_1', 'out_0,out_1')
+    with api.batch() as b:
+        for i in range(BUSES):
+            b.add_bus(main, f"bus_{i}", 'in_0', 'out_0')
+    buses = b.results
+    with api.batch() as b:
+        for i in range(MODULES):
+            b.add_modules_envelope_follower(buses[i % BUSES], 1.0, 1.0, 1.0 + i)
+    modules = b.results
+    with api.batch() as b:
+        for module_id in modules:
+            b.list_module_port(module_id)
+    ports = b.results
+    with api.batch() as b:
+        for _ in range(connections):
+            b.add_connection(rng.choice(ports)['out'][0]['id'],
+                             rng.choice(ports)['in'][0]['id'])
+
+def main(connections=10000):
+    filename = os.path.join(tempfile.mkdtemp(), 'patch.bin')
+    with contextlib.redirect_stdout(io.StringIO()):
+        server = emulator.Emulator(PORT_SEND, PORT_RECEIVE)
+        api = pycyperus.Api(PORT_RECEIVE, PORT_SEND)
+        _build(api, connections)
+        start = time.perf_counter()
+        saved = api.save(filename)
+        save = time.perf_counter() - start
+        api.close()
+        server.close()
+
+        server = emulator.Emulator(PORT_SEND, PORT_RECEIVE)
+        api = pycyperus.Api(PORT_RECEIVE, PORT_SEND)
+        start = time.perf_counter()
+        ids = api.restore(filename)
+        restore = time.perf_counter() - start
+        restored = len(server.connections)
+        api.close()
+        server.close()
+
+    print(f"{saved}")
+    print(f"file         {os.path.getsize(filename) / 1024:.1f} KiB")
+    print(f"save         {save * 1e3:.0f} ms")
+    print(f"restore      {restore * 1e3:.0f} ms, {len(ids)} ids remapped, "
+          f"{restored} connections live")
+    os.remove(filename)
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
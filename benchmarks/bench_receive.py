@@ -0,0 +1,102 @@
+''' bench_receive.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Receive throughput of _Server's single-thread loop against the previous
+# thread-per-datagram ThreadingOSCUDPServer with Dispatcher routing.  A
+# burst of list_bus responses and /cyperus/dsp/load telemetry is sent in
+# windows small enough not to overflow the socket buffer.
+#
+#   python benchmarks/bench_receive.py [responses]
+
+import contextlib
+import io
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pythonosc.dispatcher import Dispatcher as OscDispatcher
+from pythonosc import osc_server
+
+from pycyperus import pycyperus
+
+PORT_RECEIVE = 27212
+WINDOW = 64
+LISTING = '4f6c1d0e-8b2a-4c3e-9d5f-0a1b2c3d4e5f|main|2|2\n'
+
+
+class _ThreadingServer(pycyperus._Server):
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def server_thread_run(self):
+        self.dispatcher = OscDispatcher()
+        self.dispatcher.map('/cyperus/dsp/load', self.osc_dsp_load_handler)
+        self.dispatcher.map('/cyperus/list/bus', self.osc_list_bus)
+        self.server = osc_server.ThreadingOSCUDPServer(
+            ('127.0.0.1', self.port), self.dispatcher)
+        self.ready.set()
+        self.server.serve_forever()
+
+
+def _run(server_class, responses):
+    pending = pycyperus._PendingTable()
+    server = server_class(PORT_RECEIVE, pending)
+    encoder = pycyperus._MessageEncoder()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    address = ('127.0.0.1', PORT_RECEIVE)
+
+    request_ids = [pycyperus._next_request_id() for _ in range(responses)]
+    for request_id in request_ids:
+        pending.add(request_id, pycyperus._PendingRequest())
+
+    start_cpu = time.process_time()
+    start = time.perf_counter()
+    for window in range(0, responses, WINDOW):
+        batch = request_ids[window:window + WINDOW]
+        for request_id in batch:
+            sock.sendto(encoder.encode('/cyperus/list/bus',
+                                       (request_id, 0, 0, '', 3, LISTING)),
+                        address)
+            sock.sendto(encoder.encode('/cyperus/dsp/load', (0.25,)), address)
+        for request_id in batch:
+            pending.get(request_id).wait(5)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - start_cpu
+
+    received = sum(1 for request_id in request_ids if pending.get(request_id).done)
+    server.close()
+    sock.close()
+    return received, elapsed, cpu
+
+def main(responses=20000):
+    print(f"{'server':<12}{'received':>10}{'msgs/s':>12}{'cpu s':>8}")
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = [(label, *_run(server_class, responses))
+                   for label, server_class in (('threading', _ThreadingServer),
+                                               ('loop', pycyperus._Server))]
+    for label, received, elapsed, cpu in results:
+        print(f"{label:<12}{received:>10}{2 * received / elapsed:>12.0f}{cpu:>8.2f}")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
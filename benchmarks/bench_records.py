@@ -0,0 +1,137 @@
+''' bench_records.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Parse time and memory of a large list_bus and list_module_port result:
+# the previous dict-per-entry parsing, slotted records decoded up front,
+# and the lazy Listing view, both for one entry and for all of them.
+# Memory is what tracemalloc sees allocated while the result is alive;
+# the lazy view also keeps the response text alive, whose size is
+# printed first.
+#
+#   python benchmarks/bench_records.py [entries]
+
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pycyperus import pycyperus
+from pycyperus import records
+
+REPEAT = 5
+
+
+def _dict_bus(elem):
+    bus_id, name, ins_count, outs_count = elem.split('|')
+    return {
+        'id': bus_id,
+        'name': name,
+        'ins_count': ins_count,
+        'outs_count': outs_count
+    }
+
+def _dict_port(elem):
+    port_id, name = elem.split('|')
+    return {
+        'id': port_id,
+        'name': name
+    }
+
+def _dicts_bus(response):
+    return [_dict_bus(elem) for elem in pycyperus._iter_lines((response,))]
+
+def _dicts_port(response):
+    ports = {'in': [],
+             'out': []}
+    for direction, elem in pycyperus._iter_sections(pycyperus._iter_lines((response,))):
+        ports[direction].append(_dict_port(elem))
+    return ports
+
+def _records_bus(response):
+    return [records.parse_bus(elem) for elem in pycyperus._iter_lines((response,))]
+
+def _records_port(response):
+    ports = {'in': [],
+             'out': []}
+    for direction, port in pycyperus._iter_ports(pycyperus._iter_lines((response,))):
+        ports[direction].append(port)
+    return ports
+
+def _one_bus(result):
+    return result[len(result) // 2]
+
+def _one_port(result):
+    return result['out'][len(result['out']) // 2]
+
+def _all_bus(result):
+    for bus in result:
+        pass
+
+def _all_port(result):
+    for direction in ('in', 'out'):
+        for port in result[direction]:
+            pass
+
+def _responses(entries):
+    buses = ''.join(f"{uuid.uuid4()}|bus_{i}|{i % 8}|{i % 5}\n" for i in range(entries))
+    ports = ('in:\n' + ''.join(f"{uuid.uuid4()}|in_{i}\n" for i in range(entries // 2)) +
+             'out:\n' + ''.join(f"{uuid.uuid4()}|out_{i}\n" for i in range(entries // 2)))
+    return ((0, 0, '', 3, buses), (0, 0, '', ports))
+
+def _measure(parse, use, response):
+    best = None
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        use(parse(response))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    result = parse(response)
+    use(result)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return best, size
+
+def main(entries=50000):
+    bus_response, port_response = _responses(entries)
+    print(f"response text KiB: list_bus {len(bus_response[-1]) / 1024:.0f}, "
+          f"list_module_port {len(port_response[-1]) / 1024:.0f}")
+    print(f"{'listing':<18}{'parser':<10}{'access':<8}{'ms':>10}{'KiB':>10}")
+    for listing, response, parsers, uses in (
+            ('list_bus', bus_response,
+             (('dicts', _dicts_bus), ('records', _records_bus),
+              ('lazy', pycyperus._parse_list_bus)),
+             (('one', _one_bus), ('all', _all_bus))),
+            ('list_module_port', port_response,
+             (('dicts', _dicts_port), ('records', _records_port),
+              ('lazy', pycyperus._parse_list_module_port)),
+             (('one', _one_port), ('all', _all_port)))):
+        for access, use in uses:
+            for label, parse in parsers:
+                elapsed, size = _measure(parse, use, response)
+                print(f"{listing:<18}{label:<10}{access:<8}"
+                      f"{elapsed * 1e3:>10.2f}{size / 1024:>10.0f}")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,85 @@
+''' bench_roundtrip.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Compares p50/p99 round-trip latency of event-driven response wakeup
+# against the previous 1 ms sleep-polling wait.
+#
+#   python benchmarks/bench_roundtrip.py [iterations]
+
+import contextlib
+import io
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from pycyperus import pycyperus
+from responder import Responder
+
+PORT_RECEIVE = 27212
+PORT_SEND = 27211
+
+
+class _PollingClient(pycyperus._Client):
+    def _get_response_blocking(self, request_id, timeout=20):
+        timeout_count = 0
+        timeout *= 1000
+        pending = self.pending.get(request_id)
+        while pending.response is None and timeout_count < timeout:
+            time.sleep(0.001)
+            timeout_count += 1
+        self.pending.pop(request_id)
+        return pending.response
+
+
+def _quantile(samples, q):
+    return statistics.quantiles(samples, n=100)[q - 1]
+
+def _measure(call, iterations):
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return _quantile(samples, 50), _quantile(samples, 99)
+
+def main(iterations=2000):
+    responder = Responder(PORT_SEND, PORT_RECEIVE)
+    api = pycyperus.Api(PORT_RECEIVE, PORT_SEND)
+    results = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for label, client in (('poll', _PollingClient(PORT_SEND, api.pending)),
+                              ('event', api.client)):
+            results.append((label, 'list_bus', *_measure(
+                lambda: client.list_bus('', 3), iterations)))
+            results.append((label, 'add_connection', *_measure(
+                lambda: client.add_connection('out-0', 'in-0'), iterations)))
+    api.close()
+    responder.close()
+
+    print(f"{'wait':<8}{'call':<18}{'p50 us':>10}{'p99 us':>10}")
+    for label, name, p50, p99 in results:
+        print(f"{label:<8}{name:<18}{p50:>10.1f}{p99:>10.1f}")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
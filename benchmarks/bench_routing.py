@@ -0,0 +1,108 @@
+''' bench_routing.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Cycle checks on a layered signal graph of about 100k edges: modules of
+# two ins and two outs, each out connected to ins a few layers further
+# down.  Compares routing.SignalGraph's ordered check against a plain
+# breadth-first search, for connections that run down the layers (the
+# common case) and back up them (which would close a loop).
+#
+#   python benchmarks/bench_routing.py [edges]
+
+import collections
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pycyperus import routing
+
+LAYERS = 50
+QUERIES = 500
+
+
+def _bfs(successors, source, target):
+    seen = {source}
+    queue = collections.deque([source])
+    while queue:
+        for vertex in successors[queue.popleft()]:
+            if vertex == target:
+                return True
+            if vertex not in seen:
+                seen.add(vertex)
+                queue.append(vertex)
+    return False
+
+def _build(edges, seed=1):
+    rng = random.Random(seed)
+    graph = routing.SignalGraph()
+    # each module contributes 4 internal edges and 2 connections per out
+    modules = edges // 8
+    per_layer = max(1, modules // LAYERS)
+    layers = [[(f"m{layer}.{i}.in0", f"m{layer}.{i}.in1", f"m{layer}.{i}.out0",
+                f"m{layer}.{i}.out1") for i in range(per_layer)]
+              for layer in range(LAYERS)]
+    for layer in layers:
+        for in0, in1, out0, out1 in layer:
+            graph.add_module((in0, in1), (out0, out1))
+    connection = 0
+    for depth, layer in enumerate(layers[:-1]):
+        for module in layer:
+            for out in module[2:]:
+                for _ in range(2):
+                    below = layers[rng.randrange(depth + 1, min(depth + 4, LAYERS))]
+                    graph.add_connection(f"c{connection}", out,
+                                         rng.choice(rng.choice(below)[:2]))
+                    connection += 1
+    return graph, layers, rng
+
+def _time(check, pairs):
+    start = time.perf_counter()
+    for port_out, port_in in pairs:
+        check(port_out, port_in)
+    return (time.perf_counter() - start) / len(pairs)
+
+def main(edges=100000):
+    start = time.perf_counter()
+    graph, layers, rng = _build(edges)
+    build = time.perf_counter() - start
+
+    down = []
+    up = []
+    for _ in range(QUERIES):
+        upper, lower = sorted(rng.sample(range(LAYERS), 2))
+        high = rng.choice(layers[upper])
+        low = rng.choice(layers[lower])
+        down.append((rng.choice(high[2:]), rng.choice(low[:2])))
+        up.append((rng.choice(low[2:]), rng.choice(high[:2])))
+
+    successors = graph.successors
+    print(f"{graph.edges} edges, {len(successors)} ports, built in {build:.2f} s")
+    print(f"{'connection':<12}{'check':<10}{'us/check':>12}")
+    for label, pairs in (('downward', down), ('upward', up)):
+        for name, check in (('ordered', graph.would_cycle),
+                            ('bfs', lambda port_out, port_in:
+                             _bfs(successors, port_in, port_out))):
+            print(f"{label:<12}{name:<10}{_time(check, pairs) * 1e6:>12.1f}")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
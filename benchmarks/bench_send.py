@@ -0,0 +1,82 @@
+''' bench_send.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Single-thread send throughput of the request path: python-osc's
+# SimpleUDPClient with uuid4 request ids against _MessageEncoder with
+# compact counter ids.  Datagrams go to a bound socket nobody reads.
+#
+#   python benchmarks/bench_send.py [messages]
+
+import os
+import socket
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pythonosc import udp_client
+
+from pycyperus import pycyperus
+
+PORT_SINK = 27213
+
+CALLS = (
+    ('add_connection', "/cyperus/add/connection", ('out-0', 'in-0')),
+    ('list_bus', "/cyperus/list/bus", ('', 3, 'si')),
+    ('add_modules_oscillator_sine', "/cyperus/add/module/oscillator/sine",
+     ('bus-0', 440.0, 1.0, 0.0)),
+)
+
+
+def _python_osc(path, data, messages):
+    client = udp_client.SimpleUDPClient('127.0.0.1', PORT_SINK)
+    start = time.perf_counter()
+    for _ in range(messages):
+        client.send_message(path, (f"{uuid.uuid4()}",) + data)
+    elapsed = time.perf_counter() - start
+    size = len(pycyperus._MessageEncoder()._build(path, (f"{uuid.uuid4()}",) + data))
+    return messages / elapsed, size
+
+def _encoder(path, data, messages):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    address = ('127.0.0.1', PORT_SINK)
+    encoder = pycyperus._MessageEncoder()
+    start = time.perf_counter()
+    for _ in range(messages):
+        sock.sendto(encoder.encode(path, (pycyperus._next_request_id(),) + data),
+                    address)
+    elapsed = time.perf_counter() - start
+    size = len(encoder.encode(path, (pycyperus._next_request_id(),) + data))
+    return messages / elapsed, size
+
+def main(messages=200000):
+    sink = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink.bind(('127.0.0.1', PORT_SINK))
+
+    print(f"{'call':<30}{'sender':<14}{'msgs/s':>12}{'bytes':>8}")
+    for name, path, data in CALLS:
+        for label, run in (('python-osc', _python_osc), ('encoder', _encoder)):
+            rate, size = run(path, data, messages)
+            print(f"{name:<30}{label:<14}{rate:>12.0f}{size:>8}")
+    sink.close()
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
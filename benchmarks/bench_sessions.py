@@ -0,0 +1,60 @@
+''' bench_sessions.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Threads and file descriptors held by N Api sessions, each with its own
+# receive port against all sharing one receiver.
+#
+#   python benchmarks/bench_sessions.py [sessions]
+
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pycyperus import pycyperus
+
+PORT_RECEIVE = 27300
+PORT_SEND = 27211
+
+
+def _resources():
+    return threading.active_count(), len(os.listdir('/proc/self/fd'))
+
+def _run(sessions, shared):
+    threads, fds = _resources()
+    apis = [pycyperus.Api(PORT_RECEIVE if shared else PORT_RECEIVE + i,
+                          PORT_SEND,
+                          shared=shared)
+            for i in range(sessions)]
+    after_threads, after_fds = _resources()
+    for api in apis:
+        api.close()
+    return after_threads - threads, after_fds - fds
+
+def main(sessions=100):
+    print(f"{'receiver':<10}{'sessions':>9}{'threads':>9}{'fds':>6}")
+    for count in (1, 10, sessions):
+        for label, shared in (('own', False), ('shared', True)):
+            threads, fds = _run(count, shared)
+            print(f"{label:<10}{count:>9}{threads:>9}{fds:>6}")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
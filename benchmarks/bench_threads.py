@@ -0,0 +1,113 @@
+''' bench_threads.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Throughput of one Api shared by 1 to 32 caller threads, each making
+# blocking calls back to back: list_module_port reads, and a connection
+# added and removed between ports of its own, against an emulator in a
+# child process answering after 1 ms.  Every call's result is checked,
+# and the request table must be empty once the threads are done.
+#
+#   python benchmarks/bench_threads.py [calls per thread]
+
+import contextlib
+import io
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pycyperus import pycyperus
+
+PORT_RECEIVE = 27212
+PORT_SEND = 27211
+LATENCY = 0.001
+THREADS = (1, 2, 4, 8, 16, 32)
+
+
+def _caller(api, module_id, calls, latencies, errors):
+    ports = api.list_module_port(module_id)
+    port_out_id, port_in_id = ports['out'][0]['id'], ports['in'][0]['id']
+    for i in range(calls):
+        start = time.perf_counter()
+        try:
+            if i % 3 == 0:
+                listing = api.list_module_port(module_id)
+                if listing['out'][0]['id'] != port_out_id:
+                    raise AssertionError(f"{module_id} listed another module's ports")
+            elif i % 3 == 1:
+                connection_id = api.add_connection(port_out_id, port_in_id)
+            else:
+                api.remove_connection(connection_id)
+        except Exception as exc:
+            errors.append(exc)
+        latencies.append(time.perf_counter() - start)
+
+def _run(api, modules, threads, calls):
+    latencies = []
+    errors = []
+    workers = [threading.Thread(target=_caller,
+                                args=(api, modules[i], calls, latencies, errors))
+               for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    quantiles = statistics.quantiles(latencies, n=100)
+    return (len(latencies) / elapsed, quantiles[49], quantiles[98], len(errors),
+            api.pending_stats()['outstanding'])
+
+def main(calls=600):
+    root = os.path.join(os.path.dirname(__file__), '..')
+    server = subprocess.Popen([sys.executable, '-m', 'pycyperus.emulator',
+                               f"{PORT_SEND}", f"{PORT_RECEIVE}",
+                               '--latency', f"{LATENCY}"],
+                              cwd=root, stdout=subprocess.DEVNULL)
+    api = pycyperus.Api(PORT_RECEIVE, PORT_SEND, retransmit=True)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            # reads are retransmitted, so the first one waits out the emulator starting
+            api.list_main()
+            bus_id = api.add_bus('', 'threads', 'in_0', 'out_0')
+            with api.batch() as b:
+                for i in range(max(THREADS)):
+                    b.add_modules_envelope_follower(bus_id, 1.0, 1.0, 1.0 + i)
+            modules = b.results
+            results = [(threads, *_run(api, modules, threads, calls))
+                       for threads in THREADS]
+    finally:
+        api.close()
+        server.terminate()
+        server.wait()
+
+    print(f"{'threads':>8}{'calls/s':>10}{'scaling':>9}{'p50 us':>9}{'p99 us':>9}"
+          f"{'errors':>8}{'left':>6}")
+    base = results[0][1]
+    for threads, rate, p50, p99, errors, left in results:
+        print(f"{threads:>8}{rate:>10.0f}{rate / base:>9.1f}{p50 * 1e6:>9.0f}"
+              f"{p99 * 1e6:>9.0f}{errors:>8}{left:>6}")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
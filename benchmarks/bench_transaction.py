@@ -0,0 +1,111 @@
+''' bench_transaction.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# A patch change of `steps` connection adds and removes between the ports
+# of envelope followers, made call by call and as one transaction, over
+# an emulator answering after 1 ms; then the same transaction with its
+# last step failing, which undoes every other step.
+#
+#   python benchmarks/bench_transaction.py [steps]
+
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pycyperus import emulator
+from pycyperus import pycyperus
+
+PORT_RECEIVE = 27212
+PORT_SEND = 27211
+LATENCY = 0.001
+MODULES = 64
+
+
+def _steps(api, modules, steps, rng):
+    """Half adds, half removes of connections made beforehand"""
+    with api.batch() as b:
+        for module_id in modules:
+            b.list_module_port(module_id)
+    ports = b.results
+    pairs = [(rng.choice(ports)['out'][0]['id'], rng.choice(ports)['in'][0]['id'])
+             for _ in range(steps)]
+    with api.batch() as b:
+        for port_out_id, port_in_id in pairs[:steps // 2]:
+            b.add_connection(port_out_id, port_in_id)
+    return b.results, pairs[steps // 2:]
+
+def main(steps=50):
+    rng = random.Random(1)
+    with contextlib.redirect_stdout(io.StringIO()):
+        server = emulator.Emulator(PORT_SEND, PORT_RECEIVE, latency=LATENCY)
+        api = pycyperus.Api(PORT_RECEIVE, PORT_SEND)
+        main_id = api.add_bus('', 'main', 'in_0', 'out_0')
+        with api.batch() as b:
+            for i in range(MODULES):
+                b.add_modules_envelope_follower(main_id, 1.0, 1.0, 1.0 + i)
+        modules = b.results
+
+        removes, adds = _steps(api, modules, steps, rng)
+        start = time.perf_counter()
+        for connection_id in removes:
+            api.remove_connection(connection_id)
+        for port_out_id, port_in_id in adds:
+            api.add_connection(port_out_id, port_in_id)
+        sequential = time.perf_counter() - start
+
+        removes, adds = _steps(api, modules, steps, rng)
+        start = time.perf_counter()
+        with api.transaction() as t:
+            for connection_id in removes:
+                t.remove_connection(connection_id)
+            for port_out_id, port_in_id in adds:
+                t.add_connection(port_out_id, port_in_id)
+        committed = time.perf_counter() - start
+
+        removes, adds = _steps(api, modules, steps, rng)
+        live = len(server.connections)
+        start = time.perf_counter()
+        try:
+            with api.transaction() as t:
+                for connection_id in removes:
+                    t.remove_connection(connection_id)
+                for port_out_id, port_in_id in adds[:-1]:
+                    t.add_connection(port_out_id, port_in_id)
+                t.add_connection(adds[-1][0], 'missing')
+        except ExceptionGroup:
+            pass
+        rolled_back = time.perf_counter() - start
+        intact = len(server.connections) == live
+        api.close()
+        server.close()
+
+    print(f"{'change':<16}{'steps':>8}{'ms':>10}")
+    print(f"{'sequential':<16}{steps:>8}{sequential * 1e3:>10.1f}")
+    print(f"{'transaction':<16}{steps:>8}{committed * 1e3:>10.1f}")
+    print(f"{'rolled back':<16}{steps:>8}{rolled_back * 1e3:>10.1f}"
+          f"  ({len(t.client.undone)} undone, graph intact: {intact})")
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,72 @@
+''' responder.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+import itertools
+import random
+import threading
+
+from pythonosc.dispatcher import Dispatcher as OscDispatcher
+from pythonosc import osc_server
+from pythonosc import udp_client
+
+
+class Responder():
+    """Answers a handful of /cyperus paths with canned replies, enough to
+    drive round-trip benchmarks without a running cyperus-server.  A
+    fraction `loss` of the requests is dropped unanswered."""
+
+    def __init__(self, port_receive, port_send, loss=0.0, seed=1):
+        self.client = udp_client.SimpleUDPClient('127.0.0.1', port_send)
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.connection_ids = itertools.count(1)
+        self.dispatcher = OscDispatcher()
+        self.dispatcher.map('/cyperus/list/bus', self.osc_list_bus)
+        self.dispatcher.map('/cyperus/add/connection', self.osc_add_connection)
+        self.server = osc_server.BlockingOSCUDPServer(
+            ('127.0.0.1', port_receive), self.dispatcher)
+        self.server_thread = threading.Thread(
+            target=self.server.serve_forever,
+            daemon=True)
+        self.server_thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def osc_list_bus(self, path, request_id, bus_id, list_type, *args):
+        if self.random.random() < self.loss:
+            return
+        self.client.send_message(path, (request_id,
+                                        0,
+                                        0,
+                                        bus_id,
+                                        list_type,
+                                        '4f6c1d0e-8b2a-4c3e-9d5f-0a1b2c3d4e5f|main|2|2\n'))
+
+    def osc_add_connection(self, path, request_id, port_out_id, port_in_id, *args):
+        if self.random.random() < self.loss:
+            return
+        self.client.send_message(path, (request_id,
+                                        0,
+                                        0,
+                                        port_out_id,
+                                        port_in_id,
+                                        f"{next(self.connection_ids)}"))
@@ -0,0 +1,321 @@
+''' soak.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Drives one Api with a weighted mix of list, add and remove calls at a
+# fixed request rate for a set duration, recording throughput, latency
+# percentiles, resident memory and thread count every --interval seconds:
+#
+#   python benchmarks/soak.py --duration 3600 --rate 500 --output soak.json
+#   python benchmarks/soak.py --mix list=8,add=1,remove=1 --no-emulator
+#
+# By default the emulator runs in a child process so the memory figures
+# are the client's alone; with --no-emulator the calls go to whatever
+# server is listening on --host.  Adds create connections and removes
+# delete them again, so the graph and the cost of listing it stay level
+# over the run.  The summary compares the first and last intervals; with
+# --max-rss-growth or --max-p99-growth set, exceeding either exits 1.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pycyperus import pycyperus
+
+PORT_RECEIVE = 27212
+PORT_SEND = 27211
+
+OPERATIONS = ('list', 'add', 'remove')
+
+
+def _rss():
+    """Resident set size in bytes, or the peak where /proc is missing"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+def _mix(text):
+    weights = {}
+    for item in text.split(','):
+        operation, _, weight = item.partition('=')
+        if operation not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation '{operation}'")
+        weights[operation] = float(weight or 1)
+    return weights
+
+def _percentiles(samples):
+    if not samples:
+        return 0.0, 0.0, 0.0
+    if len(samples) == 1:
+        return samples[0], samples[0], samples[0]
+    quantiles = statistics.quantiles(samples, n=100)
+    return quantiles[49], quantiles[98], max(samples)
+
+def _spawn_emulator(args):
+    root = os.path.join(os.path.dirname(__file__), '..')
+    return subprocess.Popen([sys.executable, '-m', 'pycyperus.emulator',
+                             f"{args.port_send}", f"{args.port_receive}",
+                             '--host', args.host],
+                            cwd=root)
+
+
+class _Workload():
+    """A bus with two modules whose ports are connected and disconnected
+    by the add and remove operations"""
+
+    def __init__(self, api, seed):
+        self.api = api
+        self.random = random.Random(seed)
+        self.bus = api.add_bus('', f"soak_{os.getpid()}", 'in_0', 'out_0')
+        self.modules = [api.add_modules_oscillator_sine(self.bus, 440.0, 1.0, 0.0),
+                        api.add_modules_envelope_follower(self.bus, 1.0, 1.0, 1.0)]
+        self.port_out = api.list_module_port(self.modules[0])['out'][0]['id']
+        self.port_in = api.list_module_port(self.modules[1])['in'][0]['id']
+        self.connections = []
+        self.lists = (
+            lambda: api.list_main(),
+            lambda: api.list_bus_port(self.bus),
+            lambda: api.list_module(self.bus),
+            lambda: api.list_module_port(self.random.choice(self.modules)),
+        )
+
+    def run(self, operation):
+        if operation == 'remove' and not self.connections:
+            operation = 'add'
+        if operation == 'list':
+            self.random.choice(self.lists)()
+        elif operation == 'add':
+            self.connections.append(self.api.add_connection(self.port_out, self.port_in))
+        else:
+            self.api.remove_connection(
+                self.connections.pop(self.random.randrange(len(self.connections))))
+        return operation
+
+    def close(self):
+        for connection_id in self.connections:
+            self.api.remove_connection(connection_id)
+        self.connections = []
+
+
+def _interval(start, end, counts, samples, errors, lag, api):
+    p50, p99, worst = _percentiles(samples)
+    return {
+        'time': end,
+        'elapsed': end - start,
+        'requests': sum(counts.values()),
+        'operations': dict(counts),
+        'errors': dict(errors),
+        'late': lag,
+        'p50_us': p50 * 1e6,
+        'p99_us': p99 * 1e6,
+        'max_us': worst * 1e6,
+        'rss_bytes': _rss(),
+        'threads': threading.active_count(),
+        'outstanding': api.pending_stats()['outstanding'],
+    }
+
+def soak(api, workload, duration, rate, mix, interval, seed=1):
+    """Runs the workload open loop: call i is due at i / rate seconds and
+    is issued late, not skipped, when earlier calls overran.  Returns
+    (intervals, latencies)."""
+    choose = random.Random(seed)
+    operations = list(mix)
+    weights = [mix[operation] for operation in operations]
+    period = 1.0 / rate
+    intervals = []
+    latencies = []
+
+    start = time.perf_counter()
+    window_start = start
+    counts = dict.fromkeys(OPERATIONS, 0)
+    samples = []
+    errors = {}
+    lag = 0
+    due = start
+    while True:
+        now = time.perf_counter()
+        if now - start >= duration:
+            break
+        if now >= window_start + interval:
+            intervals.append(_interval(start, now, counts, samples, errors, lag, api))
+            latencies.extend(samples)
+            window_start = now
+            counts = dict.fromkeys(OPERATIONS, 0)
+            samples = []
+            errors = {}
+            lag = 0
+        if due > now:
+            time.sleep(due - now)
+        elif now - due > period:
+            lag += 1
+        due += period
+
+        begin = time.perf_counter()
+        try:
+            operation = workload.run(choose.choices(operations, weights)[0])
+        except Exception as exception:
+            if isinstance(exception, ExceptionGroup):
+                exception = exception.exceptions[0]
+            name = type(exception).__name__
+            errors[name] = errors.get(name, 0) + 1
+            continue
+        samples.append(time.perf_counter() - begin)
+        counts[operation] += 1
+
+    now = time.perf_counter()
+    if samples or errors or not intervals:
+        intervals.append(_interval(start, now, counts, samples, errors, lag, api))
+        latencies.extend(samples)
+    return intervals, latencies
+
+def _summary(intervals, latencies, duration):
+    first, last = intervals[0], intervals[-1]
+    p50, p99, worst = _percentiles(latencies)
+    errors = {}
+    for interval in intervals:
+        for name, count in interval['errors'].items():
+            errors[name] = errors.get(name, 0) + count
+    requests = sum(interval['requests'] for interval in intervals)
+    return {
+        'requests': requests,
+        'errors': errors,
+        'late': sum(interval['late'] for interval in intervals),
+        'requests_per_second': requests / duration,
+        'p50_us': p50 * 1e6,
+        'p99_us': p99 * 1e6,
+        'max_us': worst * 1e6,
+        'first_p99_us': first['p99_us'],
+        'last_p99_us': last['p99_us'],
+        'p99_growth': last['p99_us'] / first['p99_us'] - 1 if first['p99_us'] else 0.0,
+        'rss_first_bytes': first['rss_bytes'],
+        'rss_last_bytes': last['rss_bytes'],
+        'rss_growth_bytes': last['rss_bytes'] - first['rss_bytes'],
+        'rss_peak_bytes': max(interval['rss_bytes'] for interval in intervals),
+        'threads_first': first['threads'],
+        'threads_last': last['threads'],
+        'threads_peak': max(interval['threads'] for interval in intervals),
+        'outstanding_last': last['outstanding'],
+    }
+
+def _failures(summary, max_rss_growth, max_p99_growth):
+    if max_rss_growth is not None and summary['rss_growth_bytes'] > max_rss_growth * 2 ** 20:
+        yield f"rss grew {summary['rss_growth_bytes'] / 2 ** 20:.1f} MiB"
+    if max_p99_growth is not None and summary['p99_growth'] > max_p99_growth:
+        yield f"p99 grew {summary['p99_growth']:+.0%}"
+    if summary['threads_last'] > summary['threads_first']:
+        yield f"threads grew from {summary['threads_first']} to {summary['threads_last']}"
+
+def main():
+    parser = argparse.ArgumentParser(description='pycyperus soak test')
+    parser.add_argument('--duration', type=float, default=60.0)
+    parser.add_argument('--rate', type=float, default=200.0)
+    parser.add_argument('--mix', type=_mix, default='list=6,add=2,remove=2')
+    parser.add_argument('--interval', type=float, default=5.0)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port-receive', type=int, default=PORT_RECEIVE)
+    parser.add_argument('--port-send', type=int, default=PORT_SEND)
+    parser.add_argument('--no-emulator', dest='emulator', action='store_false')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output')
+    parser.add_argument('--max-rss-growth', type=float, help='MiB')
+    parser.add_argument('--max-p99-growth', type=float, help='fraction, e.g. 0.5')
+    args = parser.parse_args()
+
+    server = _spawn_emulator(args) if args.emulator else None
+    api = pycyperus.Api(args.port_receive, args.port_send, retransmit=True, host=args.host)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            # reads are retransmitted, so the first one waits out the emulator starting
+            api.list_main()
+            workload = _Workload(api, args.seed)
+            intervals, latencies = soak(api, workload, args.duration, args.rate, args.mix,
+                                        args.interval, args.seed)
+            workload.close()
+    finally:
+        api.close()
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print(f"{'elapsed s':>10}{'req/s':>10}{'p50 us':>10}{'p99 us':>10}"
+          f"{'max us':>10}{'rss MiB':>10}{'threads':>9}{'errors':>8}")
+    previous = 0.0
+    for interval in intervals:
+        print(f"{interval['elapsed']:>10.1f}"
+              f"{interval['requests'] / (interval['elapsed'] - previous):>10.0f}"
+              f"{interval['p50_us']:>10.1f}{interval['p99_us']:>10.1f}"
+              f"{interval['max_us']:>10.1f}{interval['rss_bytes'] / 2 ** 20:>10.1f}"
+              f"{interval['threads']:>9}{sum(interval['errors'].values()):>8}")
+        previous = interval['elapsed']
+
+    summary = _summary(intervals, latencies, intervals[-1]['elapsed'])
+    print()
+    print(f"requests     {summary['requests']} at {summary['requests_per_second']:.0f}/s "
+          f"(target {args.rate:.0f}/s, {summary['late']} late)")
+    print(f"errors       {summary['errors'] or 'none'}")
+    print(f"latency us   p50 {summary['p50_us']:.1f}  p99 {summary['p99_us']:.1f}  "
+          f"max {summary['max_us']:.1f}  p99 first/last interval "
+          f"{summary['first_p99_us']:.1f}/{summary['last_p99_us']:.1f}")
+    print(f"rss MiB      {summary['rss_first_bytes'] / 2 ** 20:.1f} -> "
+          f"{summary['rss_last_bytes'] / 2 ** 20:.1f} "
+          f"(peak {summary['rss_peak_bytes'] / 2 ** 20:.1f})")
+    print(f"threads      {summary['threads_first']} -> {summary['threads_last']} "
+          f"(peak {summary['threads_peak']})")
+    print(f"outstanding  {summary['outstanding_last']}")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({
+                'meta': {
+                    'time': time.time(),
+                    'python': platform.python_version(),
+                    'platform': platform.platform(),
+                    'duration': args.duration,
+                    'rate': args.rate,
+                    'mix': args.mix,
+                    'interval': args.interval,
+                    'emulator': args.emulator,
+                },
+                'summary': summary,
+                'intervals': intervals,
+            }, output, indent=2)
+
+    failures = list(_failures(summary, args.max_rss_growth, args.max_p99_growth))
+    for failure in failures:
+        print(f"unstable: {failure}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
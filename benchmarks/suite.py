@@ -0,0 +1,226 @@
+''' suite.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Throughput and latency of every Api method against the emulator, one
+# call at a time and pipelined through batches, written as JSON so runs
+# can be compared:
+#
+#   python benchmarks/suite.py --output results.json
+#   python benchmarks/suite.py --baseline results.json --tolerance 0.2
+#
+# Pipelined latencies are those of a whole batch of --depth calls.  With
+# --loss, reads are retransmitted and blocking mutations are sent under
+# idempotency keys the emulator deduplicates; batches can't key their
+# calls, so pipelined mutations are left out.  With a baseline, methods
+# whose calls per second dropped by more than the tolerance are listed
+# and the exit status is 1.
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pycyperus import emulator
+from pycyperus import pycyperus
+from pycyperus.retransmit import READ_ONLY_PATHS
+
+PORT_RECEIVE = 27212
+PORT_SEND = 27211
+
+METHODS = (
+    'list_main',
+    'list_osc_client',
+    'add_osc_client',
+    'list_bus',
+    'list_bus_port',
+    'add_bus',
+    'add_connection',
+    'remove_connection',
+    'list_module',
+    'list_module_port',
+    'get_system_env_variable',
+    'add_modules_oscillator_sine',
+    'add_modules_envelope_follower',
+)
+
+READ_METHODS = ('list_main', 'list_osc_client', 'list_bus', 'list_bus_port',
+                'list_module', 'list_module_port', 'get_system_env_variable')
+
+
+def _fixture(api):
+    """A main bus with four sub-buses holding two modules each, built
+    under idempotency keys so it survives a lossy link"""
+    main = api.idempotent('fixture-main').add_bus('', 'main', 'in_0,in_1', 'out_0,out_1')
+    buses = [api.idempotent(f"fixture-bus-{i}").add_bus(main, f"bus_{i}", 'in_0', 'out_0')
+             for i in range(4)]
+    modules = []
+    for i, bus_id in enumerate(buses):
+        modules.append(api.idempotent(f"fixture-sine-{i}").add_modules_oscillator_sine(
+            bus_id, 440.0, 1.0, 0.0))
+        modules.append(api.idempotent(f"fixture-follower-{i}").add_modules_envelope_follower(
+            bus_id, 1.0, 1.0, 1.0))
+    return main, buses, modules
+
+def _cases(api, server, calls):
+    main, buses, modules = _fixture(api)
+    port_out = api.list_module_port(modules[0])['out'][0]['id']
+    port_in = api.list_bus_port(buses[0])['out'][0]['id']
+    connection_ids = []
+    for _ in range(calls):
+        connection_id = f"connection-{len(server.connections)}"
+        server.connections[connection_id] = (port_out, port_in)
+        connection_ids.append(connection_id)
+    return {
+        'list_main': lambda i: (),
+        'list_osc_client': lambda i: (),
+        'add_osc_client': lambda i: ('127.0.0.1', 9000 + i % 1000, False),
+        'list_bus': lambda i: (None, 'ALL_DESCENDANTS'),
+        'list_bus_port': lambda i: (buses[i % len(buses)],),
+        'add_bus': lambda i: (main, f"added_{i}", 'in_0', 'out_0'),
+        'add_connection': lambda i: (port_out, port_in),
+        'remove_connection': lambda i: (connection_ids[i],),
+        'list_module': lambda i: (buses[i % len(buses)],),
+        'list_module_port': lambda i: (modules[i % len(modules)],),
+        'get_system_env_variable': lambda i: ('CYPERUS_VERSION',),
+        'add_modules_oscillator_sine': lambda i: (buses[i % len(buses)], 440.0, 1.0, 0.0),
+        'add_modules_envelope_follower': lambda i: (buses[i % len(buses)], 1.0, 1.0, 1.0),
+    }
+
+def _summary(method, mode, calls, elapsed, samples):
+    quantiles = statistics.quantiles(samples, n=100) if len(samples) > 1 else samples * 99
+    return {
+        'method': method,
+        'mode': mode,
+        'calls': calls,
+        'seconds': elapsed,
+        'calls_per_second': calls / elapsed,
+        'p50_us': quantiles[49] * 1e6,
+        'p99_us': quantiles[98] * 1e6,
+    }
+
+def _blocking(api, method, arguments, calls, keyed=False):
+    samples = []
+    start = time.perf_counter()
+    for i in range(calls):
+        call = getattr(api.idempotent(f"{method}-{i}") if keyed else api, method)
+        begin = time.perf_counter()
+        call(*arguments(i))
+        samples.append(time.perf_counter() - begin)
+    return _summary(method, 'blocking', calls, time.perf_counter() - start, samples)
+
+def _pipelined(api, method, arguments, calls, depth):
+    samples = []
+    start = time.perf_counter()
+    for window in range(0, calls, depth):
+        begin = time.perf_counter()
+        with api.batch() as batch:
+            call = getattr(batch, method)
+            for i in range(window, min(window + depth, calls)):
+                call(*arguments(i))
+        samples.append(time.perf_counter() - begin)
+    return _summary(method, f"pipelined/{depth}", calls, time.perf_counter() - start, samples)
+
+def _measure(method, mode, calls, depth, latency, jitter, loss):
+    server = emulator.Emulator(PORT_SEND, PORT_RECEIVE,
+                               latency=latency, jitter=jitter, loss=loss, seed=1,
+                               deduplicate=True)
+    api = pycyperus.Api(PORT_RECEIVE, PORT_SEND, retransmit=bool(loss))
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            keyed = loss and f"/cyperus/{method}" not in READ_ONLY_PATHS
+            arguments = _cases(api, server, calls)[method]
+            if mode == 'blocking':
+                return _blocking(api, method, arguments, calls, keyed)
+            return _pipelined(api, method, arguments, calls, depth)
+    finally:
+        api.close()
+        server.close()
+
+def run(calls=1000, depth=32, latency=0.0, jitter=0.0, loss=0.0):
+    """Measures every method in every mode, each against a fresh emulator"""
+    return [_measure(method, mode, calls, depth, latency, jitter, loss)
+            for mode in ('blocking', 'pipelined')
+            for method in METHODS
+            if mode == 'blocking' or not loss or method in READ_METHODS]
+
+def _regressions(results, baseline, tolerance):
+    previous = {(result['method'], result['mode']): result
+                for result in baseline['results']}
+    for result in results:
+        before = previous.get((result['method'], result['mode']))
+        if before is None:
+            continue
+        change = result['calls_per_second'] / before['calls_per_second'] - 1
+        if change < -tolerance:
+            yield result, change
+
+def main():
+    parser = argparse.ArgumentParser(description='pycyperus benchmark suite')
+    parser.add_argument('--calls', type=int, default=1000)
+    parser.add_argument('--depth', type=int, default=32)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--loss', type=float, default=0.0)
+    parser.add_argument('--output')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = run(args.calls, args.depth, args.latency, args.jitter, args.loss)
+    report = {
+        'meta': {
+            'time': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'calls': args.calls,
+            'depth': args.depth,
+            'latency': args.latency,
+            'jitter': args.jitter,
+            'loss': args.loss,
+        },
+        'results': results,
+    }
+
+    print(f"{'method':<32}{'mode':<14}{'calls/s':>10}{'p50 us':>10}{'p99 us':>10}")
+    for result in results:
+        print(f"{result['method']:<32}{result['mode']:<14}"
+              f"{result['calls_per_second']:>10.0f}"
+              f"{result['p50_us']:>10.1f}{result['p99_us']:>10.1f}")
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline:
+            regressions = list(_regressions(results, json.load(baseline), args.tolerance))
+        for result, change in regressions:
+            print(f"regression: {result['method']} {result['mode']} {change:+.0%}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,251 @@
+''' aio.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+import asyncio
+import socket
+
+from pythonosc import osc_message
+
+from pycyperus import exceptions
+from pycyperus import pycyperus
+
+
+class _ClientProtocol(asyncio.DatagramProtocol):
+    """Resolves each request's future once its parts assemble into a
+    response that checks out, as _Server does for the threaded client"""
+
+    def __init__(self, pending):
+        self.pending = pending
+        self.parts = {}
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            message = osc_message.OscMessage(data)
+        except osc_message.ParseError:
+            return
+        params = message.params
+        if len(params) < 3 or params[0] not in self.pending:
+            return
+        request_id = params[0]
+        collected = self.parts.get(request_id)
+        if collected is None:
+            return
+        response = collected.add_part(tuple(params[1:]))
+        if response is None:
+            if not params[2]:
+                # the final part is in but the response is missing some
+                asyncio.get_running_loop().call_later(
+                    pycyperus.REORDER_WINDOW, self._give_up, request_id, collected)
+            return
+        if response is not False:
+            self._resolve(request_id, response)
+
+    def _give_up(self, request_id, collected):
+        if collected.response is None and self.parts.get(request_id) is collected:
+            self._resolve(request_id, None, pycyperus._malformed(collected.path))
+
+    def _resolve(self, request_id, response, error=None):
+        del self.parts[request_id]
+        future = self.pending.pop(request_id)
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(response)
+
+    def connection_lost(self, exc):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc or ConnectionError("endpoint closed"))
+        self.pending.clear()
+        self.parts.clear()
+
+
+class _AsyncClient():
+    def __init__(self, protocol, port, timeout=20, host='127.0.0.1'):
+        self.protocol = protocol
+        self.address = (host, port)
+        self.timeout = timeout
+        self.pending = protocol.pending
+        self.encoder = pycyperus._MessageEncoder()
+
+    def _request(self, path, *data):
+        request_id = pycyperus._next_request_id()
+        future = asyncio.get_running_loop().create_future()
+        self.pending[request_id] = future
+        self.protocol.parts[request_id] = pycyperus._PendingRequest(path)
+        self.protocol.transport.sendto(
+            self.encoder.encode(path, (request_id,) + data), self.address)
+        return request_id, future
+
+    async def _call(self, parser, path, *data):
+        request_id, future = self._request(path, *data)
+        try:
+            response = await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            raise exceptions.ResponseTimeout(
+                f"no response to request {request_id}") from None
+        finally:
+            self.pending.pop(request_id, None)
+            self.protocol.parts.pop(request_id, None)
+        return pycyperus._parse(parser, response, path)
+
+    async def list_osc_client(self):
+        return await self._call(pycyperus._parse_list_osc_client,
+                                "/cyperus/list/osc/client")
+
+    async def add_osc_client(self, ip, port, listener_enable):
+        return await self._call(pycyperus._parse_add_osc_client,
+                                "/cyperus/add/osc/client",
+                                ip,
+                                port,
+                                listener_enable,
+                                "ssb")
+
+    async def list_main(self):
+        return await self._call(pycyperus._parse_list_main,
+                                "/cyperus/list/main")
+
+    async def list_bus(self, bus_id, list_type):
+        return await self._call(pycyperus._parse_list_bus,
+                                "/cyperus/list/bus",
+                                bus_id,
+                                list_type,
+                                'si')
+
+    async def list_bus_port(self, bus_id):
+        return await self._call(pycyperus._parse_list_bus_port,
+                                "/cyperus/list/bus_port",
+                                bus_id,
+                                's')
+
+    async def add_bus(self, bus_id, name, in_names, out_names):
+        return await self._call(pycyperus._parse_add_bus,
+                                "/cyperus/add/bus",
+                                bus_id,
+                                name,
+                                in_names,
+                                out_names)
+
+    async def add_connection(self, port_id_out, port_id_in):
+        return await self._call(pycyperus._parse_add_connection,
+                                "/cyperus/add/connection",
+                                port_id_out,
+                                port_id_in)
+
+    async def remove_connection(self, connection_id):
+        return await self._call(pycyperus._parse_remove_connection,
+                                "/cyperus/remove/connection",
+                                connection_id)
+
+    async def list_module(self, bus_id):
+        return await self._call(pycyperus._parse_list_module,
+                                "/cyperus/list/module",
+                                bus_id,
+                                's')
+
+    async def list_module_port(self, module_id):
+        return await self._call(pycyperus._parse_list_module_port,
+                                "/cyperus/list/module_port",
+                                module_id,
+                                's')
+
+    async def get_system_env_variable(self, var_name):
+        return await self._call(pycyperus._parse_get_system_env_variable,
+                                "/cyperus/get/system/env_variable",
+                                var_name)
+
+    async def add_modules_oscillator_sine(self,
+                                          bus_id,
+                                          frequency,
+                                          amplitude,
+                                          phase):
+        return await self._call(pycyperus._parse_add_module,
+                                "/cyperus/add/module/oscillator/sine",
+                                bus_id,
+                                float(frequency),
+                                float(amplitude),
+                                float(phase))
+
+    async def add_modules_envelope_follower(self,
+                                            bus_id,
+                                            attack,
+                                            decay,
+                                            scale):
+        return await self._call(pycyperus._parse_add_module,
+                                "/cyperus/add/module/envelope/follower",
+                                bus_id,
+                                float(attack),
+                                float(decay),
+                                float(scale))
+
+
+class AsyncApi(pycyperus._ApiBase):
+    """asyncio counterpart of Api; every method returns an awaitable.
+
+    Requests and responses share one datagram endpoint bound to
+    port_receive, and each request id resolves its own future, so any
+    number of calls can be in flight from a single event loop:
+
+        async with AsyncApi(port_receive, port_send) as api:
+            buses, mains = await asyncio.gather(api.list_bus(None, 'ALL_DESCENDANTS'),
+                                                api.list_main())
+    """
+
+    def __init__(self,
+                 port_receive,
+                 port_send,
+                 timeout=20,
+                 host='127.0.0.1',
+                 bind_host='127.0.0.1'):
+        self.port_receive = port_receive
+        self.port_send = port_send
+        self.timeout = timeout
+        self.host = host
+        self.bind_host = bind_host
+        self.transport = None
+        self.client = None
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        self.transport, protocol = await loop.create_datagram_endpoint(
+            lambda: _ClientProtocol({}),
+            local_addr=(self.bind_host, self.port_receive))
+        # room for the answers to a gathered burst, as _Server has
+        self.transport.get_extra_info('socket').setsockopt(
+            socket.SOL_SOCKET, socket.SO_RCVBUF, pycyperus.RECEIVE_BUFFER)
+        self.client = _AsyncClient(protocol, self.port_send, self.timeout, self.host)
+        return self
+
+    def close(self):
+        if self.transport:
+            self.transport.close()
+            self.transport = None
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.close()
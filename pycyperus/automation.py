@@ -0,0 +1,211 @@
+''' automation.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Fire-and-forget module parameter updates.  Each automated parameter is
+# a channel holding only its newest value: updates made faster than the
+# channel's rate replace the one waiting to go out (and are counted as
+# dropped), and a sender thread writes each module's due channels in a
+# single edit message.  The server's acknowledgements are not awaited.
+
+import threading
+import time
+
+from pycyperus import exceptions
+from pycyperus import pycyperus
+from pycyperus import reconcile
+
+# edit requests take the module id followed by the same parameters as
+# the matching add request
+EDIT_PATHS = {
+    'oscillator_sine': "/cyperus/edit/module/oscillator/sine",
+    'envelope_follower': "/cyperus/edit/module/envelope/follower",
+}
+
+
+class _Channel():
+    __slots__ = ('value', 'current', 'next_send', 'updates', 'sent', 'dropped')
+
+    def __init__(self, value):
+        self.value = value
+        self.current = value
+        self.next_send = 0.0
+        self.updates = 0
+        self.sent = 0
+        self.dropped = 0
+
+
+class _Module():
+    def __init__(self, path, channels):
+        self.path = path
+        self.channels = channels
+
+
+class Automation():
+    """Streams parameter changes for registered modules, at most `rate`
+    messages per second per parameter.
+
+        automation = api.automation(rate=200)
+        automation.add('oscillator_sine', module_id,
+                       frequency=440.0, amplitude=1.0, phase=0.0)
+        automation.set(module_id, 'frequency', 442.5)
+    """
+
+    def __init__(self, client, rate=100):
+        if not rate > 0:
+            raise ExceptionGroup(
+                f"Invalid rate '{rate}', must be greater than 0",
+                [
+                    exceptions.InvalidRate(),
+                    exceptions.ApiException()
+                ]
+            )
+        self.client = client
+        self.interval = 1 / rate
+        self.condition = threading.Condition()
+        self.modules = {}
+        self.dirty = {}
+        self.running = True
+        self.sender_thread = threading.Thread(target=self._run, daemon=True)
+        self.sender_thread.start()
+
+    def add(self, module_type, module_id, **values):
+        """Registers a module with the values its parameters have now"""
+        if module_type not in EDIT_PATHS:
+            raise ExceptionGroup(
+                f"Unknown module type '{module_type}', must be one of: "
+                f"{list(EDIT_PATHS.keys())}",
+                [
+                    exceptions.InvalidModuleType(),
+                    exceptions.ApiException()
+                ]
+            )
+        channels = {}
+        for parameter in reconcile.MODULE_TYPES[module_type][1]:
+            if values.get(parameter) is None:
+                raise ExceptionGroup(
+                    f"Missing value for parameter '{parameter}'",
+                    [
+                        exceptions.MissingModuleParameterValue(),
+                        exceptions.ApiException()
+                    ]
+                )
+            channels[parameter] = _Channel(float(values[parameter]))
+        with self.condition:
+            self.modules[module_id] = _Module(EDIT_PATHS[module_type], channels)
+
+    def remove(self, module_id):
+        with self.condition:
+            self.modules.pop(module_id, None)
+            for key in [key for key in self.dirty if key[0] == module_id]:
+                del self.dirty[key]
+
+    def set(self, module_id, parameter, value):
+        if value is None:
+            raise ExceptionGroup(
+                f"Missing value for parameter '{parameter}'",
+                [
+                    exceptions.MissingModuleParameterValue(),
+                    exceptions.ApiException()
+                ]
+            )
+        value = float(value)
+        with self.condition:
+            module = self.modules.get(module_id)
+            channel = module.channels.get(parameter) if module is not None else None
+            if channel is None:
+                raise ExceptionGroup(
+                    f"Parameter '{parameter}' of module '{module_id}' is not automated",
+                    [
+                        exceptions.UnknownModuleParameter(),
+                        exceptions.ApiException()
+                    ]
+                )
+            channel.updates += 1
+            channel.value = value
+            key = (module_id, parameter)
+            if key in self.dirty:
+                channel.dropped += 1
+            else:
+                self.dirty[key] = channel
+                self.condition.notify()
+
+    def update(self, module_id, **values):
+        for parameter, value in values.items():
+            self.set(module_id, parameter, value)
+
+    def _due(self, now):
+        """Takes the due channels off the dirty list; returns the edit
+        messages to send and when the next channel falls due"""
+        due = set()
+        wake = None
+        for key, channel in list(self.dirty.items()):
+            if channel.next_send <= now or not self.running:
+                channel.current = channel.value
+                channel.next_send = now + self.interval
+                channel.sent += 1
+                due.add(key[0])
+                del self.dirty[key]
+            elif wake is None or channel.next_send < wake:
+                wake = channel.next_send
+        messages = []
+        for module_id in due:
+            module = self.modules[module_id]
+            messages.append((module.path,
+                             (module_id,) + tuple(channel.current for channel
+                                                  in module.channels.values())))
+        return messages, wake
+
+    def _run(self):
+        sock = self.client.sock
+        encoder = self.client.encoder
+        address = self.client.address
+        while True:
+            with self.condition:
+                while True:
+                    now = time.monotonic()
+                    messages, wake = self._due(now)
+                    if messages or not self.running:
+                        break
+                    self.condition.wait(None if wake is None else wake - now)
+            for path, data in messages:
+                try:
+                    sock.sendto(encoder.encode(path, (pycyperus._next_request_id(),) + data),
+                                address)
+                except OSError:
+                    pass
+            if not messages:
+                return
+
+    def stats(self):
+        """{(module id, parameter): {'updates', 'sent', 'dropped', 'value'}}"""
+        with self.condition:
+            return {(module_id, parameter): {'updates': channel.updates,
+                                             'sent': channel.sent,
+                                             'dropped': channel.dropped,
+                                             'value': channel.current}
+                    for module_id, module in self.modules.items()
+                    for parameter, channel in module.channels.items()}
+
+    def close(self):
+        """Sends whatever is still pending and stops the sender"""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.sender_thread.join()
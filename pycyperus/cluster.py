@@ -0,0 +1,142 @@
+''' cluster.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+import collections
+import concurrent.futures
+import itertools
+import time
+import zlib
+
+from pycyperus import pycyperus
+
+# result is None and error holds the exception when a node's call failed;
+# latency is the node's wall time in seconds either way
+NodeResult = collections.namedtuple('NodeResult', ('node', 'result', 'error', 'latency'))
+
+
+class Cluster():
+    """One Api session per cyperus-server node, all receiving on a shared
+    port, with calls fanned out to every node at once.  nodes maps a name
+    to the (host, port) the node's server listens on; each server has to
+    send its responses to port_receive on bind_host.
+
+        with Cluster({'node-a': ('10.0.0.11', port_send),
+                      'node-b': ('10.0.0.12', port_send)},
+                     port_receive, bind_host='0.0.0.0') as cluster:
+            cluster.map(lambda api: api.reconcile(patch))
+            bus_lists = cluster.broadcast('list_bus', None, 'ALL_DESCENDANTS')
+
+    map(), broadcast() and shard() return {name: NodeResult} once every
+    node has finished; unless raise_errors is False, failures are then
+    raised together as an ExceptionGroup with a note naming each node."""
+
+    def __init__(self, nodes, port_receive, bind_host='127.0.0.1', **kwargs):
+        self.apis = {}
+        try:
+            for name, (host, port_send) in nodes.items():
+                self.apis[name] = pycyperus.Api(port_receive,
+                                                port_send,
+                                                shared=True,
+                                                host=host,
+                                                bind_host=bind_host,
+                                                **kwargs)
+        except BaseException:
+            self.close()
+            raise
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(len(self.apis), 1),
+            thread_name_prefix='pycyperus-cluster')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self):
+        return len(self.apis)
+
+    def close(self):
+        executor = getattr(self, 'executor', None)
+        if executor is not None:
+            executor.shutdown()
+        for api in self.apis.values():
+            api.close()
+
+    def _timed(self, name, function, *args):
+        start = time.perf_counter()
+        try:
+            result = function(self.apis[name], *args)
+        except Exception as exc:
+            exc.add_note(f"on node {name}")
+            return NodeResult(name, None, exc, time.perf_counter() - start)
+        return NodeResult(name, result, None, time.perf_counter() - start)
+
+    def _run(self, jobs, raise_errors):
+        futures = [self.executor.submit(self._timed, name, function, *args)
+                   for name, function, args in jobs]
+        results = {}
+        for future in futures:
+            result = future.result()
+            results[result.node] = result
+        failed = [result.error for result in results.values() if result.error is not None]
+        if failed and raise_errors:
+            raise ExceptionGroup(f"{len(failed)} of {len(results)} nodes failed", failed)
+        return results
+
+    def map(self, function, nodes=None, raise_errors=True):
+        """Calls function(api) for every node (or the named ones) in
+        parallel"""
+        names = self.apis if nodes is None else nodes
+        return self._run([(name, function, ()) for name in names], raise_errors)
+
+    def broadcast(self, method, *args, raise_errors=True, **kwargs):
+        """Makes the same Api call on every node"""
+        return self.map(lambda api: getattr(api, method)(*args, **kwargs),
+                        raise_errors=raise_errors)
+
+    def shard(self, method, calls, key=None, raise_errors=True):
+        """Spreads calls, a sequence of argument tuples for one Api method,
+        over the nodes, round robin or by a stable hash of key(args), and
+        pipelines each node's share as a batch.  A node's result is the
+        list of (index into calls, result or exception) for its share."""
+        names = list(self.apis)
+        shares = {name: [] for name in names}
+        counter = itertools.count()
+        for index, args in enumerate(calls):
+            if key is None:
+                name = names[next(counter) % len(names)]
+            else:
+                name = names[zlib.crc32(f"{key(args)}".encode()) % len(names)]
+            shares[name].append((index, args))
+
+        def run(api, share):
+            with api.batch(raise_errors=False) as batch:
+                for index, args in share:
+                    getattr(batch, method)(*args)
+            return [(index, result) for (index, args), result
+                    in zip(share, batch.results)]
+
+        return self._run([(name, run, (share,)) for name, share in shares.items() if share],
+                         raise_errors)
+
+    def stats(self):
+        """Api.stats() of every node, with per-path round-trip quantiles"""
+        return {name: api.stats() for name, api in self.apis.items()}
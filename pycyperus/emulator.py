@@ -0,0 +1,459 @@
+''' emulator.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# A stand-in for cyperus-server that answers every path _Server maps from
+# an in-memory graph, for tests and benchmarks without an audio server:
+#
+#     python -m pycyperus.emulator 27211 27212 --latency 0.001 --loss 0.01
+#
+# Latency, jitter and loss apply to every datagram in either direction.
+# Listings longer than chunk_size characters are split into multipart
+# responses the way the server splits them.  With deduplicate set, a
+# mutation whose request id was seen recently is answered again rather
+# than applied twice, as a server honouring idempotency keys would.
+
+import argparse
+import collections
+import heapq
+import itertools
+import random
+import socket
+import threading
+import time
+import uuid
+
+from pythonosc import osc_packet
+
+from pycyperus import errors
+from pycyperus import pycyperus
+from pycyperus.retransmit import READ_ONLY_PATHS
+
+# ports each module type is created with
+MODULE_PORTS = {
+    'oscillator_sine': ((), ('out',)),
+    'envelope_follower': (('in',), ('out',)),
+}
+
+
+class _Bus():
+    def __init__(self, name, parent_id, ins, outs):
+        self.name = name
+        self.parent_id = parent_id
+        self.ins = ins
+        self.outs = outs
+
+
+class _Module():
+    def __init__(self, name, bus_id, parameters, ins, outs):
+        self.name = name
+        self.bus_id = bus_id
+        self.parameters = parameters
+        self.ins = ins
+        self.outs = outs
+
+
+class Emulator():
+    """Listens on port_receive and answers to port_send on host, the way
+    cyperus-server answers its configured OSC client.  The graph is kept
+    in self.buses, self.modules, self.ports and self.connections."""
+
+    def __init__(self,
+                 port_receive,
+                 port_send,
+                 latency=0.0,
+                 jitter=0.0,
+                 loss=0.0,
+                 seed=None,
+                 chunk_size=768,
+                 dsp_load_interval=None,
+                 host='127.0.0.1',
+                 main_ins=2,
+                 main_outs=2,
+                 deduplicate=False,
+                 remember=4096):
+        self.address = (host, port_send)
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.random = random.Random(seed)
+        self.chunk_size = chunk_size
+        self.dsp_load_interval = dsp_load_interval
+        self.deduplicate = deduplicate
+        self.remember = remember
+        self.replies = collections.OrderedDict()
+        self.replying = None
+        self.encoder = pycyperus._MessageEncoder()
+        self.lock = threading.RLock()
+        self.buses = {}
+        self.modules = {}
+        self.ports = {}
+        self.connections = {}
+        self.osc_clients = [(host, f"{port_send}", True)]
+        self.env = {'CYPERUS_VERSION': 'emulator'}
+        self.main_ins = [self._add_port(f"main_in_{i}") for i in range(main_ins)]
+        self.main_outs = [self._add_port(f"main_out_{i}") for i in range(main_outs)]
+        self.received = 0
+        self.dropped = 0
+        self.sent = 0
+        self.handlers = {
+            '/cyperus/list/osc/client': self.list_osc_client,
+            '/cyperus/add/osc/client': self.add_osc_client,
+            '/cyperus/list/main': self.list_main,
+            '/cyperus/list/bus': self.list_bus,
+            '/cyperus/list/bus_port': self.list_bus_port,
+            '/cyperus/add/bus': self.add_bus,
+            '/cyperus/add/connection': self.add_connection,
+            '/cyperus/remove/connection': self.remove_connection,
+            '/cyperus/list/module': self.list_module,
+            '/cyperus/list/module_port': self.list_module_port,
+            '/cyperus/get/system/env_variable': self.get_system_env_variable,
+            '/cyperus/add/module/oscillator/sine': self.add_module_oscillator_sine,
+            '/cyperus/add/module/envelope/follower': self.add_module_envelope_follower,
+            '/cyperus/edit/module/oscillator/sine': self.edit_module,
+            '/cyperus/edit/module/envelope/follower': self.edit_module,
+        }
+
+        self.schedule = []
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.running = True
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, pycyperus.RECEIVE_BUFFER)
+        self.sock.bind((host, port_receive))
+        self.threads = [threading.Thread(target=self._serve, daemon=True),
+                        threading.Thread(target=self._run_schedule, daemon=True)]
+        if dsp_load_interval:
+            self.threads.append(threading.Thread(target=self._report_load, daemon=True))
+        for thread in self.threads:
+            thread.start()
+
+    def close(self):
+        self.running = False
+        with self.condition:
+            self.condition.notify()
+        try:
+            self.sock.sendto(b'', self.sock.getsockname())
+        except OSError:
+            pass
+        for thread in self.threads:
+            thread.join()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _lost(self):
+        if self.loss and self.random.random() < self.loss:
+            self.dropped += 1
+            return True
+        return False
+
+    def _delay(self):
+        if not self.jitter:
+            return self.latency
+        return self.latency + self.random.uniform(0, self.jitter)
+
+    def _at(self, when, action, *args):
+        with self.condition:
+            heapq.heappush(self.schedule, (when, next(self.sequence), action, args))
+            self.condition.notify()
+
+    def _run_schedule(self):
+        while True:
+            with self.condition:
+                while self.running and (not self.schedule or
+                                        self.schedule[0][0] > time.monotonic()):
+                    timeout = None
+                    if self.schedule:
+                        timeout = self.schedule[0][0] - time.monotonic()
+                    self.condition.wait(timeout)
+                if not self.running:
+                    return
+                when, sequence, action, args = heapq.heappop(self.schedule)
+            action(*args)
+
+    def _serve(self):
+        while self.running:
+            try:
+                dgram = self.sock.recv(65536)
+            except OSError:
+                continue
+            if not dgram or self._lost():
+                continue
+            self.received += 1
+            if dgram.startswith(b'#bundle'):
+                try:
+                    messages = osc_packet.OscPacket(dgram).messages
+                except osc_packet.ParseError:
+                    continue
+                now = time.time()
+                for timed in messages:
+                    message = (timed.message.address, timed.message.params)
+                    if timed.time > now:
+                        self._at(time.monotonic() + timed.time - now, self._handle, message)
+                    else:
+                        self._handle(message)
+            else:
+                message = pycyperus._decode_message(dgram)
+                if message is not None:
+                    self._handle(message)
+
+    def _handle(self, message):
+        handler = self.handlers.get(message[0])
+        if handler is None:
+            return
+        try:
+            with self.lock:
+                if not self.deduplicate or message[0] in READ_ONLY_PATHS:
+                    handler(message[0], *message[1])
+                    return
+                request_id = message[1][0]
+                replies = self.replies.get(request_id)
+                if replies is not None:
+                    for dgram in replies:
+                        self._transmit(dgram)
+                    return
+                self.replying = []
+                try:
+                    handler(message[0], *message[1])
+                finally:
+                    self.replies[request_id] = self.replying
+                    self.replying = None
+                    if len(self.replies) > self.remember:
+                        self.replies.popitem(last=False)
+        except Exception:
+            # a malformed request must not stop the emulator
+            return
+
+    def _transmit(self, dgram):
+        if self._lost():
+            return
+        try:
+            self.sock.sendto(dgram, self.address)
+        except OSError:
+            return
+        self.sent += 1
+
+    def _send(self, path, *args):
+        dgram = bytes(self.encoder.encode(path, args))
+        if self.replying is not None:
+            self.replying.append(dgram)
+        delay = self._delay()
+        if delay > 0:
+            self._at(time.monotonic() + delay, self._transmit, dgram)
+        else:
+            self._transmit(dgram)
+
+    def _respond(self, path, request_id, errno, *args):
+        """Sends args, splitting a long final string over several
+        datagrams with the multipart flag set on all but the last"""
+        text = args[-1] if args and isinstance(args[-1], str) else None
+        if text is None or len(text) <= self.chunk_size:
+            self._send(path, request_id, errno, 0, *args)
+            return
+        chunks = [text[i:i + self.chunk_size]
+                  for i in range(0, len(text), self.chunk_size)]
+        for index, chunk in enumerate(chunks):
+            multipart = 0 if index == len(chunks) - 1 else 1
+            self._send(path, request_id, errno, multipart, *args[:-1], chunk)
+
+    def _report_load(self):
+        while self.running:
+            time.sleep(self.dsp_load_interval)
+            self._send('/cyperus/dsp/load', self.random.uniform(0.05, 0.35))
+
+    def _add_port(self, name):
+        port_id = f"{uuid.uuid4()}"
+        self.ports[port_id] = name
+        return port_id
+
+    def _add_ports(self, names):
+        return [self._add_port(name) for name in names.split(',') if name]
+
+    def _ports_text(self, ins, outs):
+        return ('in:\n' + ''.join(f"{port_id}|{self.ports[port_id]}\n" for port_id in ins) +
+                'out:\n' + ''.join(f"{port_id}|{self.ports[port_id]}\n" for port_id in outs))
+
+    def _bus_line(self, bus_id):
+        bus = self.buses[bus_id]
+        return f"{bus_id}|{bus.name}|{len(bus.ins)}|{len(bus.outs)}\n"
+
+    def _children(self, parent_id):
+        return [bus_id for bus_id, bus in self.buses.items() if bus.parent_id == parent_id]
+
+    def _descendants(self, parent_id):
+        for bus_id in self._children(parent_id):
+            yield bus_id
+            yield from self._descendants(bus_id)
+
+    # handlers, one per request path
+
+    def list_osc_client(self, path, request_id, *args):
+        self._respond(path, request_id, 0,
+                      ''.join(f"{index}|{ip}|{port}|{int(listener)}\n"
+                              for index, (ip, port, listener) in enumerate(self.osc_clients)))
+
+    def add_osc_client(self, path, request_id, ip, port, listener_enable, *args):
+        self.osc_clients.append((ip, port, bool(listener_enable)))
+        self._send(path, request_id, 0, 0)
+
+    def list_main(self, path, request_id, *args):
+        self._respond(path, request_id, 0,
+                      'in:\n' + ''.join(f"{port_id}\n" for port_id in self.main_ins) +
+                      'out:\n' + ''.join(f"{port_id}\n" for port_id in self.main_outs))
+
+    def list_bus(self, path, request_id, bus_id, list_type, *args):
+        if bus_id and bus_id not in self.buses:
+            self._respond(path, request_id, errors.Cyperus.E_BUS_NOT_FOUND.value,
+                          bus_id, list_type, '')
+            return
+        if list_type == pycyperus.DIRECT_DESCENDANT:
+            bus_ids = self._children(bus_id)
+        elif list_type == pycyperus.ALL_DESCENDANTS:
+            bus_ids = list(self._descendants(bus_id))
+        elif not bus_id:
+            bus_ids = self._children('')
+        elif list_type == pycyperus.ALL_PEERS:
+            bus_ids = self._children(self.buses[bus_id].parent_id)
+        else:
+            bus_ids = [bus_id]
+        self._respond(path, request_id, 0, bus_id, list_type,
+                      ''.join(self._bus_line(child) for child in bus_ids))
+
+    def list_bus_port(self, path, request_id, bus_id, *args):
+        bus = self.buses.get(bus_id)
+        if bus is None:
+            self._respond(path, request_id, errors.Cyperus.E_BUS_NOT_FOUND.value, bus_id, '')
+            return
+        self._respond(path, request_id, 0, bus_id, self._ports_text(bus.ins, bus.outs))
+
+    def add_bus(self, path, request_id, bus_id, name, ins, outs, *args):
+        if bus_id and bus_id not in self.buses:
+            self._send(path, request_id, errors.Cyperus.E_BUS_NOT_FOUND.value, 0,
+                       bus_id, name, ins, outs, '')
+            return
+        new_id = f"{uuid.uuid4()}"
+        self.buses[new_id] = _Bus(name, bus_id, self._add_ports(ins), self._add_ports(outs))
+        self._send(path, request_id, 0, 0, bus_id, name, ins, outs, new_id)
+
+    def add_connection(self, path, request_id, port_out_id, port_in_id, *args):
+        errno = 0
+        if port_out_id not in self.ports:
+            errno = errors.Cyperus.E_PORT_OUT_NOT_FOUND.value
+        elif port_in_id not in self.ports:
+            errno = errors.Cyperus.E_PORT_IN_NOT_FOUND.value
+        new_id = ''
+        if not errno:
+            new_id = f"{uuid.uuid4()}"
+            self.connections[new_id] = (port_out_id, port_in_id)
+        self._send(path, request_id, errno, 0, port_out_id, port_in_id, new_id)
+
+    def remove_connection(self, path, request_id, connection_id, *args):
+        if self.connections.pop(connection_id, None) is None:
+            self._send(path, request_id, errors.Cyperus.E_CONNECTION_NOT_FOUND.value, 0,
+                       connection_id)
+            return
+        self._send(path, request_id, 0, 0, connection_id)
+
+    def list_module(self, path, request_id, bus_id, *args):
+        if bus_id not in self.buses:
+            self._respond(path, request_id, errors.Cyperus.E_BUS_NOT_FOUND.value, '')
+            return
+        self._respond(path, request_id, 0,
+                      ''.join(f"{module_id}|{module.name}\n"
+                              for module_id, module in self.modules.items()
+                              if module.bus_id == bus_id))
+
+    def list_module_port(self, path, request_id, module_id, *args):
+        module = self.modules.get(module_id)
+        if module is None:
+            self._respond(path, request_id, errors.Cyperus.E_MODULE_NOT_FOUND.value,
+                          module_id, '')
+            return
+        self._respond(path, request_id, 0, module_id,
+                      self._ports_text(module.ins, module.outs))
+
+    def get_system_env_variable(self, path, request_id, var_name, *args):
+        self._send(path, request_id, 0, 0, var_name, self.env.get(var_name, ''))
+
+    def _add_module(self, name, path, request_id, bus_id, parameters):
+        if bus_id not in self.buses:
+            self._send(path, request_id, errors.Cyperus.E_BUS_NOT_FOUND.value, 0,
+                       '', *parameters)
+            return
+        ins, outs = MODULE_PORTS[name]
+        module_id = f"{uuid.uuid4()}"
+        self.modules[module_id] = _Module(name,
+                                          bus_id,
+                                          list(parameters),
+                                          [self._add_port(port) for port in ins],
+                                          [self._add_port(port) for port in outs])
+        self._send(path, request_id, 0, 0, module_id, *parameters)
+
+    def add_module_oscillator_sine(self, path, request_id, bus_id, frequency, amplitude, phase):
+        self._add_module('oscillator_sine', path, request_id, bus_id,
+                         (float(frequency), float(amplitude), float(phase)))
+
+    def add_module_envelope_follower(self, path, request_id, bus_id, attack, decay, scale):
+        self._add_module('envelope_follower', path, request_id, bus_id,
+                         (float(attack), float(decay), float(scale)))
+
+    def edit_module(self, path, request_id, module_id, *parameters):
+        module = self.modules.get(module_id)
+        if module is None:
+            self._send(path, request_id, errors.Cyperus.E_MODULE_NOT_FOUND.value, 0,
+                       module_id, *parameters)
+            return
+        module.parameters = [float(parameter) for parameter in parameters]
+        self._send(path, request_id, 0, 0, module_id, *module.parameters)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='cyperus-server emulator')
+    parser.add_argument('port_receive', type=int)
+    parser.add_argument('port_send', type=int)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--loss', type=float, default=0.0)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--dsp-load-interval', type=float)
+    parser.add_argument('--deduplicate', action='store_true')
+    args = parser.parse_args()
+    emulator = Emulator(args.port_receive,
+                        args.port_send,
+                        latency=args.latency,
+                        jitter=args.jitter,
+                        loss=args.loss,
+                        seed=args.seed,
+                        dsp_load_interval=args.dsp_load_interval,
+                        host=args.host,
+                        deduplicate=args.deduplicate)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        emulator.close()
+
+if __name__ == '__main__':
+    main()
@@ -45,8 +45,38 @@ class MissingPortInId(ApiException):
 class MissingConnectionId(ApiException):
     """Missing connection ID"""
 
+class MissingModuleId(ApiException):
+    """Missing module ID"""
+
 class MissingModuleParameterValue(ApiException):
     """Missing module parameter value"""
+
+class InvalidModuleType(ApiException):
+    """Module type is invalid"""
+
+class UnknownPortReference(ApiException):
+    """Port reference does not name a known port"""
+
+class UnknownModuleParameter(ApiException):
+    """Module parameter is not automated"""
+
+class InvalidRate(ApiException):
+    """Rate is not a positive number"""
+
+class UnknownName(ApiException):
+    """Path does not name a known bus, module or port"""
+
+class ConnectionWouldCycle(ApiException):
+    """Connection would close a feedback loop"""
+
+class MalformedPatch(ApiException):
+    """File is not a saved patch this version can read"""
+
+class IrreversibleOperation(ApiException):
+    """Operation could not be undone if its transaction failed"""
+
+class UnknownConnections(ApiException):
+    """Live connections are not known, so changing them could duplicate some"""
     
 class RequestException(IOError):
     def __init__(self, *args, **kwargs):
@@ -58,6 +88,12 @@ class ResponseException(IOError):
         """Initialize"""
         super().__init__(*args, **kwargs)
         
+class TooManyPendingRequests(RequestException):
+    """Too many requests are awaiting a response"""
+
+class DuplicateRequestId(RequestException):
+    """A request with the same ID is still awaiting a response"""
+
 class MalformedRequest(RequestException, ValueError):
     """The request is malformed"""
     
@@ -73,6 +109,9 @@ class MissingResponseErrorCode(MalformedResponse):
 class MissingResponseMultipartFlag(MalformedResponse):
     """The response multipart flag is missing"""
 
+class ResponseTimeout(ResponseException, TimeoutError):
+    """No response arrived before the deadline"""
+
 class CyperusException(IOError):
     def __init__(self, *args, **kwargs):
         """Initialize"""
@@ -0,0 +1,223 @@
+''' metrics.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+import bisect
+import http.server
+import os
+import threading
+
+from pycyperus import errors
+
+# round-trip histogram bucket upper bounds in seconds, 10us to ~84s in
+# steps of sqrt(2)
+BUCKETS = tuple(1e-5 * 2 ** (step / 2) for step in range(47))
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+class PathStats():
+    __slots__ = ('sent', 'received', 'timeouts', 'orphans', 'retransmits',
+                 'duplicates', 'errnos', 'buckets', 'rtt_sum', 'rtt_max')
+
+    def __init__(self):
+        self.sent = 0
+        self.received = 0
+        self.timeouts = 0
+        self.orphans = 0
+        self.retransmits = 0
+        self.duplicates = 0
+        self.errnos = {}
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.rtt_sum = 0.0
+        self.rtt_max = 0.0
+
+    def quantile(self, q):
+        """The q-th round trip, interpolated within its bucket and no
+        larger than the slowest one seen"""
+        rank = q * self.received
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(BUCKETS, self.buckets):
+            if count and seen + count >= rank:
+                estimate = lower + (bound - lower) * (rank - seen) / count
+                return min(estimate, self.rtt_max)
+            seen += count
+            lower = bound
+        return self.rtt_max
+
+
+class Metrics():
+    """Per-path counters and round-trip histograms.  Recording is a dict
+    lookup and a few integer updates under one lock."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.paths = {}
+        self.http_server = None
+
+    def _path(self, path):
+        stats = self.paths.get(path)
+        if stats is None:
+            stats = self.paths[path] = PathStats()
+        return stats
+
+    def sent(self, path):
+        with self.lock:
+            self._path(path).sent += 1
+
+    def received(self, path, rtt, errno):
+        with self.lock:
+            stats = self._path(path)
+            stats.received += 1
+            stats.buckets[bisect.bisect_left(BUCKETS, rtt)] += 1
+            stats.rtt_sum += rtt
+            if rtt > stats.rtt_max:
+                stats.rtt_max = rtt
+            if errno:
+                stats.errnos[errno] = stats.errnos.get(errno, 0) + 1
+
+    def timeout(self, path):
+        with self.lock:
+            self._path(path).timeouts += 1
+
+    def orphan(self, path):
+        with self.lock:
+            self._path(path).orphans += 1
+
+    def retransmitted(self, path):
+        with self.lock:
+            self._path(path).retransmits += 1
+
+    def duplicate(self, path):
+        with self.lock:
+            self._path(path).duplicates += 1
+
+    def stats(self):
+        """{path: {'sent', 'received', 'timeouts', 'orphans', 'retransmits',
+        'duplicates', 'errors', 'rtt'}}, with errors keyed by errors.Cyperus name and rtt holding
+        count, mean, max and p50/p90/p99 in seconds"""
+        result = {}
+        with self.lock:
+            for path, stats in self.paths.items():
+                rtt = {
+                    'count': stats.received,
+                    'mean': stats.rtt_sum / stats.received if stats.received else 0.0,
+                    'max': stats.rtt_max
+                }
+                for q in QUANTILES:
+                    rtt[f"p{round(q * 100)}"] = stats.quantile(q) if stats.received else 0.0
+                result[path] = {
+                    'sent': stats.sent,
+                    'received': stats.received,
+                    'timeouts': stats.timeouts,
+                    'orphans': stats.orphans,
+                    'retransmits': stats.retransmits,
+                    'duplicates': stats.duplicates,
+                    'errors': {_errno_name(errno): count
+                               for errno, count in stats.errnos.items()},
+                    'rtt': rtt
+                }
+        return result
+
+    def prometheus(self):
+        """Renders every counter and histogram in the Prometheus text
+        exposition format"""
+        with self.lock:
+            paths = sorted(self.paths.items())
+            lines = []
+            for name, attribute, help_text in (
+                    ('requests_sent_total', 'sent', 'Requests sent'),
+                    ('responses_received_total', 'received', 'Responses received'),
+                    ('timeouts_total', 'timeouts', 'Requests that timed out'),
+                    ('orphan_responses_total', 'orphans',
+                     'Responses to unknown request ids'),
+                    ('retransmits_total', 'retransmits', 'Requests sent again'),
+                    ('duplicate_responses_total', 'duplicates',
+                     'Repeated responses that were discarded')):
+                lines.append(f"# HELP pycyperus_{name} {help_text}")
+                lines.append(f"# TYPE pycyperus_{name} counter")
+                for path, stats in paths:
+                    lines.append(f'pycyperus_{name}{{path="{path}"}} '
+                                 f'{getattr(stats, attribute)}')
+
+            lines.append("# HELP pycyperus_errors_total Error responses by errno")
+            lines.append("# TYPE pycyperus_errors_total counter")
+            for path, stats in paths:
+                for errno, count in sorted(stats.errnos.items()):
+                    lines.append(f'pycyperus_errors_total{{path="{path}",'
+                                 f'errno="{_errno_name(errno)}"}} {count}')
+
+            lines.append("# HELP pycyperus_round_trip_seconds Request round-trip time")
+            lines.append("# TYPE pycyperus_round_trip_seconds histogram")
+            for path, stats in paths:
+                cumulative = 0
+                for bound, count in zip(BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append(f'pycyperus_round_trip_seconds_bucket{{path="{path}",'
+                                 f'le="{bound:.6g}"}} {cumulative}')
+                lines.append(f'pycyperus_round_trip_seconds_bucket{{path="{path}",'
+                             f'le="+Inf"}} {stats.received}')
+                lines.append(f'pycyperus_round_trip_seconds_sum{{path="{path}"}} '
+                             f'{stats.rtt_sum}')
+                lines.append(f'pycyperus_round_trip_seconds_count{{path="{path}"}} '
+                             f'{stats.received}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, filename):
+        """Writes the exposition atomically, e.g. for node_exporter's
+        textfile collector"""
+        temporary = f"{filename}.{os.getpid()}.tmp"
+        with open(temporary, 'w') as output:
+            output.write(self.prometheus())
+        os.replace(temporary, filename)
+
+    def serve_prometheus(self, port, host='127.0.0.1'):
+        """Serves the exposition over HTTP from a daemon thread until
+        close()"""
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', f"{len(body)}")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                return
+
+        self.http_server = http.server.ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self.http_server.serve_forever, daemon=True).start()
+        return self.http_server
+
+    def close(self):
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
+
+
+def _errno_name(errno):
+    try:
+        return errors.Cyperus(errno).name
+    except ValueError:
+        return f"{errno}"
@@ -0,0 +1,362 @@
+''' names.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Buses, modules and ports are named by path the way reconcile.py names
+# them: 'main/fx' for a bus, 'main/fx/oscillator_sine' for a module (the
+# n-th after the first of a name on one bus being 'oscillator_sine#n')
+# and '<bus or module path>:<port name>' for a port.  Should a bus and a
+# module on the same bus share a name, the path names the bus.
+
+import fnmatch
+import threading
+
+from pycyperus import exceptions
+from pycyperus import pycyperus
+from pycyperus import snapshot
+
+
+class _Node():
+    __slots__ = ('id', 'kind', 'name', 'parent', 'children', 'ports')
+
+    def __init__(self, node_id, kind, name, parent):
+        self.id = node_id
+        self.kind = kind
+        self.name = name
+        self.parent = parent
+        self.children = {}
+        self.ports = {}
+
+    def path(self):
+        names = []
+        node = self
+        while node.parent is not None:
+            names.append(node.name)
+            node = node.parent
+        return '/'.join(reversed(names))
+
+
+class NameIndex():
+    """Prefix tree from bus, module and port paths to ids.  resolve() walks
+    one node per path segment and makes no requests.
+
+    Mutations made through the owning Api keep it current where their
+    outcome is known locally.  A new bus' ports and a new module's name
+    are assigned by the server, so the owner is only marked stale;
+    sync() relists every stale bus in one pipelined pass."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.root = _Node('', 'bus', '', None)
+        self.nodes = {'': self.root}
+        self.stale = set()
+        self.complete = False
+        # hook calls made while a crawl is in flight, replayed after it
+        self.events_lock = threading.Lock()
+        self.events = None
+
+    def _resolve(self, path):
+        owner, _, port = path.partition(':')
+        node = self.root
+        if owner:
+            for name in owner.split('/'):
+                node = node.children.get(name)
+                if node is None:
+                    return None
+        if port:
+            return node.ports.get(port)
+        return node
+
+    def resolve(self, path):
+        """The id `path` names"""
+        with self.lock:
+            node = self._resolve(path)
+            if node is None or node is self.root:
+                raise ExceptionGroup(
+                    f"'{path}' does not name a known bus, module or port",
+                    [
+                        exceptions.UnknownName(),
+                        exceptions.ApiException()
+                    ]
+                )
+            return node.id
+
+    def get(self, path, default=None):
+        with self.lock:
+            node = self._resolve(path)
+            return default if node is None or node is self.root else node.id
+
+    def __contains__(self, path):
+        return self.get(path) is not None
+
+    def path(self, node_id):
+        """The path naming id, or None"""
+        with self.lock:
+            node = self.nodes.get(node_id)
+            if node is None or node is self.root:
+                return None
+            if node.kind == 'port':
+                return f"{node.parent.path()}:{node.name}"
+            return node.path()
+
+    def _walk(self, node, path):
+        if node is not self.root:
+            yield path, node.id
+        for name, port in node.ports.items():
+            yield f"{path}:{name}", port.id
+        for name, child in node.children.items():
+            yield from self._walk(child, f"{path}/{name}" if path else name)
+
+    def prefix(self, prefix):
+        """(path, id) of every bus, module and port whose path starts with
+        prefix, parents before children"""
+        with self.lock:
+            owner, colon, port = prefix.partition(':')
+            names = owner.split('/') if owner else []
+            node = self.root
+            for name in names[:-1]:
+                node = node.children.get(name)
+                if node is None:
+                    return []
+            if colon:
+                if names:
+                    node = node.children.get(names[-1])
+                    if node is None:
+                        return []
+                return [(f"{owner}:{name}", each.id)
+                        for name, each in node.ports.items()
+                        if name.startswith(port)]
+            if not names:
+                return list(self._walk(node, ''))
+            parent = '/'.join(names[:-1])
+            matches = []
+            for name, child in node.children.items():
+                if name.startswith(names[-1]):
+                    matches.extend(self._walk(child, f"{parent}/{name}" if parent else name))
+            return matches
+
+    def _glob(self, node, path, patterns, port):
+        if not patterns:
+            if port is None:
+                if node is not self.root:
+                    yield path, node.id
+            else:
+                for name, each in node.ports.items():
+                    if fnmatch.fnmatchcase(name, port):
+                        yield f"{path}:{name}", each.id
+            return
+        pattern, rest = patterns[0], patterns[1:]
+        if pattern == '**':
+            yield from self._glob(node, path, rest, port)
+            for name, child in node.children.items():
+                yield from self._glob(child, f"{path}/{name}" if path else name,
+                                      patterns, port)
+            return
+        for name, child in node.children.items():
+            if fnmatch.fnmatchcase(name, pattern):
+                yield from self._glob(child, f"{path}/{name}" if path else name,
+                                      rest, port)
+
+    def glob(self, pattern):
+        """(path, id) of everything matching a shell-style pattern, matched
+        a segment at a time; '**' matches any number of segments.
+
+            for path, port_id in names.glob('main/*/oscillator_sine:out'):
+                ..."""
+        with self.lock:
+            owner, colon, port = pattern.partition(':')
+            patterns = owner.split('/') if owner else []
+            matches = list(self._glob(self.root, '', patterns, port if colon else None))
+            # '**' can reach one node along more than one route
+            return list(dict.fromkeys(matches))
+
+    def __len__(self):
+        with self.lock:
+            return len(self.nodes) - 1
+
+    def __repr__(self):
+        return f"<NameIndex entries={len(self)} stale={len(self.stale)}>"
+
+    # loading listings
+
+    def _add(self, node_id, kind, name, parent):
+        node = _Node(node_id, kind, name, parent)
+        self.nodes[node_id] = node
+        if kind == 'port':
+            parent.ports[name] = node
+        elif kind == 'bus' or name not in parent.children:
+            parent.children[name] = node
+        return node
+
+    def _set_ports(self, node, ports):
+        for port in node.ports.values():
+            self.nodes.pop(port.id, None)
+        node.ports = {}
+        for port in ports:
+            self._add(port.id, 'port', port.name, node)
+
+    def _set_modules(self, bus, modules):
+        """Replaces the bus' modules, keeping known ones' ports; returns
+        the nodes of modules not seen before"""
+        for name, child in list(bus.children.items()):
+            if child.kind == 'module':
+                del bus.children[name]
+        added = []
+        seen = {}
+        for module in modules:
+            count = seen.get(module.name, 0)
+            seen[module.name] = count + 1
+            name = module.name if not count else f"{module.name}#{count}"
+            node = self.nodes.get(module.id)
+            if node is None:
+                node = self._add(module.id, 'module', name, bus)
+                added.append(node)
+            else:
+                node.name = name
+                if name not in bus.children:
+                    bus.children[name] = node
+        return added
+
+    # observer hooks, called by _Client with each mutation's outcome
+
+    def _buffered(self, hook, *args):
+        """Holds a hook call back if a crawl is in flight, as the crawl may
+        or may not see its mutation; returns whether it was held"""
+        with self.events_lock:
+            if self.events is None:
+                return False
+            self.events.append((hook, args))
+            return True
+
+    def added_bus(self, bus_id, name, in_names, out_names, new_id):
+        if not self._buffered(self._added_bus, bus_id, name, in_names, out_names, new_id):
+            self._added_bus(bus_id, name, in_names, out_names, new_id)
+
+    def _added_bus(self, bus_id, name, in_names, out_names, new_id):
+        with self.lock:
+            if new_id in self.nodes:
+                return
+            parent = self.nodes.get(bus_id)
+            if new_id is None or parent is None or parent.kind != 'bus':
+                self.complete = False
+                return
+            self._add(new_id, 'bus', name, parent)
+            self.stale.add(new_id)
+
+    def added_module(self, bus_id, new_id, path=None, parameters=()):
+        if not self._buffered(self._added_module, bus_id):
+            self._added_module(bus_id)
+
+    def _added_module(self, bus_id):
+        with self.lock:
+            if bus_id in self.nodes:
+                self.stale.add(bus_id)
+            else:
+                self.complete = False
+
+    def added_connection(self, port_out_id, port_in_id, new_id):
+        pass
+
+    def removed_connection(self, connection_id):
+        pass
+
+    def invalidate(self):
+        """Forces the next sync() to crawl the whole server again"""
+        with self.lock:
+            self.complete = False
+
+    def sync(self, client, max_in_flight=64, timeout=20):
+        """Relists what mutations left stale, or everything after
+        invalidate(); a no-op without requests when neither applies"""
+        with self.lock:
+            if not self.complete:
+                # leaves stale what changed while it was in flight
+                self._crawl(client, max_in_flight, timeout)
+            if not self.stale:
+                return
+            buses = [self.nodes[bus_id] for bus_id in self.stale if bus_id in self.nodes]
+            self.stale = set()
+            self._list_buses(client, buses, max_in_flight, timeout)
+
+    def _list_buses(self, client, buses, max_in_flight, timeout):
+        calls = []
+        for bus in buses:
+            calls.append((pycyperus._parse_list_bus_port,
+                          "/cyperus/list/bus_port", bus.id, 's'))
+            calls.append((pycyperus._parse_list_module,
+                          "/cyperus/list/module", bus.id, 's'))
+        results = client._pipeline(calls, max_in_flight, timeout)
+        pycyperus._raise_failed(results, 'bus port and module')
+
+        added = []
+        for bus, ports, modules in zip(buses, results[0::2], results[1::2]):
+            self._set_ports(bus, (*ports['in'], *ports['out']))
+            added.extend(self._set_modules(bus, modules))
+        results = client._pipeline(
+            [(pycyperus._parse_list_module_port,
+              "/cyperus/list/module_port", module.id, 's')
+             for module in added],
+            max_in_flight, timeout)
+        pycyperus._raise_failed(results, 'module port')
+        for module, ports in zip(added, results):
+            self._set_ports(module, (*ports['in'], *ports['out']))
+
+    def _crawl(self, client, max_in_flight, timeout):
+        with self.events_lock:
+            self.events = []
+        try:
+            graph = snapshot.crawl(client, max_in_flight, timeout)
+        except BaseException:
+            with self.events_lock:
+                self.events = None
+            raise
+        self.load(graph)
+        while True:
+            with self.events_lock:
+                events = self.events
+                self.events = [] if events else None
+            if not events:
+                break
+            for hook, args in events:
+                hook(*args)
+
+    def load(self, graph):
+        """Replaces the index with the buses, modules and ports of a
+        snapshot.Graph"""
+        with self.lock:
+            self.root = _Node('', 'bus', '', None)
+            self.nodes = {'': self.root}
+            self.stale = set()
+            # parents are listed before their children
+            for bus in graph.buses.values():
+                self._add(bus.id, 'bus', bus.name, self.nodes[bus.parent_id])
+            for bus in graph.buses.values():
+                node = self.nodes[bus.id]
+                self._set_ports(node, bus.ins + bus.outs)
+                modules = [graph.modules[module_id] for module_id in bus.module_ids]
+                for module in self._set_modules(node, modules):
+                    listed = graph.modules[module.id]
+                    self._set_ports(module, listed.ins + listed.outs)
+            self.complete = True
+
+def crawl(client, max_in_flight=64, timeout=20):
+    """Builds a NameIndex of the whole server from a snapshot.crawl"""
+    index = NameIndex()
+    index.sync(client, max_in_flight, timeout)
+    return index
@@ -0,0 +1,363 @@
+''' patch.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# A saved patch holds the buses, modules, ports, connections and module
+# parameters as little-endian tables over one string table:
+#
+#     b'CYPATCH\0', version (1 byte), zlib(
+#         counts: string bytes, buses, modules, ports, connections,
+#                 parameters
+#         strings: utf-8, '\0' separated
+#         buses: (id, parent bus index or -1, name)
+#         modules: (id, bus index, type)
+#         ports: (id, owner kind (0 bus, 1 module, 2 main), owner index
+#                 (0 for main), direction (0 in, 1 out), name ('' for main))
+#         connections: (id, port out index, port in index)
+#         parameters: float64, each module's in reconcile.MODULE_TYPES order)
+#
+# Restoring creates everything anew; port ids are matched up by owner and
+# name, and main ports by position.
+
+import array
+import struct
+import sys
+import threading
+import zlib
+
+from pycyperus import exceptions
+from pycyperus import pycyperus
+from pycyperus import reconcile
+from pycyperus import snapshot
+
+MAGIC = b'CYPATCH\0'
+VERSION = 1
+
+_COUNTS = struct.Struct('<6I')
+
+# module type by add path, filled on first use: reconcile imports
+# pycyperus, which imports this module before reconcile has finished
+_MODULE_PATHS = {}
+
+def _module_type(path):
+    if not _MODULE_PATHS:
+        _MODULE_PATHS.update((address, module_type) for module_type, (address, parameters)
+                             in reconcile.MODULE_TYPES.items())
+    return _MODULE_PATHS.get(path)
+
+
+class Recorder():
+    """Remembers the connections made and the parameters modules were
+    added with.  The server cannot list either, so saving, reconciling,
+    routing and transactions know only those made through the Api, seen
+    by its topology cache or passed in."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.parameters = {}
+        self.connections = {}
+
+    def added_bus(self, bus_id, name, in_names, out_names, new_id):
+        pass
+
+    def added_module(self, bus_id, new_id, path=None, parameters=()):
+        module_type = _module_type(path)
+        if new_id is not None and module_type is not None:
+            with self.lock:
+                self.parameters[new_id] = dict(
+                    zip(reconcile.MODULE_TYPES[module_type][1], parameters))
+
+    def added_connection(self, port_out_id, port_in_id, new_id):
+        if new_id is not None:
+            with self.lock:
+                self.connections[new_id] = (port_out_id, port_in_id)
+
+    def removed_connection(self, connection_id):
+        with self.lock:
+            self.connections.pop(connection_id, None)
+
+
+class Patch():
+    """Tables of a saved topology; buses are listed parents first and
+    refer to each other, and ports and connections to buses, modules and
+    ports, by position"""
+
+    def __init__(self, buses, modules, ports, connections):
+        self.buses = buses
+        self.modules = modules
+        self.ports = ports
+        self.connections = connections
+
+    def __repr__(self):
+        return (f"<Patch buses={len(self.buses)} modules={len(self.modules)} "
+                f"ports={len(self.ports)} connections={len(self.connections)}>")
+
+    def to_bytes(self):
+        strings = {}
+
+        def intern(text):
+            index = strings.get(text)
+            if index is None:
+                index = strings[text] = len(strings)
+            return index
+
+        buses = array.array('i')
+        for bus_id, parent, name in self.buses:
+            buses.extend((intern(bus_id), parent, intern(name)))
+        modules = array.array('i')
+        parameters = array.array('d')
+        for module_id, bus, module_type, values in self.modules:
+            modules.extend((intern(module_id), bus, intern(module_type)))
+            parameters.extend(values)
+        ports = array.array('i')
+        for port_id, kind, owner, direction, name in self.ports:
+            ports.extend((intern(port_id), kind, owner, direction, intern(name)))
+        connections = array.array('i')
+        for connection_id, port_out, port_in in self.connections:
+            connections.extend((intern(connection_id), port_out, port_in))
+
+        tables = (buses, modules, ports, connections, parameters)
+        if sys.byteorder == 'big':
+            for table in tables:
+                table.byteswap()
+        text = '\0'.join(strings).encode()
+        body = b''.join((_COUNTS.pack(len(text), len(self.buses), len(self.modules),
+                                      len(self.ports), len(self.connections),
+                                      len(parameters)),
+                         text,
+                         *(table.tobytes() for table in tables)))
+        return MAGIC + bytes((VERSION,)) + zlib.compress(body, 1)
+
+    @classmethod
+    def from_bytes(cls, data):
+        if data[:len(MAGIC)] != MAGIC or data[len(MAGIC)] != VERSION:
+            raise ExceptionGroup(
+                "Not a version 1 pycyperus patch",
+                [
+                    exceptions.MalformedPatch(),
+                    exceptions.ApiException()
+                ]
+            )
+        body = zlib.decompress(data[len(MAGIC) + 1:])
+        text_size, bus_count, module_count, port_count, connection_count, \
+            parameter_count = _COUNTS.unpack_from(body)
+        offset = _COUNTS.size
+        strings = body[offset:offset + text_size].decode().split('\0')
+        offset += text_size
+
+        tables = []
+        for typecode, count in (('i', 3 * bus_count), ('i', 3 * module_count),
+                                ('i', 5 * port_count), ('i', 3 * connection_count),
+                                ('d', parameter_count)):
+            table = array.array(typecode)
+            size = count * table.itemsize
+            table.frombytes(body[offset:offset + size])
+            if sys.byteorder == 'big':
+                table.byteswap()
+            tables.append(table)
+            offset += size
+        buses, modules, ports, connections, parameters = tables
+
+        module_list = []
+        position = 0
+        for i in range(0, len(modules), 3):
+            module_type = strings[modules[i + 2]]
+            count = len(reconcile.MODULE_TYPES[module_type][1])
+            module_list.append((strings[modules[i]], modules[i + 1], module_type,
+                                tuple(parameters[position:position + count])))
+            position += count
+        return cls(
+            [(strings[buses[i]], buses[i + 1], strings[buses[i + 2]])
+             for i in range(0, len(buses), 3)],
+            module_list,
+            [(strings[ports[i]], ports[i + 1], ports[i + 2], ports[i + 3],
+              strings[ports[i + 4]])
+             for i in range(0, len(ports), 5)],
+            [(strings[connections[i]], connections[i + 1], connections[i + 2])
+             for i in range(0, len(connections), 3)])
+
+
+def crawl(client, connections, parameters, max_in_flight=64, timeout=20):
+    """Reads the live topology, connections and module parameters into
+    a Patch"""
+    graph = snapshot.crawl(client, max_in_flight, timeout)
+
+    buses = []
+    bus_index = {'': -1}
+    for bus in graph.buses.values():
+        bus_index[bus.id] = len(buses)
+        buses.append((bus.id, bus_index[bus.parent_id], bus.name))
+
+    ports = []
+    modules = []
+    for index, bus in enumerate(graph.buses.values()):
+        for port in bus.ins + bus.outs:
+            ports.append((port.id, 0, index, 0 if port.direction == 'in' else 1, port.name))
+        for module_id in bus.module_ids:
+            module_type = graph.modules[module_id].name
+            if module_type not in reconcile.MODULE_TYPES:
+                raise ExceptionGroup(
+                    f"Module {module_id} has unknown type '{module_type}'",
+                    [
+                        exceptions.InvalidModuleType(),
+                        exceptions.ApiException()
+                    ]
+                )
+            values = parameters.get(module_id, {})
+            missing = [parameter for parameter in reconcile.MODULE_TYPES[module_type][1]
+                       if values.get(parameter) is None]
+            if missing:
+                raise ExceptionGroup(
+                    f"No value known for {missing} of module {module_id}",
+                    [
+                        exceptions.MissingModuleParameterValue(),
+                        exceptions.ApiException()
+                    ]
+                )
+            modules.append((module_id, index, module_type,
+                            tuple(float(values[parameter]) for parameter in
+                                  reconcile.MODULE_TYPES[module_type][1])))
+
+    for index, (module_id, bus, module_type, values) in enumerate(modules):
+        module = graph.modules[module_id]
+        for port in module.ins + module.outs:
+            ports.append((port.id, 1, index, 0 if port.direction == 'in' else 1, port.name))
+
+    for port in graph.main:
+        ports.append((port.id, 2, 0, 0 if port.direction == 'in' else 1, ''))
+
+    port_index = {port[0]: index for index, port in enumerate(ports)}
+    connection_list = []
+    for connection_id, (port_out_id, port_in_id) in connections.items():
+        for port_id in (port_out_id, port_in_id):
+            if port_id not in port_index:
+                raise ExceptionGroup(
+                    f"Connection {connection_id} refers to port {port_id}, "
+                    "which the server does not list",
+                    [
+                        exceptions.UnknownPortReference(),
+                        exceptions.ApiException()
+                    ]
+                )
+        connection_list.append((connection_id, port_index[port_out_id],
+                                port_index[port_in_id]))
+    return Patch(buses, modules, ports, connection_list)
+
+def restore(client, patch, max_in_flight=256, timeout=20):
+    """Creates everything in patch anew and returns a dict from each
+    saved bus, module, port and connection id to the new one"""
+    ids = {}
+    bus_ids = [None] * len(patch.buses)
+    depths = [0] * len(patch.buses)
+    levels = {}
+    for index, (bus_id, parent, name) in enumerate(patch.buses):
+        depths[index] = depths[parent] + 1 if parent >= 0 else 0
+        levels.setdefault(depths[index], []).append(index)
+    # ports by owner kind, owner and direction
+    owned = ([([], []) for bus in patch.buses],
+             [([], []) for module in patch.modules],
+             [([], [])])
+    for port in patch.ports:
+        owned[port[1]][port[2]][port[3]].append(port)
+
+    def port_names(index, direction):
+        return ','.join(port[4] for port in owned[0][index][direction])
+
+    for depth in sorted(levels):
+        level = levels[depth]
+        results = client._pipeline(
+            [(pycyperus._parse_add_bus,
+              "/cyperus/add/bus",
+              bus_ids[patch.buses[index][1]] if patch.buses[index][1] >= 0 else '',
+              patch.buses[index][2],
+              port_names(index, 0),
+              port_names(index, 1))
+             for index in level],
+            max_in_flight, timeout)
+        for index, new_id in zip(level, results):
+            if not isinstance(new_id, Exception):
+                bus_ids[index] = new_id
+                ids[patch.buses[index][0]] = new_id
+        pycyperus._raise_failed(results, 'add bus')
+
+    results = client._pipeline(
+        [(pycyperus._parse_add_module,
+          reconcile.MODULE_TYPES[module_type][0],
+          bus_ids[bus],
+          *values)
+         for module_id, bus, module_type, values in patch.modules],
+        max_in_flight, timeout)
+    module_ids = results
+    for (module_id, bus, module_type, values), new_id in zip(patch.modules, results):
+        if not isinstance(new_id, Exception):
+            ids[module_id] = new_id
+    pycyperus._raise_failed(results, 'add module')
+
+    owners = [(0, index, bus_id) for index, bus_id in enumerate(bus_ids)]
+    owners += [(1, index, module_id) for index, module_id in enumerate(module_ids)]
+    calls = [(pycyperus._parse_list_bus_port if kind == 0
+              else pycyperus._parse_list_module_port,
+              "/cyperus/list/bus_port" if kind == 0 else "/cyperus/list/module_port",
+              owner_id, 's')
+             for kind, index, owner_id in owners]
+    calls.append((pycyperus._parse_list_main, "/cyperus/list/main"))
+    results = client._pipeline(calls, max_in_flight, timeout)
+    pycyperus._raise_failed(results, 'port')
+    mains = results.pop()
+    for direction, name in ((0, 'in'), (1, 'out')):
+        for port, port_id in zip(owned[2][0][direction], mains[name]):
+            ids[port[0]] = port_id
+    for (kind, index, owner_id), listing in zip(owners, results):
+        for direction, name in ((0, 'in'), (1, 'out')):
+            new_ports = {}
+            for port in listing[name]:
+                new_ports.setdefault(port['name'], []).append(port['id'])
+            for port in owned[kind][index][direction]:
+                candidates = new_ports.get(port[4])
+                if candidates:
+                    ids[port[0]] = candidates.pop(0)
+
+    calls = []
+    for connection_id, port_out, port_in in patch.connections:
+        port_out_id = ids.get(patch.ports[port_out][0])
+        port_in_id = ids.get(patch.ports[port_in][0])
+        if port_out_id is None or port_in_id is None:
+            raise ExceptionGroup(
+                f"Connection {connection_id} lost a port in restoring",
+                [
+                    exceptions.UnknownPortReference(),
+                    exceptions.ApiException()
+                ]
+            )
+        calls.append((pycyperus._parse_add_connection,
+                      "/cyperus/add/connection", port_out_id, port_in_id))
+    results = client._pipeline(calls, max_in_flight, timeout)
+    for (connection_id, port_out, port_in), new_id in zip(patch.connections, results):
+        if not isinstance(new_id, Exception):
+            ids[connection_id] = new_id
+    pycyperus._raise_failed(results, 'add connection')
+    return ids
+
+def save(filename, patch):
+    with open(filename, 'wb') as output:
+        output.write(patch.to_bytes())
+
+def load(filename):
+    with open(filename, 'rb') as source:
+        return Patch.from_bytes(source.read())
@@ -18,73 +18,180 @@ Copyright 2024 murray foster '''
 
 #! /usr/bin/python3
 
+import collections
+import copy
+import itertools
 import json
+import os
 import queue
+import secrets
+import socket
+import struct
 import sys
 import threading
 import time
 import types
-import uuid
 
-from pythonosc.dispatcher import Dispatcher as OscDispatcher
-from pythonosc import osc_server
-from pythonosc import udp_client
+from pythonosc import osc_message
+from pythonosc import osc_message_builder
+from pythonosc import osc_packet
 
+from pycyperus import automation
 from pycyperus import errors
 from pycyperus import exceptions
+from pycyperus import names
+from pycyperus import patch
+from pycyperus import reconcile
+from pycyperus import records
+from pycyperus import routing
+from pycyperus import snapshot
+from pycyperus import telemetry
+from pycyperus import topology
+from pycyperus import transaction
+from pycyperus.metrics import Metrics
+from pycyperus.retransmit import READ_ONLY_PATHS
+from pycyperus.retransmit import RttEstimator
+
+
+RECEIVE_BUFFER = 1 << 22
+
+# how long parts of a response that arrived after its final part are
+# waited for, when what has arrived does not read as a whole listing
+REORDER_WINDOW = 0.005
+
+# list_bus list types
+ADJACENT_PEER = 0
+ALL_PEERS = 1
+DIRECT_DESCENDANT = 2
+ALL_DESCENDANTS = 3
 
 
 class _Server():
-    def __init__(self, port, submitted_requests, response_queue):
+    """Receives on one thread: datagrams are drained from the socket in a
+    loop, decoded and routed to their handler by address"""
+
+    def __init__(self,
+                 port,
+                 pending,
+                 metrics=None,
+                 dsp_load=None,
+                 host='127.0.0.1'):
         self.port = port
-        self.submitted_requests = submitted_requests
-        self.responses = response_queue
-        self.server = None
+        self.host = host
+        self.pending = pending
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.dsp_load = dsp_load
+        self.sock = None
         self.server_exc = None
+        self.running = False
+        self.ready = threading.Event()
+        self.handlers = {}
         self.server_thread = threading.Thread(
             target=self.server_thread_run,
             args=(),
             daemon=True)
         self.server_thread.start()
-        while not self.server and self.server_exc == None:
-            time.sleep(0.001)
-        if not self.server:
-            return None
+        self.ready.wait()
 
     def close(self):
-        self.server.shutdown()
-        self.server.server_close()
+        self.running = False
+        try:
+            self.sock.sendto(b'', self.sock.getsockname())
+        except OSError:
+            pass
+        self.server_thread.join()
+        self.sock.close()
+
+    def _orphan(self, path, request_id):
+        if not self.pending.discard(request_id):
+            self.metrics.orphan(path)
+
+    def _respond(self, path, request_id, args):
+        pending = self.pending.get(request_id)
+        if pending is None:
+            self._orphan(path, request_id)
+            return
+        metrics = pending.metrics if pending.metrics is not None else self.metrics
+        response = pending.add_part(args, request_id)
+        if response is False:
+            metrics.duplicate(pending.path)
+        elif response is not None:
+            pending.set()
+            metrics.received(pending.path,
+                                  time.perf_counter() - pending.sent,
+                                  response[0])
         
     def server_thread_run(self):
-        self.dispatcher = OscDispatcher()
-        self.dispatcher.map('/cyperus/dsp/load', self.osc_dsp_load_handler)
-        self.dispatcher.map('/cyperus/address', self.osc_address_handler)
-        self.dispatcher.map('/cyperus/list/osc/client', self.osc_list_osc_client_handler)
-        self.dispatcher.map('/cyperus/add/osc/client', self.osc_add_osc_client_handler)                
-        self.dispatcher.map('/cyperus/list/main', self.osc_list_main_handler)
-        self.dispatcher.map('/cyperus/list/bus', self.osc_list_bus)
-        self.dispatcher.map('/cyperus/list/bus_port', self.osc_list_bus_port)
-        self.dispatcher.map('/cyperus/add/bus', self.osc_add_bus)
-        self.dispatcher.map('/cyperus/add/connection', self.osc_add_connection)
-        self.dispatcher.map('/cyperus/remove/connection', self.osc_remove_connection)
-        self.dispatcher.map('/cyperus/list/module', self.osc_list_module)
-        self.dispatcher.map('/cyperus/list/module_port', self.osc_list_module_port)
-        self.dispatcher.map('/cyperus/get/system/env_variable', self.osc_get_system_env_variable)
-        self.dispatcher.map('/cyperus/add/module/oscillator/sine', self.osc_add_module_oscillator_sine)
-        self.dispatcher.map('/cyperus/add/module/envelope/follower', self.osc_add_module_envelope_follower)        
+        self.handlers = {
+            '/cyperus/dsp/load': self.osc_dsp_load_handler,
+            '/cyperus/address': self.osc_address_handler,
+            '/cyperus/list/osc/client': self.osc_list_osc_client_handler,
+            '/cyperus/add/osc/client': self.osc_add_osc_client_handler,
+            '/cyperus/list/main': self.osc_list_main_handler,
+            '/cyperus/list/bus': self.osc_list_bus,
+            '/cyperus/list/bus_port': self.osc_list_bus_port,
+            '/cyperus/add/bus': self.osc_add_bus,
+            '/cyperus/add/connection': self.osc_add_connection,
+            '/cyperus/remove/connection': self.osc_remove_connection,
+            '/cyperus/list/module': self.osc_list_module,
+            '/cyperus/list/module_port': self.osc_list_module_port,
+            '/cyperus/get/system/env_variable': self.osc_get_system_env_variable,
+            '/cyperus/add/module/oscillator/sine': self.osc_add_module_oscillator_sine,
+            '/cyperus/add/module/envelope/follower': self.osc_add_module_envelope_follower,
+        }
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         try:
-            self.server = osc_server.ThreadingOSCUDPServer(
-                ('127.0.0.1', self.port), self.dispatcher)
+            # room for the answers to a pipelined burst, or to many
+            # servers at once; the kernel caps this at net.core.rmem_max
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+            self.sock.bind((self.host, self.port))
         except OSError as exc:
+            self.sock.close()
             self.server_exc = exc
+            self.ready.set()
             return
 
-        self.server.serve_forever()
-        
+        self.running = True
+        self.ready.set()
+        self.serve()
+
+    def serve(self):
+        recv = self.sock.recv
+        dispatch = self._dispatch
+        while self.running:
+            try:
+                dgram = recv(65536)
+            except OSError:
+                continue
+            if dgram:
+                dispatch(dgram)
+
+    def _dispatch(self, dgram):
+        if dgram.startswith(b'#bundle'):
+            try:
+                messages = [(timed.message.address, timed.message.params)
+                            for timed in osc_packet.OscPacket(dgram).messages]
+            except osc_packet.ParseError:
+                return
+        else:
+            messages = (_decode_message(dgram),)
+        for message in messages:
+            if message is None:
+                continue
+            handler = self.handlers.get(message[0])
+            if handler is None:
+                continue
+            try:
+                handler(message[0], *message[1])
+            except Exception:
+                # a malformed datagram must not stop the receive loop
+                continue
+
     def osc_dsp_load_handler(self,
                              path,
                              dsp_cpu_load):
-        return
+        if self.dsp_load is not None:
+            self.dsp_load.record(dsp_cpu_load)
         
     def osc_address_handler(self,
                             path,
@@ -93,11 +200,11 @@ class _Server():
                             multipart,
                             new_host_out,
                             new_port_out):
-        if request_id not in self.submitted_requests:
-            return        
-        print("received '/cyperus/address'")
+        if request_id not in self.pending:
+            self._orphan(path, request_id)
+            return
         args = (errno, multipart, new_host_out, new_port_out)
-        self.responses[request_id] = args
+        self._respond(path, request_id, args)
 
     def osc_list_osc_client_handler(self,
                               path,
@@ -105,25 +212,25 @@ class _Server():
                               errno,
                               multipart,
                               clients_str):
-        if request_id not in self.submitted_requests:
+        if request_id not in self.pending:
+            self._orphan(path, request_id)
             return
-        print("received '/cyperus/list/osc/client'")
         args = (errno,
                 multipart,
                 clients_str)
-        self.responses[request_id] = args
+        self._respond(path, request_id, args)
 
     def osc_add_osc_client_handler(self,
                               path,
                               request_id,
                               errno,
                               multipart):
-        if request_id not in self.submitted_requests:
+        if request_id not in self.pending:
+            self._orphan(path, request_id)
             return
-        print("received '/cyperus/add/osc/client'")
         args = (errno,
                 multipart)
-        self.responses[request_id] = args
+        self._respond(path, request_id, args)
         
     def osc_list_main_handler(self,
                               path,
@@ -131,13 +238,13 @@ class _Server():
                               errno,
                               multipart,
                               mains_str):
-        if request_id not in self.submitted_requests:
+        if request_id not in self.pending:
+            self._orphan(path, request_id)
             return
-        print("received '/cyperus/list/main'")        
         args = (errno,
                 multipart,
                 mains_str)
-        self.responses[request_id] = args
+        self._respond(path, request_id, args)
 
     def osc_list_bus(self,
                      path,
@@ -147,15 +254,15 @@ class _Server():
                      bus_id,
                      list_type,
                      result_str):
-        if request_id not in self.submitted_requests:
-            return        
-        print("received '/cyperus/list/bus'")
+        if request_id not in self.pending:
+            self._orphan(path, request_id)
+            return
         args = (errno,
                 multipart,
                 bus_id,
                 list_type,
                 result_str)
-        self.responses[request_id] = args
+        self._respond(path, request_id, args)
 
     def osc_list_bus_port(self,
                           path,
@@ -164,14 +271,14 @@ class _Server():
                           multipart,
                           bus_id,
                           result_str):
-        if request_id not in self.submitted_requests:
-            return        
-        print("received '/cyperus/list/bus_port'")
+        if request_id not in self.pending:
+            self._orphan(path, request_id)
+            return
         args = (errno,
                 multipart,
                 bus_id,
                 result_str)
-        self.responses[request_id] = args
+        self._respond(path, request_id, args)
 
     def osc_add_bus(self,
                     path,
@@ -183,9 +290,9 @@ class _Server():
                     ins_str,
                     outs_str,
                     new_id):
-        if request_id not in self.submitted_requests:
-            return        
-        print("received '/cyperus/add/bus'")
+        if request_id not in self.pending:
+            self._orphan(path, request_id)
+            return
         args = (errno,
                 multipart,
                 target_bus_id,
@@ -193,7 +300,7 @@ class _Server():
                 ins_str,
                 outs_str,
                 new_id)
-        self.responses[request_id] = args
+        self._respond(path, request_id, args)
 
     def osc_add_connection(self,
                            path,
@@ -203,15 +310,15 @@ class _Server():
                            port_out_id,
                            port_in_id,
                            new_connection_id):
-        if request_id not in self.submitted_requests:
-            return        
-        print("received '/cyperus/add/connection'")
+        if request_id not in self.pending:
+            self._orphan(path, request_id)
+            return
         args = (errno,
                 multipart,
                 port_out_id,
                 port_in_id,
                 new_connection_id)
-        self.responses[request_id] = args
+        self._respond(path, request_id, args)
 
     def osc_remove_connection(self,
                               path,
@@ -219,13 +326,13 @@ class _Server():
                               errno,
                               multipart,
                               connection_id):
-        if request_id not in self.submitted_requests:
-            return        
-        print("received '/cyperus/remove/connection'")
+        if request_id not in self.pending:
+            self._orphan(path, request_id)
+            return
         args = (errno,
                 multipart,
                 connection_id)
-        self.responses[request_id] = args
+        self._respond(path, request_id, args)
 
     def osc_list_module(self,
                         path,
@@ -233,13 +340,13 @@ class _Server():
                         errno,
                         multipart,
                         result_str):
-        if request_id not in self.submitted_requests:
-            return        
-        print("received '/cyperus/list/module'")
+        if request_id not in self.pending:
+            self._orphan(path, request_id)
+            return
         args = (errno,
                 multipart,
                 result_str)
-        self.responses[request_id] = args
+        self._respond(path, request_id, args)
 
     def osc_list_module_port(self,
                              path,
@@ -248,14 +355,14 @@ class _Server():
                              multipart,
                              module_id,
                              result_str):
-        if request_id not in self.submitted_requests:
-            return        
-        print("received '/cyperus/list/module_port'")
+        if request_id not in self.pending:
+            self._orphan(path, request_id)
+            return
         args = (errno,
                 multipart,
                 module_id,
                 result_str)
-        self.responses[request_id] = args
+        self._respond(path, request_id, args)
 
     def osc_get_system_env_variable(self,
                                     path,
@@ -264,14 +371,14 @@ class _Server():
                                     multipart,
                                     var_name,
                                     env_variable):
-        if request_id not in self.submitted_requests:
-            return        
-        print("received '/cyperus/get/system/env_variable'")
+        if request_id not in self.pending:
+            self._orphan(path, request_id)
+            return
         args = (errno,
                 multipart,
                 var_name,
                 env_variable)
-        self.responses[request_id] = args
+        self._respond(path, request_id, args)
         
     def osc_add_module_oscillator_sine(self,
                                        path,
@@ -282,16 +389,16 @@ class _Server():
                                        frequency,
                                        amplitude,
                                        phase):
-        if request_id not in self.submitted_requests:
-            return        
-        print("received '/cyperus/add/module/oscillator/sine'")
+        if request_id not in self.pending:
+            self._orphan(path, request_id)
+            return
         args = (errno,
                 multipart,
                 module_id,
                 frequency,
                 amplitude,
                 phase)
-        self.responses[request_id] = args
+        self._respond(path, request_id, args)
 
     def osc_add_module_envelope_follower(self,
                                          path,
@@ -302,397 +409,1023 @@ class _Server():
                                          attack,
                                          decay,
                                          scale):
-        if request_id not in self.submitted_requests:
-            return        
-        print("received '/cyperus/add/module/oscillator/sine'")
+        if request_id not in self.pending:
+            self._orphan(path, request_id)
+            return
         args = (errno,
                 multipart,
                 module_id,
                 attack,
                 decay,
                 scale)
-        self.responses[request_id] = args
-
-class _Client():
-    def __init__(self, port, submitted_requests, response_queue):
-        self.client = udp_client.SimpleUDPClient('127.0.0.1', port)
-        self.submitted_requests = submitted_requests
-        self.responses = response_queue
-
-    def _request(self, path, *data, fields=None):
-        request_id = f"{uuid.uuid4()}"
-        self.submitted_requests.add(request_id)
-        data = (request_id,) + data
-        self.client.send_message(path, data)        
-        return request_id
-
-    def _get_response_blocking(self, request_id, timeout=20):
-        timeout_count = 0
-        response = None
-        timeout *= 1000
-        while request_id not in self.responses and timeout_count < timeout:
-            time.sleep(0.001)
-            if timeout > 0:
-                timeout_count += 1
-        response = self.responses[request_id]
-        if response:
-            del self.responses[request_id]
-            self.submitted_requests.remove(request_id)
-        return response
-    
-    def _get_response_nonblocking(self, request_id):
-        response = self.responses.get(request_id, None)
-        if response:
-            del self.responses[request_id]
-            self.submitted_requests.remove(request_id)
-        return response
-
-    def list_osc_client(self, blocking=True):
-        request_id = self._request("/cyperus/list/osc/client")
+        self._respond(path, request_id, args)
+
+_ERRNO_EXCEPTIONS = {
+    errors.Cyperus.E_BUS_NOT_FOUND: (
+        "The target bus does not exist", exceptions.BusNotFound),
+    errors.Cyperus.E_PORT_OUT_NOT_FOUND: (
+        "The target port out does not exist", exceptions.PortOutNotFound),
+    errors.Cyperus.E_PORT_IN_NOT_FOUND: (
+        "The target port in does not exist", exceptions.PortInNotFound),
+    errors.Cyperus.E_CONNECTION_NOT_FOUND: (
+        "The connection does not exist", exceptions.ConnectionNotFound),
+    errors.Cyperus.E_MODULE_NOT_FOUND: (
+        "The target module does not exist", exceptions.ModuleNotFound),
+}
+
+def _check_errno(response, *codes):
+    errno = response[0]
+    for code in codes:
+        if errno == code.value:
+            message, exception = _ERRNO_EXCEPTIONS[code]
+            raise ExceptionGroup(
+                message,
+                [
+                    exception(),
+                    exceptions.CyperusException()
+                ]
+            )
 
-        if not blocking:
-            response = self._get_response_nonblocking(request_id)
+def _assemble_parts(parts):
+    if len(parts) == 1:
+        return parts[0]
+    return parts[0][:-1] + (''.join(part[-1] for part in parts),)
+
+# listing paths and the '|'-separated fields on each of their lines
+_LINE_FIELDS = {
+    "/cyperus/list/osc/client": 4,
+    "/cyperus/list/main": 1,
+    "/cyperus/list/bus": 4,
+    "/cyperus/list/bus_port": 2,
+    "/cyperus/list/module": 2,
+    "/cyperus/list/module_port": 2,
+}
+
+_SECTIONED_PATHS = frozenset((
+    "/cyperus/list/main",
+    "/cyperus/list/bus_port",
+    "/cyperus/list/module_port",
+))
+
+# paths whose lines start with a server-issued id
+_ID_PATHS = _SECTIONED_PATHS | {"/cyperus/list/bus", "/cyperus/list/module"}
+
+def _is_header(line, sectioned):
+    return sectioned and line in ('in:', 'out:')
+
+def _well_formed_line(line, separators, counts, id_length):
+    if line.count('|') != separators:
+        return False
+    if counts and not all(field.isdigit() for field in line.rsplit('|', 2)[1:]):
+        return False
+    return id_length is None or len(line.split('|', 1)[0]) == id_length
+
+def _well_formed(path, response, parts):
+    """Whether a listing assembled from several parts reads as whole:
+    its first line and every line spanning two parts have the path's
+    field count, numeric port counts for buses and an id as long as
+    those of lines that arrived within one part, when they agree, or as
+    each other when no line did.  Only those lines can show a lost or
+    reordered part, as parts carry no sequence number; a gap of whole
+    lines, or joining two lines within their name field, still passes."""
+    fields = _LINE_FIELDS.get(path)
+    if len(parts) < 2 or fields is None or response[0]:
+        return True
+    text = response[-1]
+    if not isinstance(text, str):
+        return False
+    sectioned = path in _SECTIONED_PATHS
+    id_lengths = set()
+    if path in _ID_PATHS:
+        for part in parts:
+            chunk = part[-1]
+            start = chunk.find('\n') + 1
+            end = chunk.find('\n', start)
+            if start and end >= 0 and not _is_header(chunk[start:end], sectioned):
+                id_lengths.add(len(chunk[start:end].split('|', 1)[0]))
+    id_length = id_lengths.pop() if len(id_lengths) == 1 else None
+    # with no line inside a part, the lines checked must agree instead
+    unsampled = path in _ID_PATHS and id_length is None and not id_lengths
+    counts = path == "/cyperus/list/bus"
+    offset = 0
+    for part in parts:
+        start = text.rfind('\n', 0, offset) + 1
+        end = text.find('\n', offset)
+        line = text[start:end if end >= 0 else len(text)]
+        if line and not _is_header(line, sectioned):
+            if not _well_formed_line(line, fields - 1, counts, id_length):
+                return False
+            if unsampled and id_length is None:
+                id_length = len(line.split('|', 1)[0])
+        offset += len(part[-1])
+    return True
+
+def _malformed(path):
+    return ExceptionGroup(
+        f"Response to {path} is incomplete or out of order",
+        [
+            exceptions.MalformedResponse(),
+            exceptions.ResponseException()
+        ]
+    )
+
+def _parse(parser, response, path):
+    """parser(response), with a listing that fails to decode raised as
+    MalformedResponse"""
+    try:
+        return parser(response)
+    except (ValueError, IndexError) as exc:
+        if isinstance(exc, exceptions.MalformedResponse):
+            raise
+        raise _malformed(path) from exc
+
+def _iter_checked(parts, *codes):
+    for part in parts:
+        _check_errno(part, *codes)
+        yield part
+
+def _iter_lines(parts):
+    tail = ''
+    for part in parts:
+        lines = (tail + part[-1]).split('\n')
+        tail = lines.pop()
+        yield from filter(None, lines)
+    if tail:
+        yield tail
+
+def _iter_sections(lines):
+    outs = False
+    for elem in lines:
+        if elem == 'out:':
+            outs = True
+        elif elem == 'in:':
+            pass
+        elif outs:
+            yield 'out', elem
         else:
-            response = self._get_response_blocking(request_id)
+            yield 'in', elem
+
+def _iter_ports(lines):
+    for direction, elem in _iter_sections(lines):
+        yield direction, records.parse_port(elem)
+
+def _parse_list_osc_client(response):
+    clients = []
+    for client_addr in filter(None, response[-1].split('\n')):
+        client_id, ip, port, listener_enable = client_addr.split('|')
+        clients.append({
+            'id': int(client_id),
+            'ip': ip,
+            'port': port,
+            'listener_enable': bool(int(listener_enable))
+        })
+    return clients
+
+def _parse_add_osc_client(response):
+    if response[0] == 0:
+        return True
+    return False
+
+def _parse_list_main(response):
+    mains = {'in': [],
+             'out': []}
+    for direction, elem in _iter_sections(_iter_lines((response,))):
+        mains[direction].append(elem)
+    return mains
+
+def _parse_list_bus(response):
+    _check_errno(response, errors.Cyperus.E_BUS_NOT_FOUND)
+    return records.Listing(response[-1], records.parse_bus)
+
+def _parse_list_bus_port(response):
+    _check_errno(response, errors.Cyperus.E_BUS_NOT_FOUND)
+    return records.sections(response[-1], records.parse_port)
+
+def _parse_add_bus(response):
+    _check_errno(response, errors.Cyperus.E_BUS_NOT_FOUND)
+    return response[-1]
+
+def _parse_add_connection(response):
+    _check_errno(response,
+                 errors.Cyperus.E_PORT_OUT_NOT_FOUND,
+                 errors.Cyperus.E_PORT_IN_NOT_FOUND)
+    return response[-1]
+
+def _parse_remove_connection(response):
+    _check_errno(response, errors.Cyperus.E_CONNECTION_NOT_FOUND)
+    return response[-1]
+
+def _parse_list_module(response):
+    _check_errno(response, errors.Cyperus.E_BUS_NOT_FOUND)
+    return records.Listing(response[-1], records.parse_module)
+
+def _parse_list_module_port(response):
+    _check_errno(response, errors.Cyperus.E_MODULE_NOT_FOUND)
+    return records.sections(response[-1], records.parse_port)
+
+def _parse_get_system_env_variable(response):
+    errno = response[0]
+    if errno:
+        raise Exception(f"{errno} found, error!")        
+    return response[-1]
+
+def _parse_add_module(response):
+    _check_errno(response, errors.Cyperus.E_BUS_NOT_FOUND)
+    return response[-4]
+
+def _notify(observers, path, data, result):
+    """Passes a mutation's outcome to observers with topology.Topology's
+    added_* and removed_* hooks"""
+    for observer in observers:
+        if path == "/cyperus/add/bus":
+            observer.added_bus(*data, result)
+        elif path == "/cyperus/add/connection":
+            observer.added_connection(*data, result)
+        elif path == "/cyperus/remove/connection":
+            observer.removed_connection(*data)
+        elif path.startswith("/cyperus/add/module/"):
+            observer.added_module(data[0], result, path, data[1:])
+
+def _raise_failed(results, phase):
+    """Raises the exceptions held in _Client._pipeline results, if any,
+    as one ExceptionGroup"""
+    failed = [result for result in results if isinstance(result, Exception)]
+    if failed:
+        raise ExceptionGroup(
+            f"{len(failed)} of {len(results)} {phase} requests failed",
+            failed
+        )
 
-        if not response:
-            return None            
-
-        clients = []
-        for client_addr in filter(None, response[-1].split('\n')):
-            client_id, ip, port, listener_enable = client_addr.split('|')
-            print('listener_enable', listener_enable)
-            print('listener_enable', bool(int(listener_enable)))            
-            clients.append({
-                'id': int(client_id),
-                'ip': ip,
-                'port': port,
-                'listener_enable': bool(int(listener_enable))
-            })
-        return clients
+def _stream_list_bus(parts):
+    for elem in _iter_lines(_iter_checked(parts, errors.Cyperus.E_BUS_NOT_FOUND)):
+        yield records.parse_bus(elem)
 
-    def add_osc_client(self, ip, port, listener_enable, blocking=True):
-        request_id = self._request("/cyperus/add/osc/client",
-                                   ip,
-                                   port,
-                                   listener_enable,
-                                   "ssb")
-        if not blocking:
-            response = self._get_response_nonblocking(request_id)
-        else:
-            response = self._get_response_blocking(request_id)
+def _stream_list_bus_port(parts):
+    yield from _iter_ports(_iter_lines(_iter_checked(parts, errors.Cyperus.E_BUS_NOT_FOUND)))
 
-        if not response:
-            return None
+def _stream_list_module(parts):
+    for elem in _iter_lines(_iter_checked(parts, errors.Cyperus.E_BUS_NOT_FOUND)):
+        yield records.parse_module(elem)
 
-        if response[0] == 0:
-            return True
-        return False
+def _stream_list_module_port(parts):
+    yield from _iter_ports(_iter_lines(_iter_checked(parts, errors.Cyperus.E_MODULE_NOT_FOUND)))
 
-    
-    def list_main(self, blocking=True):
-        request_id = self._request("/cyperus/list/main")
 
-        if not blocking:
-            response = self._get_response_nonblocking(request_id)
-        else:
-            response = self._get_response_blocking(request_id)
+# ids are a random per-process prefix and a count.  next() on a count is
+# atomic, so ids stay unique across caller threads; the prefix keeps them
+# apart from other processes' and from late answers to an earlier one's.
+_request_prefix = secrets.token_hex(4)
+_request_ids = itertools.count(1)
 
-        if not response:
-            return None            
-        
-        mains = {'in': [],
-                 'out': []}
-        raw_mains = response[-1].split('\n')
-        outs = False
-        for elem in filter(None, raw_mains):
-            if elem in 'out:':
-                outs = True
-            elif elem in 'in:':
-                pass
-            elif outs:
-                mains['out'].append(elem)
-            else:
-                mains['in'].append(elem)
-        return mains
+def _reset_request_ids():
+    global _request_prefix, _request_ids
+    _request_prefix = secrets.token_hex(4)
+    _request_ids = itertools.count(1)
 
-    def list_bus(self, bus_id, list_type, blocking=True):
-        request_id = self._request(
-            "/cyperus/list/bus",
-            bus_id,
-            list_type,
-            'si'
-        )
+os.register_at_fork(after_in_child=_reset_request_ids)
 
-        if not blocking:
-            response = self._get_response_nonblocking(request_id)
-        else:
-            response = self._get_response_blocking(request_id)
+def _next_request_id():
+    return f"{_request_prefix}-{next(_request_ids):x}"
 
-        if not response:
-            return None
-            
-        errno = response[1]
-        if errno == errors.Cyperus.E_BUS_NOT_FOUND.value:
-            raise ExceptionGroup(
-                "The target bus does not exist",
-                [
-                    exceptions.BusNotFound(),
-                    exceptions.CyperusException()
-                ]
-            )
-        
-        bus_list = []
-        for bus in list(filter(None, response[-1].split('\n'))):
-            bus_id, name, ins_count, outs_count = bus.split('|')
-            bus_list.append({
-                'id': bus_id,
-                'name': name,
-                'ins_count': ins_count,
-                'outs_count': outs_count
-            })
-        return bus_list
+_PADDING = (b'\0\0\0\0', b'\0\0\0', b'\0\0', b'\0')
+_INT = struct.Struct('>i')
+_FLOAT = struct.Struct('>f')
 
-    def list_bus_port(self, bus_id, blocking=True):
-        request_id = self._request(
-            "/cyperus/list/bus_port",
-            bus_id,
-            's'
-        )
+def _pad(data):
+    return data + _PADDING[len(data) & 3]
 
-        if not blocking:
-            response = self._get_response_nonblocking(request_id)
+def _type_tags(data):
+    tags = []
+    for arg in data:
+        kind = type(arg)
+        if kind is str:
+            tags.append('s')
+        elif kind is float:
+            tags.append('f')
+        elif kind is int:
+            tags.append('i')
+        elif kind is bool:
+            tags.append('T' if arg else 'F')
         else:
-            response = self._get_response_blocking(request_id)
-
-        if not response:
             return None
-            
-        errno = response[1]
-        if errno == errors.Cyperus.E_BUS_NOT_FOUND.value:
-            raise ExceptionGroup(
-                "The target bus does not exist",
-                [
-                    exceptions.BusNotFound(),
-                    exceptions.CyperusException()
-                ]
-            )
-        
-        bus_ports = {'in': [],
-                 'out': []}
-        raw_bus_ports = response[-1].split('\n')
-        outs = False
-        for elem in filter(None, raw_bus_ports):
-            if elem in 'out:':
-                outs = True
-            elif elem in 'in:':
-                pass
-            elif outs:
-                bus_port_id, name = elem.split('|')
-                bus_ports['out'].append({
-                    'id': bus_port_id,
-                    'name': name
-                })
+    return ''.join(tags)
+
+def _read_string(dgram, offset):
+    end = dgram.index(b'\0', offset)
+    return dgram[offset:end].decode(), (end + 4) & ~3
+
+def _decode_message(dgram):
+    """Decodes the argument types cyperus-server sends; anything else is
+    left to python-osc.  Returns (address, args), or None if the datagram
+    is not a valid message."""
+    try:
+        address, offset = _read_string(dgram, 0)
+        if dgram[offset:offset + 1] != b',':
+            return address, ()
+        tags, offset = _read_string(dgram, offset)
+        args = []
+        for tag in tags[1:]:
+            if tag == 's':
+                value, offset = _read_string(dgram, offset)
+            elif tag == 'i':
+                value = _INT.unpack_from(dgram, offset)[0]
+                offset += 4
+            elif tag == 'f':
+                value = _FLOAT.unpack_from(dgram, offset)[0]
+                offset += 4
+            elif tag == 'T':
+                value = True
+            elif tag == 'F':
+                value = False
             else:
-                bus_port_id, name = elem.split('|')
-                bus_ports['in'].append({
-                    'id': bus_port_id,
-                    'name': name
-                })
-        return bus_ports
-
-    def add_bus(self, bus_id, name, in_names, out_names, blocking=True):
-        request_id = self._request(
-            "/cyperus/add/bus",
-            bus_id,
-            name,
-            in_names,
-            out_names
-        )
-
-        if not blocking:
-            response = self._get_response_nonblocking(request_id)
-        else:
-            response = self._get_response_blocking(request_id)
-
-        if not response:
-            return None
-        
-        errno = response[1]
-        if errno == errors.Cyperus.E_BUS_NOT_FOUND.value:
-            raise ExceptionGroup(
-                "The target bus does not exist",
-                [
-                    exceptions.BusNotFound(),
-                    exceptions.CyperusException()
-                ]
-            )
-        
-        return response[-1]
-
-    def add_connection(self, port_id_out, port_id_in, blocking=True):
-        request_id = self._request(
-            "/cyperus/add/connection",
-            port_id_out,
-            port_id_in
-        )
-
-        if not blocking:
-            response = self._get_response_nonblocking(request_id)
-        else:
-            response = self._get_response_blocking(request_id)
+                message = osc_message.OscMessage(dgram)
+                return message.address, message.params
+            args.append(value)
+        return address, args
+    except (ValueError, struct.error, osc_message.ParseError):
+        return None
+
+
+class _MessageEncoder():
+    """Encodes OSC messages without OscMessageBuilder: the padded address
+    and type tag string are built once per (path, tags) and arguments are
+    packed into a reusable per-thread buffer.  The returned memoryview is
+    only valid until the same thread encodes again."""
+
+    def __init__(self, size=65536):
+        self.size = size
+        self.prefixes = {}
+        self.local = threading.local()
+
+    def _prefix(self, path, tags):
+        key = (path, tags)
+        prefix = self.prefixes.get(key)
+        if prefix is None:
+            prefix = _pad(path.encode()) + _pad(f",{tags}".encode())
+            self.prefixes[key] = prefix
+        return prefix
+
+    def _build(self, path, data):
+        builder = osc_message_builder.OscMessageBuilder(address=path)
+        for arg in data:
+            builder.add_arg(arg)
+        return builder.build().dgram
+
+    def encode(self, path, data):
+        tags = _type_tags(data)
+        if tags is None:
+            return self._build(path, data)
+        buffer = getattr(self.local, 'buffer', None)
+        if buffer is None:
+            buffer = self.local.buffer = bytearray(self.size)
+        prefix = self._prefix(path, tags)
+        offset = len(prefix)
+        buffer[:offset] = prefix
+        try:
+            for tag, arg in zip(tags, data):
+                if tag == 's':
+                    encoded = arg.encode()
+                    end = offset + len(encoded)
+                    buffer[offset:end] = encoded
+                    padding = _PADDING[len(encoded) & 3]
+                    offset = end + len(padding)
+                    buffer[end:offset] = padding
+                elif tag == 'i':
+                    _INT.pack_into(buffer, offset, arg)
+                    offset += 4
+                elif tag == 'f':
+                    _FLOAT.pack_into(buffer, offset, arg)
+                    offset += 4
+        except struct.error:
+            return self._build(path, data)
+        return memoryview(buffer)[:offset]
+
+
+# bundle timetags are NTP times; 1 means "immediately"
+_IMMEDIATELY = 1
+_NTP_EPOCH = 2208988800
+_TIMETAG = struct.Struct('>Q')
+_BUNDLE_HEADER = b'#bundle\0'
+# the largest UDP payload that fits an Ethernet frame unfragmented
+BUNDLE_SIZE = 1472
+
+def _timetag(when):
+    """NTP timetag for a time.time() value, or immediately for None"""
+    if when is None:
+        return _IMMEDIATELY
+    seconds, fraction = divmod(when + _NTP_EPOCH, 1)
+    return (int(seconds) << 32) | int(fraction * 2 ** 32)
+
+
+class _Bundler():
+    """Packs encoded messages into OSC bundles of at most size bytes, all
+    carrying the same timetag, and sends each one as it fills up.  A
+    message too large to share a bundle goes out alone in one that is."""
+
+    def __init__(self, sock, address, size=BUNDLE_SIZE, timetag=None):
+        self.sock = sock
+        self.address = address
+        self.size = size
+        self.timetag = timetag
+        self.header = _BUNDLE_HEADER + _TIMETAG.pack(_timetag(timetag))
+        self.buffer = bytearray(self.header)
+        self.count = 0
+        self.datagrams = 0
+        self.messages = 0
+
+    def add(self, message):
+        if self.count and len(self.buffer) + 4 + len(message) > self.size:
+            self.flush()
+        self.buffer += _INT.pack(len(message))
+        self.buffer += message
+        self.count += 1
+
+    def flush(self):
+        if not self.count:
+            return
+        self.sock.sendto(self.buffer, self.address)
+        self.datagrams += 1
+        self.messages += self.count
+        self.clear()
+
+    def clear(self):
+        del self.buffer[len(self.header):]
+        self.count = 0
+
+
+class _PendingRequest():
+    """Response parts collected for one request id.  A response may span
+    several datagrams; every part but the last carries a set multipart
+    flag."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self.sent = time.perf_counter()
+        self.deadline = None
+        self.parts = []
+        self.response = None
+        self.done = False
+        self.expired = False
+        self.condition = threading.Condition()
+        self.metrics = None
+        # set for requests that may be retransmitted
+        self.request_id = None
+        self.data = None
+        self.keyed = False
+        self.attempts = 1
+        self.aliases = []
+        self.transmissions = None
+        self.source = None
+        self.completed = None
+        # the part with the multipart flag clear, held back until the
+        # response checks out or REORDER_WINDOW passes
+        self.final = None
+        self.malformed = None
+        self.error = None
+        # parts taken so far, and whether a waiter that retransmits is
+        # left to retry a response that did not check out
+        self.progress = 0
+        self.restartable = False
+        self.stalled = False
+        self.abandoned = set()
+
+    def add_part(self, args, source=None):
+        """Returns the assembled response once the last part is in and it
+        reads as a whole, None before that and False for a part that
+        duplicates one already taken: anything after completion, or from
+        a transmission other than the one that answered first or than one
+        given up on by restart().  Parts arriving after the final one are
+        placed before it."""
+        with self.condition:
+            if self.done or source in self.abandoned:
+                return False
+            if source != self.source:
+                if self.parts or self.final is not None:
+                    return False
+                self.source = source
+                if self.transmissions is not None:
+                    self.sent = self.transmissions.get(source, self.sent)
+            if args[1]:
+                self.parts.append(args)
+                self.progress += 1
+                self.condition.notify_all()
+                if self.final is None:
+                    return None
+            elif self.final is not None:
+                return False
+            else:
+                self.final = args
+                self.progress += 1
+            parts = self.parts + [self.final]
+            response = _assemble_parts(parts)
+            if not _well_formed(self.path, response, parts):
+                if self.malformed is None:
+                    self.malformed = time.monotonic()
+                self.condition.notify_all()
+                return None
+            self.completed = time.perf_counter()
+            self.response = response
+            return response
+
+    def set(self):
+        with self.condition:
+            self.done = True
+            self.condition.notify_all()
+
+    def expire(self):
+        with self.condition:
+            self.expired = True
+            self.done = True
+            self.condition.notify_all()
+
+    def fail(self):
+        with self.condition:
+            self.error = _malformed(self.path)
+            self.done = True
+            self.condition.notify_all()
+
+    def restart(self):
+        """Drops the parts collected so far, ahead of a retransmission.
+        Parts have no sequence numbers, so those of different
+        transmissions cannot be merged; the one given up on is ignored
+        from then on, unless it is keyed and so shares its id with the
+        next."""
+        with self.condition:
+            if self.source is not None and not self.keyed:
+                self.abandoned.add(self.source)
+            self.parts = []
+            self.final = None
+            self.source = None
+            self.malformed = None
+            self.stalled = False
+
+    def _wait_for(self, predicate, timeout):
+        """condition.wait_for, giving up on the response once its final
+        part has waited REORDER_WINDOW for the parts it is missing: it
+        fails, or is marked stalled for a restartable waiter to retry"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            while not predicate():
+                now = time.monotonic()
+                remaining = None if deadline is None else deadline - now
+                if self.malformed is not None and not self.done and not self.stalled:
+                    window = self.malformed + REORDER_WINDOW - now
+                    if window <= 0:
+                        if self.restartable:
+                            self.stalled = True
+                        else:
+                            self.fail()
+                        continue
+                    if remaining is None or window < remaining:
+                        remaining = window
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            return True
 
-        if not response:
-            return None
-        
-        errno = response[1]
-        if errno:
-            if errno == errors.Cyperus.E_PORT_OUT_NOT_FOUND.value:
+    def wait(self, timeout=None):
+        return self._wait_for(lambda: self.done, timeout)
+
+    def wait_progress(self, seen, timeout=None):
+        """Waits for a part beyond the first `seen`, completion or a stall"""
+        return self._wait_for(
+            lambda: self.done or self.stalled or self.progress != seen, timeout)
+
+    def iter_parts(self, timeout=None):
+        """Yields parts as they arrive.  A gap can only be detected once
+        the final part is in, so a MalformedResponse may follow parts
+        already yielded."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        index = 0
+        while True:
+            with self.condition:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if not self._wait_for(lambda: self.done or len(self.parts) > index,
+                                      remaining):
+                    raise exceptions.ResponseTimeout(
+                        "no response before the deadline")
+                parts = self.parts[index:]
+                done = self.done
+                if done and self.response is not None:
+                    parts.append(self.final)
+                expired = self.expired
+                error = self.error
+            index += len(parts)
+            yield from parts
+            if error is not None:
+                raise error
+            if expired:
+                raise exceptions.ResponseTimeout(
+                    "request expired before its response completed")
+            if done:
+                return
+
+
+class _PendingTable():
+    """Outstanding requests by id, oldest first.  Each entry expires ttl
+    seconds after it was sent whether or not anyone collects it, so
+    answers to nonblocking calls and to callers that gave up are not kept
+    forever, and at most capacity requests may be outstanding at once.
+
+    Expired entries are swept from the front on every add().  The most
+    recent `remember` ids that expired or were abandoned are kept so that
+    their responses can be counted as late rather than as orphans."""
+
+    def __init__(self, capacity=65536, ttl=60, remember=4096):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.remember = remember
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.forgotten = {}
+        self.expired = 0
+        self.abandoned = 0
+        self.late = 0
+        self.rejected = 0
+
+    def __contains__(self, request_id):
+        return request_id in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, request_id):
+        return self.entries.get(request_id)
+
+    def add(self, request_id, pending):
+        with self.lock:
+            now = time.monotonic()
+            self._sweep(now)
+            if len(self.entries) >= self.capacity:
+                self.rejected += 1
                 raise ExceptionGroup(
-                    "The target port out does not exist",
+                    f"{len(self.entries)} requests are already outstanding",
                     [
-                        exceptions.PortOutNotFound(),
-                        exceptions.CyperusException()
+                        exceptions.TooManyPendingRequests(),
+                        exceptions.RequestException()
                     ]
                 )
-            if errno == errors.Cyperus.E_PORT_IN_NOT_FOUND.value:
+            if request_id in self.entries:
                 raise ExceptionGroup(
-                    "The target port in does not exist",
+                    f"Request {request_id} is already outstanding",
                     [
-                        exceptions.PortInNotFound(),
-                        exceptions.CyperusException()
+                        exceptions.DuplicateRequestId(),
+                        exceptions.RequestException()
                     ]
                 )
-        
-        return response[-1]
+            pending.deadline = now + self.ttl
+            self.entries[request_id] = pending
+
+    def alias(self, request_id, pending):
+        """Files pending under a further id, as used by a retransmission,
+        unless it has expired or been collected meanwhile; returns whether
+        it was filed"""
+        with self.lock:
+            if self.entries.get(pending.request_id) is not pending:
+                return False
+            pending.aliases.append(request_id)
+            self.entries[request_id] = pending
+            return True
 
-    def remove_connection(self, connection_id, blocking=True):
-        request_id = self._request(
-            "/cyperus/remove/connection",
-            connection_id
-        )
+    def pop(self, request_id):
+        """Removes an entry and its aliases; one without a complete
+        response counts as abandoned"""
+        with self.lock:
+            pending = self.entries.pop(request_id, None)
+            if pending is None:
+                return None
+            for alias in pending.aliases:
+                self.entries.pop(alias, None)
+            if pending.response is None:
+                self.abandoned += 1
+                self._forget(request_id)
+            if pending.attempts > 1:
+                # answers to the other transmissions are still on their way
+                for alias in pending.aliases:
+                    self._forget(alias)
+                self._forget(request_id)
+            return pending
+
+    def discard(self, request_id):
+        """Accounts for a response nobody is waiting for; True if it
+        answers a request that expired or was abandoned"""
+        with self.lock:
+            if request_id in self.forgotten:
+                self.late += 1
+                return True
+            return False
+
+    def sweep(self):
+        with self.lock:
+            return self._sweep(time.monotonic())
+
+    def _sweep(self, now):
+        # entries share one ttl, so insertion order is deadline order
+        expired = []
+        for request_id, pending in self.entries.items():
+            if pending.deadline > now:
+                break
+            expired.append(request_id)
+        for request_id in expired:
+            pending = self.entries.pop(request_id, None)
+            if pending is None:
+                continue
+            pending.expire()
+            self._forget(request_id)
+            for alias in pending.aliases:
+                self.entries.pop(alias, None)
+                self._forget(alias)
+        self.expired += len(expired)
+        return len(expired)
+
+    def _forget(self, request_id):
+        self.forgotten[request_id] = None
+        if len(self.forgotten) > self.remember:
+            del self.forgotten[next(iter(self.forgotten))]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'outstanding': len(self.entries),
+                'capacity': self.capacity,
+                'expired': self.expired,
+                'abandoned': self.abandoned,
+                'late': self.late,
+                'rejected': self.rejected
+            }
 
-        if not blocking:
-            response = self._get_response_nonblocking(request_id)
+
+class _Client():
+    """Requests to paths in `retransmit` are resent whenever no part of
+    their response arrives for an adaptive timeout, or what arrived does
+    not read as a whole response, until it completes.  Each resend goes
+    under a fresh alias of the request id so the first transmission to
+    answer wins and the others' answers are discarded.  Streamed
+    responses are not retransmitted.  With `key` set every
+    request is sent under that id instead and retransmitted as is, so a
+    server that remembers request ids applies it only once."""
+
+    def __init__(self,
+                 port,
+                 pending,
+                 metrics=None,
+                 rtt=None,
+                 retransmit=(),
+                 sock=None,
+                 host='127.0.0.1'):
+        self.address = (host, port)
+        self.sock = sock if sock is not None else socket.socket(socket.AF_INET,
+                                                                 socket.SOCK_DGRAM)
+        self.encoder = _MessageEncoder()
+        self.pending = pending
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.rtt = rtt if rtt is not None else RttEstimator()
+        self.retransmit = retransmit
+        self.key = None
+        self.observers = []
+        self.routing = None
+        # connections sent but not yet answered, which the cycle check
+        # counts as made
+        self.queued = ()
+
+    def _request(self, path, *data, fields=None):
+        pending = _PendingRequest(path)
+        pending.metrics = self.metrics
+        if self.key is not None:
+            request_id = self.key
+            pending.keyed = True
         else:
-            response = self._get_response_blocking(request_id)
+            request_id = _next_request_id()
+        if pending.keyed or path in self.retransmit:
+            pending.request_id = request_id
+            pending.data = data
+        self.pending.add(request_id, pending)
+        self._send(path, (request_id,) + data)
+        self.metrics.sent(path)
+        return request_id
 
-        if not response:
-            return None        
-        
-        errno = response[1]
-        if errno:
-            if errno == errors.Cyperus.E_CONNECTION_NOT_FOUND.value:
-                raise ExceptionGroup(
-                    "The connection does not exist",
-                    [
-                        exceptions.ConnectionNotFound(),
-                        exceptions.CyperusException()
-                    ]
-                )
-        
-        return response[-1]
+    def _send(self, path, data):
+        self.sock.sendto(self.encoder.encode(path, data), self.address)
 
-    def list_module(self, bus_id, blocking=True):
-        request_id = self._request(
-            "/cyperus/list/module",
-            bus_id,
-            's'
-        )
+    def _resend(self, pending):
+        if pending.transmissions is None:
+            pending.transmissions = {pending.request_id: pending.sent}
+        if pending.keyed:
+            request_id = pending.request_id
+        else:
+            request_id = f"{pending.request_id}.{pending.attempts}"
+            if not self.pending.alias(request_id, pending):
+                return
+        pending.restart()
+        pending.attempts += 1
+        pending.transmissions[request_id] = time.perf_counter()
+        self.sock.sendto(self.encoder.encode(pending.path, (request_id,) + pending.data),
+                         self.address)
+        self.metrics.retransmitted(pending.path)
+
+    def _wait(self, request_id, deadline=None):
+        """Waits until the response arrives, deadline passes or the entry
+        expires, then removes the entry; returns it or None on timeout"""
+        pending = self.pending.get(request_id)
+        if pending is None:
+            return None
+        if deadline is None or deadline > pending.deadline:
+            deadline = pending.deadline
+        if pending.data is not None:
+            pending.restartable = True
+            rto = self.rtt.rto()
+            while True:
+                seen = pending.progress
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                pending.wait_progress(seen, min(rto, remaining))
+                if pending.done:
+                    break
+                if pending.progress != seen and not pending.stalled:
+                    continue
+                if time.monotonic() >= deadline:
+                    break
+                self._resend(pending)
+                rto = self.rtt.backoff(rto)
+        pending.wait(max(deadline - time.monotonic(), 0))
+        if not pending.done and pending.malformed is not None:
+            # left stalled at the deadline
+            pending.fail()
+        self.pending.pop(request_id)
+        if pending.error is not None:
+            return pending
+        if pending.response is None:
+            self.metrics.timeout(pending.path)
+            return None
+        if pending.data is not None and not (pending.keyed and pending.attempts > 1):
+            # a keyed answer can't be matched to its transmission (Karn)
+            self.rtt.sample(pending.completed - pending.sent)
+        return pending
 
+    def _get_response_blocking(self, request_id, timeout=20):
+        pending = self._wait(request_id,
+                             time.monotonic() + timeout if timeout > 0 else None)
+        if pending is None:
+            raise exceptions.ResponseTimeout(
+                f"no response to request {request_id}")
+        if pending.error is not None:
+            raise pending.error
+        return pending.response
+    
+    def _get_response_nonblocking(self, request_id):
+        pending = self.pending.get(request_id)
+        if pending is None or pending.response is None:
+            return None
+        self.pending.pop(request_id)
+        return pending.response
+
+    def _call(self, parser, path, *data, blocking=True):
+        request_id = self._request(path, *data)
         if not blocking:
             response = self._get_response_nonblocking(request_id)
         else:
             response = self._get_response_blocking(request_id)
+        result = _parse(parser, response, path) if response else None
+        if self.observers and response and response[0] == 0:
+            # an unanswered nonblocking call may not have been applied
+            _notify(self.observers, path, data, result)
+        return result
+
+    def _collect(self, request_id, parser, deadline):
+        pending = self._wait(request_id, deadline)
+        if pending is None:
+            return exceptions.ResponseTimeout(
+                f"no response to request {request_id}")
+        if pending.error is not None:
+            return pending.error
+        try:
+            return _parse(parser, pending.response, pending.path)
+        except Exception as exc:
+            return exc
+
+    def _pipeline(self, calls, max_in_flight=64, timeout=20):
+        """Sends (parser, path, *data) calls keeping at most max_in_flight
+        unanswered, and returns their results in call order.  A failed
+        call's slot holds the exception instead of raising it."""
+        results = []
+        sent = []
+        in_flight = collections.deque()
+        for parser, path, *data in calls:
+            if len(in_flight) >= max_in_flight:
+                results.append(self._collect(*in_flight.popleft()))
+            in_flight.append((self._request(path, *data),
+                              parser,
+                              time.monotonic() + timeout))
+            sent.append((path, data))
+        while in_flight:
+            results.append(self._collect(*in_flight.popleft()))
+        if self.observers:
+            for (path, data), result in zip(sent, results):
+                if not isinstance(result, Exception):
+                    _notify(self.observers, path, data, result)
+        return results
+
+    def _stream(self, parser, path, *data, timeout=20):
+        request_id = self._request(path, *data)
+        return self._iter_response(parser, request_id, timeout)
+
+    def _iter_response(self, parser, request_id, timeout):
+        """Parses parts as they arrive.  Parts already yielded cannot be
+        taken back, so a stream is never retransmitted: a lost part ends
+        it with a ResponseTimeout or a MalformedResponse."""
+        pending = self.pending.get(request_id)
+        if pending is None:
+            raise exceptions.ResponseTimeout(f"request {request_id} expired")
+        try:
+            yield from parser(pending.iter_parts(timeout if timeout > 0 else None))
+        except (ValueError, IndexError) as exc:
+            if isinstance(exc, exceptions.MalformedResponse):
+                raise
+            raise _malformed(pending.path) from exc
+        except exceptions.ResponseTimeout:
+            self.metrics.timeout(pending.path)
+            raise
+        finally:
+            self.pending.pop(request_id)
 
-        if not response:
-            return None
-        
-        errno = response[1]
-        if errno == errors.Cyperus.E_BUS_NOT_FOUND.value:
-            raise ExceptionGroup(
-                "The target module does not exist",
-                [
-                    exceptions.BusNotFound(),
-                    exceptions.CyperusException()
-                ]
-            )
+    def list_osc_client(self, blocking=True):
+        return self._call(_parse_list_osc_client,
+                          "/cyperus/list/osc/client",
+                          blocking=blocking)
 
-        modules = []
-        for module in list(filter(None, response[-1].split('\n'))):
-            module_id, name = module.split('|')
-            modules.append({
-                'id': module_id,
-                'name': name
-            })
-        return modules
+    def add_osc_client(self, ip, port, listener_enable, blocking=True):
+        return self._call(_parse_add_osc_client,
+                          "/cyperus/add/osc/client",
+                          ip,
+                          port,
+                          listener_enable,
+                          "ssb",
+                          blocking=blocking)
 
-    def list_module_port(self, module_id, blocking=True):
-        request_id = self._request(
-            "/cyperus/list/module_port",
-            module_id,
-            's'
-        )
+    def list_main(self, blocking=True):
+        return self._call(_parse_list_main,
+                          "/cyperus/list/main",
+                          blocking=blocking)
 
-        if not blocking:
-            response = self._get_response_nonblocking(request_id)
-        else:
-            response = self._get_response_blocking(request_id)
+    def list_bus(self, bus_id, list_type, blocking=True):
+        return self._call(_parse_list_bus,
+                          "/cyperus/list/bus",
+                          bus_id,
+                          list_type,
+                          'si',
+                          blocking=blocking)
 
-        if not response:
-            return None
-        
-        errno = response[1]
-        if errno == errors.Cyperus.E_MODULE_NOT_FOUND.value:
-            raise ExceptionGroup(
-                "The target module does not exist",
-                [
-                    exceptions.ModuleNotFound(),
-                    exceptions.CyperusException()
-                ]
-            )
-        
-        module_ports = {'in': [],
-                 'out': []}
-        raw_module_ports = response[-1].split('\n')
-        outs = False
-        for elem in filter(None, raw_module_ports):
-            if elem in 'out:':
-                outs = True
-            elif elem in 'in:':
-                pass
-            elif outs:
-                module_port_id, name = elem.split('|')
-                module_ports['out'].append({
-                    'id': module_port_id,
-                    'name': name
-                })
-            else:
-                module_port_id, name = elem.split('|')
-                module_ports['in'].append({
-                    'id': module_port_id,
-                    'name': name
-                })
-        return module_ports
+    def list_bus_port(self, bus_id, blocking=True):
+        return self._call(_parse_list_bus_port,
+                          "/cyperus/list/bus_port",
+                          bus_id,
+                          's',
+                          blocking=blocking)
+
+    def add_bus(self, bus_id, name, in_names, out_names, blocking=True):
+        return self._call(_parse_add_bus,
+                          "/cyperus/add/bus",
+                          bus_id,
+                          name,
+                          in_names,
+                          out_names,
+                          blocking=blocking)
+
+    def add_connection(self, port_id_out, port_id_in, blocking=True):
+        if self.routing is not None:
+            self.routing.check(port_id_out, port_id_in, self.queued)
+        return self._call(_parse_add_connection,
+                          "/cyperus/add/connection",
+                          port_id_out,
+                          port_id_in,
+                          blocking=blocking)
+
+    def remove_connection(self, connection_id, blocking=True):
+        return self._call(_parse_remove_connection,
+                          "/cyperus/remove/connection",
+                          connection_id,
+                          blocking=blocking)
+
+    def list_module(self, bus_id, blocking=True):
+        return self._call(_parse_list_module,
+                          "/cyperus/list/module",
+                          bus_id,
+                          's',
+                          blocking=blocking)
+
+    def list_module_port(self, module_id, blocking=True):
+        return self._call(_parse_list_module_port,
+                          "/cyperus/list/module_port",
+                          module_id,
+                          's',
+                          blocking=blocking)
 
     def get_system_env_variable(self, var_name, blocking=True):
-        request_id = self._request(
-            "/cyperus/get/system/env_variable",
-            var_name
-        )
-        
-        if not blocking:
-            response = self._get_response_nonblocking(request_id)
-        else:
-            response = self._get_response_blocking(request_id)
-            
-        if not response:
-            return None
-            
-        errno = response[1]
-        if errno:
-            raise Exception(f"{errno} found, error!")        
-        return response[-1]
+        return self._call(_parse_get_system_env_variable,
+                          "/cyperus/get/system/env_variable",
+                          var_name,
+                          blocking=blocking)
     
     def add_modules_oscillator_sine(self,
                                     bus_id,
@@ -700,32 +1433,13 @@ class _Client():
                                     amplitude,
                                     phase,
                                     blocking=True):
-        request_id = self._request(
-            "/cyperus/add/module/oscillator/sine",
-            bus_id,
-            float(frequency),
-            float(amplitude),
-            float(phase)
-        )
-
-        if not blocking:
-            response = self._get_response_nonblocking(request_id)
-        else:
-            response = self._get_response_blocking(request_id)
-
-        if not response:
-            return None
-        
-        errno = response[1]
-        if errno == errors.Cyperus.E_BUS_NOT_FOUND.value:
-            raise ExceptionGroup(
-                "The target bus does not exist",
-                [
-                    exceptions.BusNotFound(),
-                    exceptions.CyperusException()
-                ]
-            )
-        return response[-4]
+        return self._call(_parse_add_module,
+                          "/cyperus/add/module/oscillator/sine",
+                          bus_id,
+                          float(frequency),
+                          float(amplitude),
+                          float(phase),
+                          blocking=blocking)
 
     def add_modules_envelope_follower(self,
                                       bus_id,
@@ -733,49 +1447,158 @@ class _Client():
                                       decay,
                                       scale,
                                       blocking=True):
-        request_id = self._request(
-            "/cyperus/add/module/envelope/follower",
-            bus_id,
-            float(attack),
-            float(decay),
-            float(scale)
-        )
+        return self._call(_parse_add_module,
+                          "/cyperus/add/module/envelope/follower",
+                          bus_id,
+                          float(attack),
+                          float(decay),
+                          float(scale),
+                          blocking=blocking)
+
+    def stream_bus(self, bus_id, list_type, timeout=20):
+        return self._stream(_stream_list_bus,
+                            "/cyperus/list/bus",
+                            bus_id,
+                            list_type,
+                            'si',
+                            timeout=timeout)
+
+    def stream_bus_port(self, bus_id, timeout=20):
+        return self._stream(_stream_list_bus_port,
+                            "/cyperus/list/bus_port",
+                            bus_id,
+                            's',
+                            timeout=timeout)
+
+    def stream_module(self, bus_id, timeout=20):
+        return self._stream(_stream_list_module,
+                            "/cyperus/list/module",
+                            bus_id,
+                            's',
+                            timeout=timeout)
+
+    def stream_module_port(self, module_id, timeout=20):
+        return self._stream(_stream_list_module_port,
+                            "/cyperus/list/module_port",
+                            module_id,
+                            's',
+                            timeout=timeout)
+
+
+class _CachingClient(_Client):
+    """Serves list_* calls from a topology.Topology and writes successful
+    mutations through to it.  A listing fetched on a miss is only cached
+    if no mutation or refresh changed the topology while it was in
+    flight."""
+
+    def __init__(self,
+                 port,
+                 pending,
+                 topology,
+                 metrics=None,
+                 rtt=None,
+                 retransmit=(),
+                 sock=None,
+                 host='127.0.0.1'):
+        super().__init__(port, pending, metrics, rtt, retransmit, sock, host)
+        self.topology = topology
 
-        if not blocking:
-            response = self._get_response_nonblocking(request_id)
-        else:
-            response = self._get_response_blocking(request_id)
+    def list_bus(self, bus_id, list_type, blocking=True):
+        generation = self.topology.generation
+        bus_list = self.topology.get_bus_list(bus_id, list_type)
+        if bus_list is None:
+            bus_list = super().list_bus(bus_id, list_type, blocking)
+            if bus_list is not None:
+                self.topology.put_bus_list(bus_id, list_type, bus_list, generation)
+        return bus_list
 
-        if not response:
-            return None
-        
-        errno = response[1]
-        if errno == errors.Cyperus.E_BUS_NOT_FOUND.value:
-            raise ExceptionGroup(
-                "The target bus does not exist",
-                [
-                    exceptions.BusNotFound(),
-                    exceptions.CyperusException()
-                ]
-            )
-        return response[-4]    
+    def list_bus_port(self, bus_id, blocking=True):
+        generation = self.topology.generation
+        bus_ports = self.topology.get_bus_ports(bus_id)
+        if bus_ports is None:
+            bus_ports = super().list_bus_port(bus_id, blocking)
+            if bus_ports is not None:
+                self.topology.put_bus_ports(bus_id, bus_ports, generation)
+        return bus_ports
 
-    
-class Api():
-    def __init__(self, port_receive, port_send):
-        self.port_receive = port_receive
-        self.port_send = port_send
-        self.submitted_requests = set()
-        self.responses = {}        
-        self.server = _Server(port_receive, self.submitted_requests, self.responses)
-        if self.server.server_exc:
-            raise self.server.server_exc
-        else:
-            self.client = _Client(port_send, self.submitted_requests, self.responses)
+    def list_module(self, bus_id, blocking=True):
+        generation = self.topology.generation
+        modules = self.topology.get_modules(bus_id)
+        if modules is None:
+            modules = super().list_module(bus_id, blocking)
+            if modules is not None:
+                self.topology.put_modules(bus_id, modules, generation)
+        return modules
+
+    def list_module_port(self, module_id, blocking=True):
+        generation = self.topology.generation
+        module_ports = self.topology.get_module_ports(module_id)
+        if module_ports is None:
+            module_ports = super().list_module_port(module_id, blocking)
+            if module_ports is not None:
+                self.topology.put_module_ports(module_id, module_ports, generation)
+        return module_ports
+
+    def add_bus(self, bus_id, name, in_names, out_names, blocking=True):
+        new_id = super().add_bus(bus_id, name, in_names, out_names, blocking)
+        if new_id is not None:
+            self.topology.added_bus(bus_id, name, in_names, out_names, new_id)
+        return new_id
+
+    def add_connection(self, port_id_out, port_id_in, blocking=True):
+        new_id = super().add_connection(port_id_out, port_id_in, blocking)
+        if new_id is not None:
+            self.topology.added_connection(port_id_out, port_id_in, new_id)
+        return new_id
+
+    def remove_connection(self, connection_id, blocking=True):
+        result = super().remove_connection(connection_id, blocking)
+        if result is not None:
+            self.topology.removed_connection(connection_id)
+        return result
+
+    def add_modules_oscillator_sine(self,
+                                    bus_id,
+                                    frequency,
+                                    amplitude,
+                                    phase,
+                                    blocking=True):
+        new_id = super().add_modules_oscillator_sine(bus_id,
+                                                     frequency,
+                                                     amplitude,
+                                                     phase,
+                                                     blocking)
+        if new_id is not None:
+            self.topology.added_module(bus_id, new_id)
+        return new_id
+
+    def add_modules_envelope_follower(self,
+                                      bus_id,
+                                      attack,
+                                      decay,
+                                      scale,
+                                      blocking=True):
+        new_id = super().add_modules_envelope_follower(bus_id,
+                                                       attack,
+                                                       decay,
+                                                       scale,
+                                                       blocking)
+        if new_id is not None:
+            self.topology.added_module(bus_id, new_id)
+        return new_id
+
+
+class _ApiBase():
+    """Argument validation shared by Api and AsyncApi; subclasses provide
+    self.client"""
+
+    LIST_TYPES = {
+        'ADJACENT_PEER':     ADJACENT_PEER,
+        'ALL_PEERS':         ALL_PEERS,
+        'DIRECT_DESCENDANT': DIRECT_DESCENDANT,
+        'ALL_DESCENDANTS':   ALL_DESCENDANTS
+    }
 
-    def close(self):
-        self.server.close()
-        
     def list_main(self):
         return self.client.list_main()
 
@@ -785,15 +1608,8 @@ class Api():
     def add_osc_client(self, ip, port, listener_enable):
         return self.client.add_osc_client(str(ip), str(port), listener_enable)
     
-    def list_bus(self, bus_id, list_type):
-        LIST_TYPES = {
-            'ADJACENT_PEER':     0,
-            'ALL_PEERS':         1,
-            'DIRECT_DESCENDANT': 2,
-            'ALL_DESCENDANTS':   3
-        }
-        if bus_id == None:
-            bus_id = ""
+    def _list_type(self, list_type):
+        LIST_TYPES = self.LIST_TYPES
         if not list_type:
             raise ExceptionGroup(
                 f"List type is missing, must be one of: {list(LIST_TYPES.keys())}",
@@ -810,7 +1626,12 @@ class Api():
                     exceptions.ApiException()
                 ]
             )
-        return self.client.list_bus(bus_id, LIST_TYPES[list_type])
+        return LIST_TYPES[list_type]
+
+    def list_bus(self, bus_id, list_type):
+        if bus_id == None:
+            bus_id = ""
+        return self.client.list_bus(bus_id, self._list_type(list_type))
 
     def list_bus_port(self, bus_id):
         if bus_id == None:
@@ -940,4 +1761,596 @@ class Api():
                                                          float(attack),
                                                          float(decay),
                                                          float(scale))
+
+
+class _BatchClient(_Client):
+    def __init__(self, client, bundler=None):
+        self.address = client.address
+        self.sock = client.sock
+        self.encoder = client.encoder
+        self.metrics = client.metrics
+        self.pending = client.pending
+        self.rtt = client.rtt
+        self.retransmit = client.retransmit
+        self.key = client.key
+        self.observers = client.observers
+        self.routing = client.routing
+        self.queued = []
+        self.bundler = bundler
+        if bundler is not None and bundler.timetag is not None:
+            # answers to scheduled bundles only come once they are due
+            self.retransmit = ()
+            self.key = None
+        self.requests = []
+
+    def _send(self, path, data):
+        if self.bundler is None:
+            super()._send(path, data)
+        else:
+            self.bundler.add(self.encoder.encode(path, data))
+
+    def _call(self, parser, path, *data, blocking=True):
+        self.requests.append((self._request(path, *data), parser, path, data))
+        if path == "/cyperus/add/connection":
+            self.queued.append(data)
+        return len(self.requests) - 1
+
+
+class _Batch(_ApiBase):
+    """Pipelines requests: each call is sent immediately and returns its
+    position in self.results; responses are gathered on exit (or by
+    gather()) in submission order.  A failed item holds the exception its
+    blocking call would have raised; unless raise_errors is False those
+    are re-raised together as an ExceptionGroup after gathering.
+
+        with api.batch() as b:
+            for port_out_id, port_in_id in wiring:
+                b.add_connection(port_out_id, port_in_id)
+        connection_ids = b.results
+
+    With a bundler, calls are instead packed into OSC bundles that are
+    sent as they fill up and when gathering starts."""
+
+    def __init__(self,
+                 client,
+                 timeout=20,
+                 raise_errors=True,
+                 topology=None,
+                 bundler=None):
+        self.client = _BatchClient(client, bundler)
+        self.timeout = timeout
+        self.raise_errors = raise_errors
+        self.topology = topology
+        self.results = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.gather()
+        else:
+            self._discard()
+
+    def _discard(self):
+        if self.client.bundler is not None:
+            self.client.bundler.clear()
+        for request_id, parser, path, data in self.client.requests:
+            self.client.pending.pop(request_id)
+        self.client.requests = []
+        self.client.queued = []
+
+    def gather(self):
+        if self.client.bundler is not None:
+            self.client.bundler.flush()
+        deadline = time.monotonic() + self.timeout
+        results = []
+        for request_id, parser, path, data in self.client.requests:
+            results.append(self.client._collect(request_id, parser, deadline))
+        failed = [result for result in results if isinstance(result, Exception)]
+        for (request_id, parser, path, data), result in zip(self.client.requests, results):
+            if self.client.observers and not isinstance(result, Exception):
+                _notify(self.client.observers, path, data, result)
+        self.client.requests = []
+        self.client.queued = []
+        self.results = results
+        if self.topology is not None:
+            self.topology.refresh()
+        if failed and self.raise_errors:
+            raise ExceptionGroup(
+                f"{len(failed)} of {len(results)} batched requests failed",
+                failed
+            )
+        return results
+
+
+class _Transaction(_ApiBase):
+    """Queues add_bus, add_connection, remove_connection and add_modules_*
+    calls, each returning a transaction.Ref to its eventual id, and
+    commits them pipelined on exit (or by commit()).  Refs, and their
+    ports by name, can be passed to later calls.  If any call fails,
+    those already applied are undone, pipelined, before the failures are
+    raised together as an ExceptionGroup; see transaction.py for what
+    can't be undone."""
+
+    def __init__(self,
+                 client,
+                 connections=None,
+                 topology=None,
+                 max_in_flight=64,
+                 timeout=20):
+        self.client = transaction._TransactionClient(client, connections)
+        self.topology = topology
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+
+    @property
+    def results(self):
+        return self.client.results
+
+    @property
+    def stranded(self):
+        """Ids of the buses and modules left in place by a rollback"""
+        return self.client.stranded
+
+    @property
+    def restored(self):
+        """The new id of every removed connection a rollback restored"""
+        return self.client.restored
+
+    def port(self, ref, name):
+        return ref.port(name)
+
+    def remove_connection(self, connection_id, ports=None):
+        """ports, (port out id, port in id), is needed when the connection
+        is not one known to the Api"""
+        if ports is not None:
+            self.client.connections[connection_id] = ports
+        return super().remove_connection(connection_id)
+
+    def commit(self):
+        try:
+            return self.client.commit(self.max_in_flight, self.timeout)
+        finally:
+            if self.topology is not None:
+                self.topology.refresh()
+
+
+class _Receiver():
+    """The receive side of one port: its _Server thread, pending-request
+    table and dsp load telemetry, plus a socket to send from.  Shared
+    receivers are reference counted by _acquire_receiver() and
+    _release_receiver() so that every Api in the process receiving on the
+    same port uses one bound socket and one thread."""
+
+    def __init__(self,
+                 port,
+                 metrics=None,
+                 max_outstanding=65536,
+                 request_ttl=60,
+                 dsp_load_window=4096,
+                 host='127.0.0.1'):
+        self.port = port
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.pending = _PendingTable(max_outstanding, request_ttl)
+        self.dsp_load = telemetry.DspLoad(dsp_load_window)
+        self.server = _Server(port, self.pending, self.metrics, self.dsp_load, host)
+        if self.server.server_exc:
+            raise self.server.server_exc
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.references = 0
+
+    def close(self):
+        self.server.close()
+        self.sock.close()
+
+
+_receivers = {}
+_receivers_lock = threading.Lock()
+
+def _acquire_receiver(port, **kwargs):
+    """Returns the process' shared receiver for port, starting it on first
+    use; the settings of later callers are ignored"""
+    with _receivers_lock:
+        receiver = _receivers.get(port)
+        if receiver is None:
+            receiver = _receivers[port] = _Receiver(port, **kwargs)
+        receiver.references += 1
+        return receiver
+
+def _release_receiver(receiver):
+    with _receivers_lock:
+        receiver.references -= 1
+        if receiver.references:
+            return
+        del _receivers[receiver.port]
+    receiver.close()
+
+
+class _Idempotent(_ApiBase):
+    """Sends every call under one idempotency key and retransmits it until
+    answered; see Api.idempotent"""
+
+    def __init__(self, client, key):
+        self.client = copy.copy(client)
+        self.client.key = key
+
+
+class Api(_ApiBase):
+    """Blocking calls time out after 20 seconds with ResponseTimeout.
+    Every request, collected or not, is forgotten request_ttl seconds
+    after it was sent, and at most max_outstanding may be awaiting a
+    response at once; past that, requests raise TooManyPendingRequests.
+
+    With retransmit set, read-only queries lost on the way to or from the
+    server are resent after an adaptive timeout derived from the measured
+    round-trip time, doubling on each further attempt.
+
+    With shared set, every Api in the process created with the same
+    port_receive is served by one receive socket and thread, started by
+    the first and stopped when the last is closed.  Each keeps its own
+    cache and metrics; responses are routed back by request id.  The
+    request table, dsp load and the counts of orphan responses belong to
+    the shared receiver (self.receiver), configured by whichever Api
+    started it.
+
+    host is the address of the server; bind_host the local address the
+    server's responses arrive on, which has to be reachable from it.
+
+    An Api may be called from any number of threads at once.  Every
+    request gets its own id and its own entry in the request table, whose
+    changes are made under one lock; the receive thread hands a response
+    only to the entry it answers, and only that request's caller removes
+    it.  Metrics, the round-trip estimator, the topology cache, name
+    index, signal graph and recorder each take their own lock, and
+    names() and routing() build theirs once however many threads ask.
+    Calls from different threads are not ordered with respect to each
+    other: concurrent mutations reach the server in whatever order they
+    are sent.  A batch or transaction belongs to the thread using it, and
+    requests sent under one idempotency key may not overlap; a second
+    raises DuplicateRequestId."""
+
+    def __init__(self,
+                 port_receive,
+                 port_send,
+                 cache=False,
+                 cache_ttl=None,
+                 dsp_load_window=4096,
+                 max_outstanding=65536,
+                 request_ttl=60,
+                 retransmit=False,
+                 shared=False,
+                 host='127.0.0.1',
+                 bind_host='127.0.0.1'):
+        self.port_receive = port_receive
+        self.port_send = port_send
+        self.topology = None
+        self.name_index = None
+        self.signal_graph = None
+        self.metrics = Metrics()
+        self.rtt = RttEstimator()
+        self.automations = []
+        self.lock = threading.Lock()
+        self.closed = False
+        retransmit_paths = READ_ONLY_PATHS if retransmit else ()
+        self.shared = shared
+        if shared:
+            self.receiver = _acquire_receiver(port_receive,
+                                              max_outstanding=max_outstanding,
+                                              request_ttl=request_ttl,
+                                              dsp_load_window=dsp_load_window,
+                                              host=bind_host)
+        else:
+            self.receiver = _Receiver(port_receive,
+                                      self.metrics,
+                                      max_outstanding,
+                                      request_ttl,
+                                      dsp_load_window,
+                                      bind_host)
+        self.pending = self.receiver.pending
+        self.dsp_load = self.receiver.dsp_load
+        self.server = self.receiver.server
+        if cache:
+            self.topology = topology.Topology(cache_ttl)
+            self.client = _CachingClient(port_send,
+                                         self.pending,
+                                         self.topology,
+                                         self.metrics,
+                                         self.rtt,
+                                         retransmit_paths,
+                                         self.receiver.sock,
+                                         host)
+        else:
+            self.client = _Client(port_send,
+                                  self.pending,
+                                  self.metrics,
+                                  self.rtt,
+                                  retransmit_paths,
+                                  self.receiver.sock,
+                                  host)
+        self.recorder = patch.Recorder()
+        self.client.observers.append(self.recorder)
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+        for sender in self.automations:
+            sender.close()
+        if self.shared:
+            _release_receiver(self.receiver)
+        else:
+            self.receiver.close()
+        self.metrics.close()
+
+    def stats(self):
+        """Per-path request, response, timeout, orphan and errno counts
+        with round-trip quantiles; see metrics.Metrics.stats"""
+        return self.metrics.stats()
+
+    def pending_stats(self):
+        """Outstanding requests and counts of those expired, abandoned by
+        their caller, answered late or rejected at capacity"""
+        return self.pending.stats()
+
+    def idempotent(self, key):
+        """Returns a view of this Api that sends its calls under request id
+        `key` and retransmits them like read-only queries, for mutations
+        that may be repeated safely or a server that drops repeated
+        request ids.  Only one request per key may be outstanding.
+
+            bus_id = api.idempotent('fx-bus').add_bus('', 'fx', 'in', 'out')
+        """
+        return _Idempotent(self.client, key)
+
+    def automation(self, rate=100):
+        """Returns an automation.Automation sending fire-and-forget
+        parameter edits through this Api, closed along with it"""
+        sender = automation.Automation(self.client, rate)
+        self.automations.append(sender)
+        return sender
+
+    def write_prometheus(self, filename):
+        self.metrics.write_prometheus(filename)
+
+    def serve_prometheus(self, port, host='127.0.0.1'):
+        return self.metrics.serve_prometheus(port, host)
+
+    def refresh(self):
+        """Drops everything the topology cache holds, if enabled"""
+        if self.topology is not None:
+            self.topology.refresh()
+
+    def batch(self,
+              timeout=20,
+              raise_errors=True,
+              bundle=False,
+              timetag=None,
+              bundle_size=BUNDLE_SIZE):
+        """Batched calls bypass the topology cache, which is dropped once
+        the batch has been gathered.
+
+        With bundle set, or a timetag given, the calls are packed into as
+        few OSC bundles of at most bundle_size bytes as they fit.  A
+        timetag, a time.time() value, asks the server to apply every call
+        in the batch together at that time; timeout then counts from
+        gathering and has to cover the wait.
+
+            with api.batch(timetag=time.time() + 0.5) as b:
+                for connection_id in old:
+                    b.remove_connection(connection_id)
+                for port_out_id, port_in_id in new:
+                    b.add_connection(port_out_id, port_in_id)
+        """
+        bundler = None
+        if bundle or timetag is not None:
+            bundler = _Bundler(self.client.sock,
+                               self.client.address,
+                               bundle_size,
+                               timetag)
+        return _Batch(self.client, timeout, raise_errors, self.topology, bundler)
+
+    def transaction(self, connections=None, max_in_flight=64, timeout=20):
+        """Returns a transaction whose calls are committed together or
+        undone; connections adds to those known to patch.Recorder
+
+            with api.transaction() as t:
+                bus = t.add_bus(main_id, 'fx', 'in', 'out')
+                sine = t.add_modules_oscillator_sine(bus, 440, 1, 0)
+                t.add_connection(t.port(sine, 'out'), t.port(bus, 'out'))
+                t.remove_connection(old_connection_id)
+        """
+        with self.recorder.lock:
+            known = dict(self.recorder.connections)
+        if self.topology is not None:
+            with self.topology.lock:
+                known.update(self.topology.connections)
+        known.update(connections or {})
+        return _Transaction(self.client, known, self.topology, max_in_flight, timeout)
+
+    def snapshot(self, max_in_flight=64, timeout=20):
+        """Crawls the whole server topology into an immutable
+        snapshot.Graph, bypassing the topology cache"""
+        return snapshot.crawl(self.client, max_in_flight, timeout)
+
+    def reconcile(self,
+                  desired,
+                  connections=None,
+                  dry_run=False,
+                  max_in_flight=64,
+                  timeout=20):
+        """Brings the live graph in line with a description (see
+        reconcile.py) and returns the reconcile.Plan; connections defaults
+        to those known to patch.Recorder"""
+        known = connections is not None
+        if connections is None:
+            with self.recorder.lock:
+                connections = dict(self.recorder.connections)
+            if self.topology is not None:
+                with self.topology.lock:
+                    connections.update(self.topology.connections)
+            known = bool(connections)
+        plan = reconcile.plan(self.client,
+                              desired,
+                              connections,
+                              max_in_flight,
+                              timeout)
+        if not dry_run:
+            if not known and any(port_out in plan.live.ports and port_in in plan.live.ports
+                                 for port_out, port_in in plan.add_connections):
+                raise ExceptionGroup(
+                    "No live connections are known to reconcile against, "
+                    "pass connections",
+                    [
+                        exceptions.UnknownConnections(),
+                        exceptions.ApiException()
+                    ]
+                )
+            reconcile.apply(self.client,
+                            plan,
+                            desired,
+                            self.topology,
+                            max_in_flight,
+                            timeout)
+        return plan
+
+    def save(self,
+             filename,
+             connections=None,
+             parameters=None,
+             max_in_flight=64,
+             timeout=20):
+        """Writes the live topology to filename and returns the
+        patch.Patch; see patch.Recorder for the connections and parameters
+        it knows"""
+        with self.recorder.lock:
+            known_connections = dict(self.recorder.connections)
+            known_parameters = {module_id: dict(values) for module_id, values
+                                in self.recorder.parameters.items()}
+        if self.topology is not None:
+            with self.topology.lock:
+                known_connections.update(self.topology.connections)
+        for sender in self.automations:
+            with sender.condition:
+                for module_id, module in sender.modules.items():
+                    known_parameters.setdefault(module_id, {}).update(
+                        (name, channel.value) for name, channel in module.channels.items())
+        known_connections.update(connections or {})
+        for module_id, values in (parameters or {}).items():
+            known_parameters.setdefault(module_id, {}).update(values)
+        saved = patch.crawl(self.client,
+                            known_connections,
+                            known_parameters,
+                            max_in_flight,
+                            timeout)
+        patch.save(filename, saved)
+        return saved
+
+    def restore(self, filename, max_in_flight=256, timeout=20):
+        """Recreates a saved topology and returns a dict from every saved
+        id to the new one"""
+        return patch.restore(self.client, patch.load(filename), max_in_flight, timeout)
+
+    def names(self, max_in_flight=64, timeout=20):
+        """Returns the names.NameIndex of this server's buses, modules and
+        ports, kept current by the mutations made through this Api
+
+            names = api.names()
+            api.add_connection(names.resolve('main/fx/oscillator_sine:out'),
+                               names.resolve('main:out_0'))
+        """
+        with self.lock:
+            if self.name_index is None:
+                # observing before the first crawl, which buffers what
+                # other threads change meanwhile
+                self.name_index = names.NameIndex()
+                self.client.observers.append(self.name_index)
+        self.name_index.sync(self.client, max_in_flight, timeout)
+        return self.name_index
+
+    def resolve(self, path):
+        """The id of the bus, module or port `path` names; see names()"""
+        return self.names().resolve(path)
+
+    def routing(self, connections=None, reject_cycles=None, max_in_flight=64, timeout=20):
+        """Returns the routing.SignalGraph of this server, kept current by
+        this Api; connections adds to those known to patch.Recorder, and
+        reject_cycles, unless None, makes add_connection refuse loops
+
+            graph = api.routing(reject_cycles=True)
+            graph.would_cycle(port_out_id, port_in_id)
+        """
+        with self.lock:
+            built = self.signal_graph is None
+            if built:
+                with self.recorder.lock:
+                    known = dict(self.recorder.connections)
+                if self.topology is not None:
+                    with self.topology.lock:
+                        known.update(self.topology.connections)
+                known.update(connections or {})
+                graph = routing.SignalGraph(self.client)
+                graph.load(snapshot.crawl(self.client, max_in_flight, timeout), known)
+                self.signal_graph = graph
+                self.client.observers.append(graph)
+                self.client.routing = graph
+        if not built:
+            if connections is not None:
+                for connection_id, (port_out_id, port_in_id) in connections.items():
+                    self.signal_graph.add_connection(connection_id, port_out_id, port_in_id)
+            self.signal_graph.sync(max_in_flight, timeout)
+        if reject_cycles is not None:
+            self.signal_graph.reject_cycles = reject_cycles
+        return self.signal_graph
+
+    def iter_bus(self, bus_id, list_type, timeout=20):
+        """Like list_bus, but yields each bus as soon as the datagram
+        carrying it arrives instead of waiting for a multipart response
+        to complete"""
+        if bus_id == None:
+            bus_id = ""
+        return self.client.stream_bus(bus_id, self._list_type(list_type), timeout)
+
+    def iter_bus_port(self, bus_id, timeout=20):
+        """Yields ('in' | 'out', port) pairs as they arrive"""
+        if not bus_id:
+            raise ExceptionGroup(
+                "Missing bus ID",
+                [
+                    exceptions.MissingBusId(),
+                    exceptions.ApiException()
+                ]
+            )
+        return self.client.stream_bus_port(bus_id, timeout)
+
+    def iter_module(self, bus_id, timeout=20):
+        if not bus_id:
+            raise ExceptionGroup(
+                "Missing bus ID",
+                [
+                    exceptions.MissingBusId(),
+                    exceptions.ApiException()
+                ]
+            )
+        return self.client.stream_module(bus_id, timeout)
+
+    def iter_module_port(self, module_id, timeout=20):
+        """Yields ('in' | 'out', port) pairs as they arrive"""
+        if not module_id:
+            raise ExceptionGroup(
+                "Missing module ID",
+                [
+                    exceptions.MissingModuleId(),
+                    exceptions.ApiException()
+                ]
+            )
+        return self.client.stream_module_port(module_id, timeout)
     
@@ -0,0 +1,290 @@
+''' reconcile.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# A desired patch is described as data:
+#
+#     {
+#         'buses': {
+#             'main':    {'ins': 'in_0,in_1', 'outs': 'out_0,out_1'},
+#             'main/fx': {'ins': 'in_0', 'outs': 'out_0',
+#                         'modules': [{'type': 'oscillator_sine',
+#                                      'frequency': 440.0,
+#                                      'amplitude': 1.0,
+#                                      'phase': 0.0}]},
+#         },
+#         'connections': [
+#             ('main/fx/oscillator_sine:out', 'main/fx:out_0'),
+#         ]
+#     }
+#
+# Buses are keyed by their path from the root and modules by their name
+# ('name', defaulting to 'type'), with 'name#n' for the n-th repeat.  Port
+# references are '<bus or module path>:<port name>'.  The server cannot
+# remove buses or modules, so those not described are left alone.
+
+from pycyperus import exceptions
+from pycyperus import pycyperus
+from pycyperus import snapshot
+
+MODULE_TYPES = {
+    'oscillator_sine': ("/cyperus/add/module/oscillator/sine",
+                        ('frequency', 'amplitude', 'phase')),
+    'envelope_follower': ("/cyperus/add/module/envelope/follower",
+                          ('attack', 'decay', 'scale')),
+}
+
+
+class _Live():
+    def __init__(self):
+        self.bus_ids = {}
+        self.modules = {}
+        self.ports = {}
+
+
+class Plan():
+    """Changes that bring the live graph in line with a description, in
+    the order they are applied"""
+
+    def __init__(self, live):
+        self.live = live
+        self.add_buses = []
+        self.add_modules = []
+        self.remove_connections = []
+        self.add_connections = []
+        self.applied = False
+
+    def __len__(self):
+        return (len(self.add_buses) + len(self.add_modules) +
+                len(self.remove_connections) + len(self.add_connections))
+
+    def __repr__(self):
+        return (f"<Plan add_buses={len(self.add_buses)} "
+                f"add_modules={len(self.add_modules)} "
+                f"remove_connections={len(self.remove_connections)} "
+                f"add_connections={len(self.add_connections)}>")
+
+
+def _split(path):
+    parent, _, name = path.rpartition('/')
+    return parent, name
+
+def _module_keys(bus_path, names):
+    seen = {}
+    for name in names:
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        yield f"{bus_path}/{name}" if not count else f"{bus_path}/{name}#{count}"
+
+def _read_ports(client, live, bus_paths, module_keys, max_in_flight, timeout):
+    calls = [(pycyperus._parse_list_bus_port,
+              "/cyperus/list/bus_port", live.bus_ids[path], 's')
+             for path in bus_paths]
+    calls += [(pycyperus._parse_list_module_port,
+               "/cyperus/list/module_port", live.modules[key], 's')
+              for key in module_keys]
+    results = client._pipeline(calls, max_in_flight, timeout)
+    pycyperus._raise_failed(results, 'port')
+    for path, listing in zip(list(bus_paths) + list(module_keys), results):
+        for direction in ('in', 'out'):
+            for port in listing[direction]:
+                live.ports[f"{path}:{port['name']}"] = port['id']
+
+def _read_live(client, desired, max_in_flight, timeout):
+    graph = snapshot.crawl(client, max_in_flight, timeout)
+    live = _Live()
+    wanted = set()
+    for path in desired.get('buses', {}):
+        while path:
+            wanted.add(path)
+            path, _ = _split(path)
+    # of same-named siblings the first listed is the one a path names
+    paths = {'': ''}
+    for bus in graph.buses.values():
+        parent = paths.get(bus.parent_id)
+        if parent is None:
+            continue
+        path = f"{parent}/{bus.name}" if parent else bus.name
+        if path in wanted and path not in live.bus_ids:
+            live.bus_ids[path] = bus.id
+            paths[bus.id] = path
+
+    for path in desired.get('buses', {}):
+        bus = graph.buses.get(live.bus_ids.get(path))
+        if bus is None:
+            continue
+        for port in bus.ins + bus.outs:
+            live.ports[f"{path}:{port.name}"] = port.id
+        modules = [graph.modules[module_id] for module_id in bus.module_ids]
+        for key, module in zip(_module_keys(path, [module.name for module in modules]),
+                               modules):
+            live.modules[key] = module.id
+            for port in module.ins + module.outs:
+                live.ports[f"{key}:{port.name}"] = port.id
+    return live
+
+def plan(client, desired, connections, max_in_flight=64, timeout=20):
+    """Crawls the live graph, keeps the parts the description covers and
+    works out what has to change.  connections maps live connection ids to
+    (port out id, port in id)."""
+    live = _read_live(client, desired, max_in_flight, timeout)
+    result = Plan(live)
+    buses = desired.get('buses', {})
+
+    for path in sorted(buses, key=lambda path: path.count('/')):
+        if path not in live.bus_ids:
+            parent, _ = _split(path)
+            if parent and parent not in buses and parent not in live.bus_ids:
+                raise ExceptionGroup(
+                    f"Parent '{parent}' of bus '{path}' is neither described nor live",
+                    [
+                        exceptions.UnknownName(),
+                        exceptions.ApiException()
+                    ]
+                )
+            result.add_buses.append(path)
+
+    for path, spec in buses.items():
+        modules = spec.get('modules', [])
+        keys = _module_keys(path, [module.get('name', module['type'])
+                                   for module in modules])
+        for key, module in zip(keys, modules):
+            if module['type'] not in MODULE_TYPES:
+                raise ExceptionGroup(
+                    f"Unknown module type '{module['type']}', must be one of: "
+                    f"{list(MODULE_TYPES.keys())}",
+                    [
+                        exceptions.InvalidModuleType(),
+                        exceptions.ApiException()
+                    ]
+                )
+            if key not in live.modules:
+                result.add_modules.append((key, module))
+
+    wanted = set()
+    for port_out, port_in in desired.get('connections', []):
+        port_out_id = live.ports.get(port_out)
+        port_in_id = live.ports.get(port_in)
+        if port_out_id is None or port_in_id is None:
+            result.add_connections.append((port_out, port_in))
+        else:
+            wanted.add((port_out_id, port_in_id))
+
+    managed = set(live.ports.values())
+    existing = set()
+    for connection_id, pair in connections.items():
+        if pair in wanted and pair not in existing:
+            existing.add(pair)
+        elif pair[0] in managed or pair[1] in managed:
+            result.remove_connections.append(connection_id)
+
+    refs = {port_id: ref for ref, port_id in live.ports.items()}
+    for pair in wanted - existing:
+        result.add_connections.append((refs[pair[0]], refs[pair[1]]))
+    return result
+
+def _resolve(live, ref):
+    port_id = live.ports.get(ref)
+    if port_id is None:
+        raise ExceptionGroup(
+            f"Port '{ref}' does not exist",
+            [
+                exceptions.UnknownPortReference(),
+                exceptions.ApiException()
+            ]
+        )
+    return port_id
+
+def apply(client, plan, desired, topology=None, max_in_flight=64, timeout=20):
+    """Applies a plan: buses level by level, then modules, then connection
+    removals and additions, each stage pipelined"""
+    live = plan.live
+    buses = desired.get('buses', {})
+
+    depth = None
+    level = []
+    for path in plan.add_buses + [None]:
+        if path is not None and path.count('/') == depth:
+            level.append(path)
+            continue
+        if level:
+            calls = []
+            for bus_path in level:
+                parent, name = _split(bus_path)
+                calls.append((pycyperus._parse_add_bus,
+                              "/cyperus/add/bus",
+                              live.bus_ids[parent] if parent else '',
+                              name,
+                              buses[bus_path].get('ins', ''),
+                              buses[bus_path].get('outs', '')))
+            results = client._pipeline(calls, max_in_flight, timeout)
+            for (parser, address, parent_id, name, ins, outs), bus_path, new_id in \
+                    zip(calls, level, results):
+                if not isinstance(new_id, Exception):
+                    live.bus_ids[bus_path] = new_id
+                    if topology is not None:
+                        topology.added_bus(parent_id, name, ins, outs, new_id)
+            pycyperus._raise_failed(results, 'add bus')
+        if path is not None:
+            depth = path.count('/')
+            level = [path]
+
+    calls = []
+    for key, module in plan.add_modules:
+        bus_path = key[:key.rindex('/')]
+        address, parameters = MODULE_TYPES[module['type']]
+        calls.append((pycyperus._parse_add_module,
+                      address,
+                      live.bus_ids[bus_path],
+                      *(float(module[parameter]) for parameter in parameters)))
+    results = client._pipeline(calls, max_in_flight, timeout)
+    for (key, module), call, new_id in zip(plan.add_modules, calls, results):
+        if not isinstance(new_id, Exception):
+            live.modules[key] = new_id
+            if topology is not None:
+                topology.added_module(call[2], new_id)
+    pycyperus._raise_failed(results, 'add module')
+
+    _read_ports(client,
+                live,
+                plan.add_buses,
+                [key for key, module in plan.add_modules],
+                max_in_flight,
+                timeout)
+
+    calls = [(pycyperus._parse_remove_connection,
+              "/cyperus/remove/connection", connection_id)
+             for connection_id in plan.remove_connections]
+    calls += [(pycyperus._parse_add_connection,
+               "/cyperus/add/connection",
+               _resolve(live, port_out),
+               _resolve(live, port_in))
+              for port_out, port_in in plan.add_connections]
+    results = client._pipeline(calls, max_in_flight, timeout)
+    if topology is not None:
+        for call, result in zip(calls, results):
+            if isinstance(result, Exception):
+                continue
+            if call[1] == "/cyperus/remove/connection":
+                topology.removed_connection(call[2])
+            else:
+                topology.added_connection(call[2], call[3], result)
+    pycyperus._raise_failed(results, 'connection')
+    plan.applied = True
+    return plan
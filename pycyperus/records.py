@@ -0,0 +1,194 @@
+''' records.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+import array
+import collections
+import collections.abc
+import itertools
+
+
+class _Record():
+    """Tuple records that also answer record['field'], 'field' in record,
+    keys(), items(), get() and == against a dict, as the dicts list_*
+    used to return did, so dict() copies of them work too.  They remain
+    tuples, though: json.dumps writes one as an array and a Listing not
+    at all, so pass either through jsonable() first."""
+
+    __slots__ = ()
+
+    __hash__ = tuple.__hash__
+
+    def __contains__(self, key):
+        return key in self._fields
+
+    def __eq__(self, other):
+        if isinstance(other, dict):
+            return self._asdict() == other
+        return tuple.__eq__(self, other)
+
+    def __ne__(self, other):
+        if isinstance(other, dict):
+            return self._asdict() != other
+        return tuple.__ne__(self, other)
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def keys(self):
+        return self._fields
+
+    def items(self):
+        return zip(self._fields, self)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if isinstance(key, str) else default
+
+
+class BusRecord(_Record, collections.namedtuple(
+        'BusRecord', ['id', 'name', 'ins_count', 'outs_count'])):
+    __slots__ = ()
+
+
+class ModuleRecord(_Record, collections.namedtuple('ModuleRecord', ['id', 'name'])):
+    __slots__ = ()
+
+
+class PortRecord(_Record, collections.namedtuple('PortRecord', ['id', 'name'])):
+    __slots__ = ()
+
+
+_new = tuple.__new__
+
+def parse_bus(elem):
+    bus_id, name, ins_count, outs_count = elem.split('|')
+    return _new(BusRecord, (bus_id, name, int(ins_count), int(outs_count)))
+
+def parse_module(elem):
+    module_id, name = elem.split('|')
+    return _new(ModuleRecord, (module_id, name))
+
+def parse_port(elem):
+    port_id, name = elem.split('|')
+    return _new(PortRecord, (port_id, name))
+
+
+class Listing(collections.abc.Sequence):
+    """Read-only sequence over the newline-separated text of a listing.
+    Entries are decoded with parse only when first indexed and then kept;
+    the text itself is only split to find line offsets, held in one
+    array, so a listing of tens of thousands of entries costs little more
+    than its text until it is walked."""
+
+    __slots__ = ('text', 'parse', 'starts', 'records')
+
+    def __init__(self, text, parse):
+        if text.startswith('\n') or '\n\n' in text:
+            text = '\n'.join(filter(None, text.split('\n')))
+        self.text = text
+        self.parse = parse
+        self.starts = None
+        self.records = None
+
+    def _index(self):
+        lines = self.text.split('\n')
+        if lines[-1] == '':
+            lines.pop()
+        # start of line i is starts[i] + i, counting the newlines before it
+        self.starts = array.array('q', itertools.accumulate(map(len, lines), initial=0))
+        self.records = [None] * len(lines)
+
+    def __len__(self):
+        if self.records is None:
+            self._index()
+        return len(self.records)
+
+    def __getitem__(self, index):
+        if self.records is None:
+            self._index()
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.records)))]
+        record = self.records[index]
+        if record is None:
+            if index < 0:
+                index += len(self.records)
+            start = self.starts[index] + index
+            record = self.records[index] = self.parse(
+                self.text[start:self.starts[index + 1] + index])
+        return record
+
+    def __iter__(self):
+        if self.records is None:
+            # walking the whole listing needs no offsets
+            lines = self.text.split('\n')
+            if lines[-1] == '':
+                lines.pop()
+            self.records = list(map(self.parse, lines))
+            return iter(self.records)
+        return self._iter_missing()
+
+    def _iter_missing(self):
+        records = self.records
+        parse = self.parse
+        for index, line in enumerate(self.text.split('\n', len(records) - 1)
+                                     if records else ()):
+            record = records[index]
+            if record is None:
+                record = records[index] = parse(line.rstrip('\n'))
+            yield record
+
+    def __eq__(self, other):
+        if isinstance(other, (Listing, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self):
+        return f"Listing({list(self)!r})"
+
+
+def jsonable(value):
+    """value with records turned into dicts and listings into lists,
+    throughout, as json.dumps would have written the old dicts"""
+    if isinstance(value, _Record):
+        return value._asdict()
+    if isinstance(value, (Listing, list, tuple)):
+        return [jsonable(item) for item in value]
+    if isinstance(value, dict):
+        return {key: jsonable(item) for key, item in value.items()}
+    return value
+
+def sections(text, parse):
+    """{'in': Listing, 'out': Listing} for port listings laid out as an
+    'in:' line, the in ports, an 'out:' line and the out ports"""
+    text = '\n' + text
+    split = text.find('\nout:\n')
+    if split < 0:
+        split = len(text) - 5 if text.endswith('\nout:') else len(text)
+    ins = text[1:split + 1]
+    if ins.startswith('in:\n'):
+        ins = ins[4:]
+    elif ins == 'in:':
+        ins = ''
+    return {'in': Listing(ins, parse),
+            'out': Listing(text[split + 6:], parse)}
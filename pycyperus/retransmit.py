@@ -0,0 +1,75 @@
+''' retransmit.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+import threading
+
+# requests that are safe to send more than once; anything else is only
+# retransmitted under an idempotency key
+READ_ONLY_PATHS = frozenset((
+    "/cyperus/list/osc/client",
+    "/cyperus/list/main",
+    "/cyperus/list/bus",
+    "/cyperus/list/bus_port",
+    "/cyperus/list/module",
+    "/cyperus/list/module_port",
+    "/cyperus/get/system/env_variable",
+))
+
+
+class RttEstimator():
+    """Smoothed round-trip time and retransmission timeout as in RFC 6298,
+    with bounds suited to a server on the same host or network rather
+    than the Internet's one-second floor"""
+
+    def __init__(self, initial_rto=0.02, min_rto=0.002, max_rto=1.0):
+        self.lock = threading.Lock()
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = None
+        self.rttvar = None
+        self.current = initial_rto
+        self.samples = 0
+
+    def sample(self, rtt):
+        with self.lock:
+            if self.srtt is None:
+                self.srtt = rtt
+                self.rttvar = rtt / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+                self.srtt = 0.875 * self.srtt + 0.125 * rtt
+            self.current = min(max(self.srtt + 4 * self.rttvar, self.min_rto),
+                               self.max_rto)
+            self.samples += 1
+
+    def rto(self):
+        return self.current
+
+    def backoff(self, rto):
+        return min(2 * rto, self.max_rto)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'srtt': self.srtt,
+                'rttvar': self.rttvar,
+                'rto': self.current,
+                'samples': self.samples
+            }
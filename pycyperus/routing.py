@@ -0,0 +1,329 @@
+''' routing.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Ports are vertices and connections edges, plus an edge from each of a
+# module's ins to each of its outs.  While the graph is acyclic a
+# topological order is kept as edges are added (Pearce and Kelly, 2006),
+# so most cycle checks search little or nothing.
+
+import collections
+import threading
+
+from pycyperus import exceptions
+from pycyperus import pycyperus
+
+
+class SignalGraph():
+    """Directed graph of port-to-port connections and the signal paths
+    through modules; with reject_cycles set, check() refuses connections
+    that would close a loop"""
+
+    def __init__(self, client=None, reject_cycles=False):
+        self.client = client
+        self.reject_cycles = reject_cycles
+        self.lock = threading.RLock()
+        self.successors = {}
+        self.predecessors = {}
+        self.connections = {}
+        self.edges = 0
+        # None while the graph has, or may have, a loop
+        self.order = {}
+        self.recheck = False
+        self.new_modules = []
+
+    def __len__(self):
+        return self.edges
+
+    def __repr__(self):
+        return (f"<SignalGraph ports={len(self.successors)} edges={self.edges} "
+                f"connections={len(self.connections)} acyclic={self.acyclic()}>")
+
+    def _vertex(self, port_id):
+        if port_id not in self.successors:
+            self.successors[port_id] = {}
+            self.predecessors[port_id] = {}
+            if self.order is not None:
+                self.order[port_id] = len(self.order)
+
+    def _add_edge(self, source, target):
+        self._vertex(source)
+        self._vertex(target)
+        successors = self.successors[source]
+        successors[target] = successors.get(target, 0) + 1
+        predecessors = self.predecessors[target]
+        predecessors[source] = predecessors.get(source, 0) + 1
+        self.edges += 1
+        if self.order is not None and successors[target] == 1:
+            self._reorder(source, target)
+
+    def _remove_edge(self, source, target):
+        successors = self.successors[source]
+        successors[target] -= 1
+        if not successors[target]:
+            del successors[target]
+            del self.predecessors[target][source]
+        self.edges -= 1
+        # removing edges keeps an order valid, but may break the last loop
+        if self.order is None:
+            self.recheck = True
+
+    def _reorder(self, source, target):
+        order = self.order
+        lower, upper = order[target], order[source]
+        if lower > upper:
+            return
+        forward = None
+        if source != target:
+            forward = self._search(target, self.successors,
+                                   lambda vertex: order[vertex] <= upper, source)
+        if forward is None:
+            self.order = None
+            return
+        backward = self._search(source, self.predecessors,
+                                lambda vertex: order[vertex] >= lower)
+        forward.sort(key=order.__getitem__)
+        backward.sort(key=order.__getitem__)
+        slots = sorted(order[vertex] for vertex in backward + forward)
+        for vertex, slot in zip(backward + forward, slots):
+            order[vertex] = slot
+
+    def _search(self, start, edges, within, stop=None):
+        """Vertices reachable from start through vertices within(), or
+        None once stop is reached"""
+        seen = {start}
+        stack = [start]
+        while stack:
+            for vertex in edges[stack.pop()]:
+                if vertex == stop:
+                    return None
+                if vertex not in seen and within(vertex):
+                    seen.add(vertex)
+                    stack.append(vertex)
+        return list(seen)
+
+    def _ensure_order(self):
+        """Recomputes the order after removals; returns whether the graph
+        is acyclic"""
+        if self.order is not None:
+            return True
+        if not self.recheck:
+            return False
+        self.recheck = False
+        indegree = {vertex: len(predecessors)
+                    for vertex, predecessors in self.predecessors.items()}
+        ready = collections.deque(vertex for vertex, count in indegree.items() if not count)
+        order = {}
+        while ready:
+            vertex = ready.popleft()
+            order[vertex] = len(order)
+            for successor in self.successors[vertex]:
+                indegree[successor] -= 1
+                if not indegree[successor]:
+                    ready.append(successor)
+        if len(order) < len(self.successors):
+            return False
+        self.order = order
+        return True
+
+    def acyclic(self):
+        with self.lock:
+            return self._ensure_order()
+
+    # loading
+
+    def add_module(self, in_port_ids, out_port_ids):
+        with self.lock:
+            for in_port_id in in_port_ids:
+                for out_port_id in out_port_ids:
+                    self._add_edge(in_port_id, out_port_id)
+
+    def add_connection(self, connection_id, port_out_id, port_in_id):
+        with self.lock:
+            if connection_id in self.connections:
+                return
+            self.connections[connection_id] = (port_out_id, port_in_id)
+            self._add_edge(port_out_id, port_in_id)
+
+    def remove_connection(self, connection_id):
+        with self.lock:
+            edge = self.connections.pop(connection_id, None)
+            if edge is not None:
+                self._remove_edge(*edge)
+
+    def load(self, graph, connections=()):
+        """Adds the modules of a snapshot.Graph and connections, a mapping
+        of connection id to (port out id, port in id)"""
+        with self.lock:
+            for module in graph.modules.values():
+                self.add_module([port.id for port in module.ins],
+                                [port.id for port in module.outs])
+            for connection_id, (port_out_id, port_in_id) in dict(connections).items():
+                self.add_connection(connection_id, port_out_id, port_in_id)
+
+    # queries
+
+    def reachable(self, source, target):
+        """Whether signal leaving port source arrives at port target"""
+        with self.lock:
+            if source == target:
+                return True
+            if source not in self.successors or target not in self.successors:
+                return False
+            if self._ensure_order():
+                order = self.order
+                upper = order[target]
+                if order[source] > upper:
+                    return False
+                return self._search(source, self.successors,
+                                    lambda vertex: order[vertex] < upper, target) is None
+            return self._search(source, self.successors, lambda vertex: True, target) is None
+
+    def would_cycle(self, port_out_id, port_in_id, pending=()):
+        """Whether connecting port_out_id to port_in_id closes a loop,
+        counting the (port out id, port in id) pairs in pending as made"""
+        if not pending:
+            return self.reachable(port_in_id, port_out_id)
+        extra = {}
+        for source, target in pending:
+            extra.setdefault(source, []).append(target)
+        with self.lock:
+            if port_in_id == port_out_id:
+                return True
+            seen = {port_in_id}
+            stack = [port_in_id]
+            while stack:
+                vertex = stack.pop()
+                for target in (*self.successors.get(vertex, ()), *extra.get(vertex, ())):
+                    if target == port_out_id:
+                        return True
+                    if target not in seen:
+                        seen.add(target)
+                        stack.append(target)
+            return False
+
+    def paths(self, source, target, limit=None):
+        """Every simple path of port ids from source to target, at most
+        limit of them"""
+        with self.lock:
+            if source not in self.successors or target not in self.successors:
+                return []
+            useful = set(self._search(target, self.predecessors, lambda vertex: True))
+            if source not in useful:
+                return []
+            found = []
+            path = [source]
+            on_path = {source}
+            stack = [iter(self.successors[source])]
+            while stack:
+                if limit is not None and len(found) >= limit:
+                    break
+                for vertex in stack[-1]:
+                    if vertex == target:
+                        found.append(path + [target])
+                        continue
+                    if vertex in useful and vertex not in on_path:
+                        path.append(vertex)
+                        on_path.add(vertex)
+                        stack.append(iter(self.successors[vertex]))
+                        break
+                else:
+                    stack.pop()
+                    on_path.discard(path.pop())
+            return found[:limit] if limit is not None else found
+
+    def find_cycle(self):
+        """One feedback loop as a list of port ids, or None"""
+        with self.lock:
+            if self._ensure_order():
+                return None
+            state = {}
+            for root in self.successors:
+                if root in state:
+                    continue
+                state[root] = 1
+                path = [root]
+                stack = [iter(self.successors[root])]
+                while stack:
+                    for vertex in stack[-1]:
+                        if state.get(vertex) == 1:
+                            return path[path.index(vertex):]
+                        if vertex not in state:
+                            state[vertex] = 1
+                            path.append(vertex)
+                            stack.append(iter(self.successors[vertex]))
+                            break
+                    else:
+                        stack.pop()
+                        state[path.pop()] = 2
+            return None
+
+    # observer hooks
+
+    def added_bus(self, bus_id, name, in_names, out_names, new_id):
+        pass
+
+    def added_module(self, bus_id, new_id, path=None, parameters=()):
+        if new_id is not None:
+            with self.lock:
+                self.new_modules.append(new_id)
+
+    def added_connection(self, port_out_id, port_in_id, new_id):
+        if new_id is not None:
+            self.add_connection(new_id, port_out_id, port_in_id)
+
+    def removed_connection(self, connection_id):
+        self.remove_connection(connection_id)
+
+    def sync(self, max_in_flight=64, timeout=20):
+        """Lists the ports of modules added since the last sync"""
+        with self.lock:
+            modules, self.new_modules = self.new_modules, []
+            if not modules:
+                return
+            results = self.client._pipeline(
+                [(pycyperus._parse_list_module_port,
+                  "/cyperus/list/module_port", module_id, 's')
+                 for module_id in modules],
+                max_in_flight, timeout)
+            failed = [result for result in results if isinstance(result, Exception)]
+            if failed:
+                self.new_modules.extend(modules)
+                raise ExceptionGroup(
+                    f"{len(failed)} of {len(results)} module port requests failed",
+                    failed
+                )
+            for ports in results:
+                self.add_module([port['id'] for port in ports['in']],
+                                [port['id'] for port in ports['out']])
+
+    def check(self, port_out_id, port_in_id, pending=()):
+        """Raises ConnectionWouldCycle for a connection closing a loop,
+        counting those in pending as made, when reject_cycles is set"""
+        if not self.reject_cycles:
+            return
+        self.sync()
+        if self.would_cycle(port_out_id, port_in_id, pending):
+            raise ExceptionGroup(
+                f"Connecting {port_out_id} to {port_in_id} would close a feedback loop",
+                [
+                    exceptions.ConnectionWouldCycle(),
+                    exceptions.ApiException()
+                ]
+            )
@@ -0,0 +1,145 @@
+''' snapshot.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+import collections
+import time
+import types
+
+from pycyperus import pycyperus
+
+Port = collections.namedtuple('Port', ['id', 'name', 'direction', 'owner_id'])
+Module = collections.namedtuple('Module', ['id', 'name', 'bus_id', 'ins', 'outs'])
+Bus = collections.namedtuple('Bus', ['id', 'name', 'ins', 'outs', 'module_ids', 'parent_id'])
+
+
+class Graph():
+    """Immutable picture of a server's buses, modules and ports.
+
+    buses, modules and ports are read-only mappings keyed by id, buses
+    listed parents first and a top-level bus' parent_id being ''; main
+    holds the main ports, ins then outs, which the server lists without
+    names, so their name and owner_id are None.  timings maps each crawl
+    phase to the seconds it took."""
+
+    __slots__ = ('buses', 'modules', 'ports', 'main', 'timings')
+
+    def __init__(self, buses, modules, ports, timings, main=()):
+        object.__setattr__(self, 'buses', types.MappingProxyType(buses))
+        object.__setattr__(self, 'modules', types.MappingProxyType(modules))
+        object.__setattr__(self, 'ports', types.MappingProxyType(ports))
+        object.__setattr__(self, 'main', tuple(main))
+        object.__setattr__(self, 'timings', types.MappingProxyType(timings))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is immutable")
+
+    def __repr__(self):
+        return (f"<Graph buses={len(self.buses)} modules={len(self.modules)} "
+                f"ports={len(self.ports)}>")
+
+
+def _ports(owner_id, listing):
+    return tuple(Port(port['id'], port['name'], direction, owner_id)
+                 for direction in ('in', 'out')
+                 for port in listing[direction])
+
+def crawl(client, max_in_flight=64, timeout=20):
+    """Walks the bus tree a level at a time, listing each level's child
+    buses, ports and modules in one pipelined pass, then every module's
+    ports and the main ports in another; up to max_in_flight requests are
+    kept outstanding within each pass"""
+    timings = {}
+    started = time.perf_counter()
+
+    mark = time.perf_counter()
+    bus_list = []
+    listings = []
+    level = [(None, '')]
+    while level:
+        calls = []
+        for bus, parent_id in level:
+            calls.append((pycyperus._parse_list_bus,
+                          "/cyperus/list/bus", bus['id'] if bus else '',
+                          pycyperus.DIRECT_DESCENDANT, 'si'))
+            if bus:
+                calls.append((pycyperus._parse_list_bus_port,
+                              "/cyperus/list/bus_port", bus['id'], 's'))
+                calls.append((pycyperus._parse_list_module,
+                              "/cyperus/list/module", bus['id'], 's'))
+        results = client._pipeline(calls, max_in_flight, timeout)
+        pycyperus._raise_failed(results, 'bus, bus port and module')
+        results = iter(results)
+        next_level = []
+        for bus, parent_id in level:
+            children = next(results)
+            if bus:
+                bus_list.append((bus, parent_id))
+                listings.append((next(results), next(results)))
+            next_level.extend((child, bus['id'] if bus else '') for child in children)
+        level = next_level
+    timings['buses'] = time.perf_counter() - mark
+
+    mark = time.perf_counter()
+    module_owners = []
+    for (bus, parent_id), (bus_ports, bus_modules) in zip(bus_list, listings):
+        for module in bus_modules:
+            module_owners.append((bus['id'], module))
+    results = client._pipeline(
+        [(pycyperus._parse_list_module_port,
+          "/cyperus/list/module_port", module['id'], 's')
+         for bus_id, module in module_owners] +
+        [(pycyperus._parse_list_main, "/cyperus/list/main")],
+        max_in_flight, timeout)
+    pycyperus._raise_failed(results, 'module port and main port')
+    mains = results.pop()
+    timings['module_ports'] = time.perf_counter() - mark
+
+    buses = {}
+    modules = {}
+    ports = {}
+    for (bus_id, module), listing in zip(module_owners, results):
+        module_port_list = _ports(module['id'], listing)
+        for port in module_port_list:
+            ports[port.id] = port
+        modules[module['id']] = Module(
+            module['id'],
+            module['name'],
+            bus_id,
+            tuple(port for port in module_port_list if port.direction == 'in'),
+            tuple(port for port in module_port_list if port.direction == 'out'))
+    for (bus, parent_id), (listing, bus_modules) in zip(bus_list, listings):
+        bus_port_list = _ports(bus['id'], listing)
+        for port in bus_port_list:
+            ports[port.id] = port
+        buses[bus['id']] = Bus(
+            bus['id'],
+            bus['name'],
+            tuple(port for port in bus_port_list if port.direction == 'in'),
+            tuple(port for port in bus_port_list if port.direction == 'out'),
+            tuple(module['id'] for module in bus_modules),
+            parent_id)
+    main = tuple(Port(port_id, None, direction, None)
+                 for direction in ('in', 'out')
+                 for port_id in mains[direction])
+    for port in main:
+        ports[port.id] = port
+
+    timings['total'] = time.perf_counter() - started
+    return Graph(buses, modules, ports, timings, main)
@@ -0,0 +1,160 @@
+''' telemetry.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+import array
+import asyncio
+import bisect
+import collections
+import itertools
+import threading
+import time
+
+
+class DspLoad():
+    """The last `capacity` /cyperus/dsp/load samples with their arrival
+    times, in fixed arrays.  Mean, max and percentiles over that window
+    are kept up to date as samples arrive, so memory stays constant no
+    matter how long the server reports.
+
+    Subscribers registered with subscribe() are called from the receive
+    thread whenever a sample crosses their threshold and must return
+    quickly."""
+
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.values = array.array('d', bytes(8 * capacity))
+        self.timestamps = array.array('d', bytes(8 * capacity))
+        self.count = 0
+        self.total = 0
+        self.sum = 0.0
+        self.maxima = collections.deque()
+        self.sorted = []
+        self.subscriptions = {}
+        self.subscription_ids = itertools.count()
+
+    def record(self, value, timestamp=None):
+        value = float(value)
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            index = self.total % self.capacity
+            previous = self.values[(self.total - 1) % self.capacity] if self.count else None
+            if self.count == self.capacity:
+                evicted = self.values[index]
+                self.sum -= evicted
+                del self.sorted[bisect.bisect_left(self.sorted, evicted)]
+                if self.maxima[0] == self.total - self.capacity:
+                    self.maxima.popleft()
+            else:
+                self.count += 1
+            self.values[index] = value
+            self.timestamps[index] = timestamp
+            self.sum += value
+            bisect.insort(self.sorted, value)
+            while self.maxima and self.values[self.maxima[-1] % self.capacity] <= value:
+                self.maxima.pop()
+            self.maxima.append(self.total)
+            self.total += 1
+            if self.total % self.capacity == 0:
+                # bound floating point drift in the running sum
+                self.sum = sum(self.sorted)
+            subscriptions = list(self.subscriptions.values())
+
+        if previous is None:
+            return
+        for threshold, rising, callback in subscriptions:
+            if rising and previous <= threshold < value:
+                callback(value, timestamp)
+            elif not rising and previous > threshold >= value:
+                callback(value, timestamp)
+
+    def last(self):
+        with self.lock:
+            if not self.count:
+                return None
+            index = (self.total - 1) % self.capacity
+            return self.timestamps[index], self.values[index]
+
+    def percentile(self, q):
+        with self.lock:
+            if not self.sorted:
+                return None
+            return self.sorted[min(int(q * len(self.sorted)), len(self.sorted) - 1)]
+
+    def summary(self, quantiles=(0.5, 0.9, 0.99)):
+        """count, total, last, mean, max and p50/p90/p99 over the window"""
+        with self.lock:
+            if not self.count:
+                return {'count': 0, 'total': self.total}
+            index = (self.total - 1) % self.capacity
+            result = {
+                'count': self.count,
+                'total': self.total,
+                'last': self.values[index],
+                'mean': self.sum / self.count,
+                'max': self.values[self.maxima[0] % self.capacity]
+            }
+            for q in quantiles:
+                result[f"p{round(q * 100)}"] = self.sorted[
+                    min(int(q * self.count), self.count - 1)]
+            return result
+
+    def samples(self):
+        """(timestamp, value) pairs in the window, oldest first"""
+        with self.lock:
+            start = self.total - self.count
+            return [(self.timestamps[i % self.capacity], self.values[i % self.capacity])
+                    for i in range(start, self.total)]
+
+    def subscribe(self, threshold, callback, rising=True):
+        """Calls callback(value, timestamp) when a sample rises above
+        threshold (or falls back to it, with rising=False); returns an id
+        for unsubscribe()"""
+        with self.lock:
+            subscription_id = next(self.subscription_ids)
+            self.subscriptions[subscription_id] = (threshold, rising, callback)
+        return subscription_id
+
+    def unsubscribe(self, subscription_id):
+        with self.lock:
+            self.subscriptions.pop(subscription_id, None)
+
+    async def crossings(self, threshold, rising=True, maxsize=64):
+        """Async iterator over (value, timestamp) crossings.  At most
+        maxsize crossings are buffered; older ones are dropped when the
+        consumer falls behind."""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize)
+
+        def put(item):
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(item)
+
+        def callback(value, timestamp):
+            loop.call_soon_threadsafe(put, (value, timestamp))
+
+        subscription_id = self.subscribe(threshold, callback, rising)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self.unsubscribe(subscription_id)
@@ -0,0 +1,173 @@
+''' topology.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+import threading
+import time
+
+from pycyperus import pycyperus
+from pycyperus import records
+
+
+class Topology():
+    """Client-side model of the server's buses, modules, ports and
+    connections, filled from list_* results and kept current by the
+    mutations made through the same Api.
+
+    generation counts the changes that drop listings.  A caller that
+    lists on a miss passes the generation it read before sending to
+    put_*, which drops the listing if the cache changed since: the
+    answer may predate a mutation made meanwhile by another thread.
+
+    Listings older than ttl seconds are treated as missing; ttl=None keeps
+    them until refresh().  Changes made by other clients are only seen
+    after either of those."""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl
+        self.lock = threading.RLock()
+        self.buses = {}
+        self.modules = {}
+        self.connections = {}
+        self.bus_lists = {}
+        self.bus_ports = {}
+        self.bus_modules = {}
+        self.module_ports = {}
+        self.generation = 0
+
+    def refresh(self):
+        with self.lock:
+            self.generation += 1
+            self.buses.clear()
+            self.modules.clear()
+            self.connections.clear()
+            self.bus_lists.clear()
+            self.bus_ports.clear()
+            self.bus_modules.clear()
+            self.module_ports.clear()
+
+    def _get(self, table, key):
+        entry = table.get(key)
+        if entry is None:
+            return None
+        stamp, value = entry
+        if self.ttl is not None and time.monotonic() - stamp > self.ttl:
+            del table[key]
+            return None
+        return value
+
+    def _put(self, table, key, value):
+        table[key] = (time.monotonic(), value)
+
+    def _ports(self, ports):
+        return {'in': list(ports['in']),
+                'out': list(ports['out'])}
+
+    def get_bus_list(self, bus_id, list_type):
+        with self.lock:
+            bus_ids = self._get(self.bus_lists, (bus_id, list_type))
+            if bus_ids is None:
+                return None
+            return [self.buses[each] for each in bus_ids]
+
+    def put_bus_list(self, bus_id, list_type, bus_list, generation=None):
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            for bus in bus_list:
+                self.buses[bus['id']] = bus
+            self._put(self.bus_lists,
+                      (bus_id, list_type),
+                      [bus['id'] for bus in bus_list])
+
+    def get_bus_ports(self, bus_id):
+        with self.lock:
+            ports = self._get(self.bus_ports, bus_id)
+            if ports is None:
+                return None
+            return self._ports(ports)
+
+    def put_bus_ports(self, bus_id, ports, generation=None):
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._put(self.bus_ports, bus_id, self._ports(ports))
+
+    def get_modules(self, bus_id):
+        with self.lock:
+            module_ids = self._get(self.bus_modules, bus_id)
+            if module_ids is None:
+                return None
+            return [self.modules[each] for each in module_ids]
+
+    def put_modules(self, bus_id, modules, generation=None):
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            for module in modules:
+                self.modules[module['id']] = module
+            self._put(self.bus_modules,
+                      bus_id,
+                      [module['id'] for module in modules])
+
+    def get_module_ports(self, module_id):
+        with self.lock:
+            ports = self._get(self.module_ports, module_id)
+            if ports is None:
+                return None
+            return self._ports(ports)
+
+    def put_module_ports(self, module_id, ports, generation=None):
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._put(self.module_ports, module_id, self._ports(ports))
+
+    def added_bus(self, bus_id, name, in_names, out_names, new_id):
+        """A new bus only changes the direct-descendant listing of its
+        parent in a way we can apply locally; every other bus listing may
+        have gained it somewhere we cannot place, so those are dropped"""
+        with self.lock:
+            self.generation += 1
+            self.buses[new_id] = records.BusRecord(
+                new_id,
+                name,
+                len(list(filter(None, in_names.split(',')))),
+                len(list(filter(None, out_names.split(',')))))
+            siblings = self.bus_lists.get((bus_id, pycyperus.DIRECT_DESCENDANT))
+            for key in list(self.bus_lists):
+                if key != (bus_id, pycyperus.DIRECT_DESCENDANT):
+                    del self.bus_lists[key]
+            if siblings is not None:
+                siblings[1].append(new_id)
+
+    def added_module(self, bus_id, new_id, path=None, parameters=()):
+        """The server names new modules, so the owning bus' module listing
+        is dropped rather than patched"""
+        with self.lock:
+            self.generation += 1
+            self.bus_modules.pop(bus_id, None)
+
+    def added_connection(self, port_out_id, port_in_id, new_id):
+        with self.lock:
+            self.connections[new_id] = (port_out_id, port_in_id)
+
+    def removed_connection(self, connection_id):
+        with self.lock:
+            self.connections.pop(connection_id, None)
@@ -0,0 +1,292 @@
+''' transaction.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Queued mutations are sent on commit in pipelined waves, each waiting
+# for the buses and modules it refers to.  A failed wave undoes what was
+# applied, newest first; buses and modules, which the server cannot
+# remove, are left in `stranded`.
+
+from pycyperus import exceptions
+from pycyperus import pycyperus
+
+ADD_CONNECTION = "/cyperus/add/connection"
+REMOVE_CONNECTION = "/cyperus/remove/connection"
+
+
+class Ref():
+    """Stands in for the id a queued operation will be answered with"""
+
+    __slots__ = ('transaction', 'index')
+
+    def __init__(self, transaction, index):
+        self.transaction = transaction
+        self.index = index
+
+    def __repr__(self):
+        return f"<Ref {self.index} {self.transaction.operations[self.index].path}>"
+
+    @property
+    def value(self):
+        return self.transaction.operations[self.index].result
+
+    def port(self, name):
+        """The port called name of the bus or module this refers to"""
+        return PortRef(self, name)
+
+
+class PortRef():
+    __slots__ = ('owner', 'name')
+
+    def __init__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def __repr__(self):
+        return f"<PortRef {self.owner!r}:{self.name}>"
+
+
+class Operation():
+    __slots__ = ('parser', 'path', 'data', 'ports', 'sent', 'result')
+
+    def __init__(self, parser, path, data, ports=None):
+        self.parser = parser
+        self.path = path
+        self.data = data
+        # (port out id, port in id) a removed connection joined
+        self.ports = ports
+        self.sent = None
+        self.result = None
+
+    def depends(self):
+        for item in self.data:
+            if isinstance(item, Ref):
+                yield item.index
+            elif isinstance(item, PortRef):
+                yield item.owner.index
+        if isinstance(self.ports, Ref):
+            yield self.ports.index
+
+
+class Transaction():
+    """Queued operations and, once committed, their results.  connections
+    maps live connection ids to (port out id, port in id), for undoing
+    their removal."""
+
+    def __init__(self, client, connections=None):
+        self.client = client
+        self.connections = connections if connections is not None else {}
+        self.operations = []
+        self.ports = {}
+        self.results = None
+        self.undone = []
+        self.stranded = []
+        self.restored = {}
+
+    def add(self, parser, path, *data, ports=None):
+        self.operations.append(Operation(parser, path, data, ports))
+        return Ref(self, len(self.operations) - 1)
+
+    def remove(self, connection_id):
+        """Queues removing connection_id, whose ports have to be known"""
+        if isinstance(connection_id, Ref):
+            if self.operations[connection_id.index].path != ADD_CONNECTION:
+                raise ExceptionGroup(
+                    f"{connection_id!r} is not a connection",
+                    [
+                        exceptions.UnknownPortReference(),
+                        exceptions.ApiException()
+                    ]
+                )
+            ports = connection_id
+        else:
+            ports = self.connections.get(connection_id)
+            if ports is None:
+                raise ExceptionGroup(
+                    f"Ports of connection {connection_id} are unknown, its "
+                    f"removal could not be undone",
+                    [
+                        exceptions.IrreversibleOperation(),
+                        exceptions.ApiException()
+                    ]
+                )
+        return self.add(pycyperus._parse_remove_connection,
+                        REMOVE_CONNECTION,
+                        connection_id,
+                        ports=ports)
+
+    def _list_ports(self, owners, max_in_flight, timeout):
+        owners = list(owners)
+        results = self.client._pipeline(
+            [(pycyperus._parse_list_bus_port, "/cyperus/list/bus_port",
+              self.operations[index].result, 's')
+             if self.operations[index].path == "/cyperus/add/bus" else
+             (pycyperus._parse_list_module_port, "/cyperus/list/module_port",
+              self.operations[index].result, 's')
+             for index in owners],
+            max_in_flight, timeout)
+        failed = []
+        for index, listing in zip(owners, results):
+            if isinstance(listing, Exception):
+                failed.append(listing)
+                continue
+            ports = self.ports[index] = {}
+            for direction in ('out', 'in'):
+                for port in listing[direction]:
+                    ports.setdefault(port['name'], port['id'])
+        return failed
+
+    def _resolve(self, item):
+        if isinstance(item, Ref):
+            return self.operations[item.index].result
+        if isinstance(item, PortRef):
+            port_id = self.ports[item.owner.index].get(item.name)
+            if port_id is None:
+                raise ExceptionGroup(
+                    f"{self.operations[item.owner.index].result} has no port "
+                    f"{item.name}",
+                    [
+                        exceptions.UnknownPortReference(),
+                        exceptions.ApiException()
+                    ]
+                )
+            return port_id
+        return item
+
+    def _prepare(self, operation):
+        """Resolves the operation's arguments, returning the exception that
+        keeps it from being sent, if any"""
+        try:
+            operation.sent = tuple(self._resolve(item) for item in operation.data)
+            if isinstance(operation.ports, Ref):
+                operation.ports = self.operations[operation.ports.index].sent
+            if operation.path == ADD_CONNECTION and self.client.routing is not None:
+                self.client.routing.check(*operation.sent)
+        except Exception as exc:
+            return exc
+        return None
+
+    def commit(self, max_in_flight=64, timeout=20):
+        """Sends the queued operations and returns their results, or undoes
+        them and raises the failures"""
+        applied = []
+        remaining = list(range(len(self.operations)))
+        while remaining:
+            done = set(applied)
+            wave = [index for index in remaining
+                    if all(dependency in done
+                           for dependency in self.operations[index].depends())]
+            remaining = [index for index in remaining if index not in wave]
+
+            owners = {item.owner.index
+                      for index in wave
+                      for item in self.operations[index].data
+                      if isinstance(item, PortRef)}
+            failed = self._list_ports(owners - self.ports.keys(), max_in_flight, timeout)
+            if not failed:
+                failed = [exc for exc in map(self._prepare,
+                                             (self.operations[index] for index in wave))
+                          if exc is not None]
+            if not failed:
+                results = self.client._pipeline(
+                    [(self.operations[index].parser,
+                      self.operations[index].path,
+                      *self.operations[index].sent)
+                     for index in wave],
+                    max_in_flight, timeout)
+                for index, result in zip(wave, results):
+                    if isinstance(result, Exception):
+                        failed.append(result)
+                    else:
+                        self.operations[index].result = result
+                        applied.append(index)
+            if failed:
+                failed += self._undo(applied, max_in_flight, timeout)
+                raise ExceptionGroup(
+                    f"{len(failed)} transaction requests failed; undid "
+                    f"{len(self.undone)} of {len(applied)} applied, left "
+                    f"{len(self.stranded)} buses and modules in place",
+                    failed
+                )
+        self.results = [operation.result for operation in self.operations]
+        return self.results
+
+    def _undo(self, applied, max_in_flight, timeout):
+        calls = []
+        undoing = []
+        for index in reversed(applied):
+            operation = self.operations[index]
+            if operation.path == ADD_CONNECTION:
+                calls.append((pycyperus._parse_remove_connection,
+                              REMOVE_CONNECTION,
+                              operation.result))
+            elif operation.path == REMOVE_CONNECTION:
+                calls.append((pycyperus._parse_add_connection,
+                              ADD_CONNECTION,
+                              *operation.ports))
+            else:
+                self.stranded.append(operation.result)
+                continue
+            undoing.append(index)
+        results = self.client._pipeline(calls, max_in_flight, timeout)
+        failed = []
+        for index, result in zip(undoing, results):
+            if isinstance(result, Exception):
+                failed.append(result)
+                continue
+            self.undone.append(index)
+            operation = self.operations[index]
+            if operation.path == REMOVE_CONNECTION:
+                self.restored[operation.sent[0]] = result
+        return failed
+
+
+class _TransactionClient(Transaction):
+    def add_bus(self, bus_id, name, in_names, out_names):
+        return self.add(pycyperus._parse_add_bus,
+                        "/cyperus/add/bus",
+                        bus_id,
+                        name,
+                        in_names,
+                        out_names)
+
+    def add_connection(self, port_id_out, port_id_in):
+        return self.add(pycyperus._parse_add_connection,
+                        ADD_CONNECTION,
+                        port_id_out,
+                        port_id_in)
+
+    def remove_connection(self, connection_id):
+        return self.remove(connection_id)
+
+    def add_modules_oscillator_sine(self, bus_id, frequency, amplitude, phase):
+        return self.add(pycyperus._parse_add_module,
+                        "/cyperus/add/module/oscillator/sine",
+                        bus_id,
+                        frequency,
+                        amplitude,
+                        phase)
+
+    def add_modules_envelope_follower(self, bus_id, attack, decay, scale):
+        return self.add(pycyperus._parse_add_module,
+                        "/cyperus/add/module/envelope/follower",
+                        bus_id,
+                        attack,
+                        decay,
+                        scale)
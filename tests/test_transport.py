@@ -0,0 +1,244 @@
+''' test_transport.py
+This file is a part of 'pycyperus'
+This program is free software: you can redistribute it and/or modify
+hit under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'pycyperus' is a python api for cyperus-server
+
+Copyright 2024 murray foster '''
+
+#! /usr/bin/python3
+
+# Transport tests against the emulator: multipart reassembly under loss
+# and reordering, retransmission, the pending table's eviction and
+# several threads sharing one client.  Run with
+#
+#     python -m pytest tests
+
+import socket
+import threading
+import time
+import unittest
+
+from pycyperus import emulator
+from pycyperus import exceptions
+from pycyperus import pycyperus
+
+
+def _free_ports(count):
+    socks = [socket.socket(socket.AF_INET, socket.SOCK_DGRAM) for _ in range(count)]
+    try:
+        for sock in socks:
+            sock.bind(('127.0.0.1', 0))
+        return [sock.getsockname()[1] for sock in socks]
+    finally:
+        for sock in socks:
+            sock.close()
+
+
+class TransportTestCase(unittest.TestCase):
+    """Starts an emulator and an Api talking to it; the listing tests
+    use a bus with enough children to span several datagrams"""
+
+    def start(self, buses=10, api_options=None, **emulator_options):
+        port_send, port_receive = _free_ports(2)
+        self.emulator = emulator.Emulator(port_send, port_receive, **emulator_options)
+        self.addCleanup(self.emulator.close)
+        self.api = pycyperus.Api(port_receive, port_send, **(api_options or {}))
+        self.addCleanup(self.api.close)
+        self.root = self.api.add_bus('', 'root', 'in', 'out')
+        for i in range(buses):
+            self.api.add_bus(self.root, f"bus_{i}", 'in', 'out')
+        self.truth = list(self.api.list_bus(self.root, 'DIRECT_DESCENDANT'))
+
+    def list_children(self):
+        return list(self.api.list_bus(self.root, 'DIRECT_DESCENDANT'))
+
+    def assertCorrectOrMalformed(self, calls):
+        """Each call returns the whole listing or raises MalformedResponse
+        or ResponseTimeout, never a short or garbled one"""
+        for _ in range(calls):
+            try:
+                self.assertEqual(self.list_children(), self.truth)
+            except ExceptionGroup as group:
+                self.assertIsInstance(group.exceptions[0], exceptions.MalformedResponse)
+            except exceptions.ResponseTimeout:
+                pass
+
+
+class MultipartTest(TransportTestCase):
+
+    def test_parts_are_reassembled(self):
+        self.start(chunk_size=64)
+        self.assertGreater(len(self.truth), 0)
+        self.assertEqual(self.list_children(), self.truth)
+
+    def test_lost_parts_are_detected(self):
+        self.start(chunk_size=64, seed=1, api_options={'request_ttl': 0.5})
+        self.emulator.loss = 0.1
+        self.assertCorrectOrMalformed(10)
+
+    def test_lost_parts_are_retransmitted(self):
+        self.start(chunk_size=64, seed=2, api_options={'retransmit': True})
+        self.emulator.loss = 0.1
+        for _ in range(20):
+            self.assertEqual(self.list_children(), self.truth)
+
+    def test_single_datagram_needs_no_check(self):
+        self.start()
+        pending = pycyperus._PendingRequest("/cyperus/list/module")
+        response = pending.add_part((0, 0, 'bus', 'm1|oscillator_sine\nm22|envelope'))
+        self.assertEqual(response[-1], 'm1|oscillator_sine\nm22|envelope')
+
+    # Jitter in the emulator can deliver the final part first, which no
+    # check on the text can tell from a short listing, so reordering is
+    # driven by hand from the emulator's own listing.
+
+    def listing_parts(self, size=50):
+        # lines are 47 characters long, so every joint falls within a line
+        text = ''.join(self.emulator._bus_line(bus_id)
+                       for bus_id in self.emulator._children(self.root))
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        parts = [(0, 1, self.root, pycyperus.DIRECT_DESCENDANT, chunk) for chunk in chunks]
+        parts[-1] = parts[-1][:1] + (0,) + parts[-1][2:]
+        return text, parts
+
+    def test_reordered_parts_are_detected(self):
+        self.start(buses=4)
+        text, parts = self.listing_parts()
+        pending = pycyperus._PendingRequest("/cyperus/list/bus")
+        for part in [parts[0], parts[2], parts[1], parts[3]]:
+            self.assertIsNone(pending.add_part(part))
+        self.assertTrue(pending.wait(1))
+        self.assertIsInstance(pending.error.exceptions[0], exceptions.MalformedResponse)
+
+    def test_reordered_parts_are_retransmitted(self):
+        self.start(buses=4)
+        text, parts = self.listing_parts()
+        pending = pycyperus._PendingRequest("/cyperus/list/bus")
+        for part in [parts[0], parts[2], parts[1], parts[3]]:
+            pending.add_part(part, 'first')
+        pending.restart()
+        for part in parts[:-1]:
+            self.assertIsNone(pending.add_part(part, 'second'))
+        self.assertEqual(pending.add_part(parts[-1], 'second')[-1], text)
+        self.assertIs(pending.add_part(parts[0], 'first'), False)
+
+    def test_late_part_is_placed_before_the_final_one(self):
+        self.start(buses=3)
+        text, parts = self.listing_parts()
+        pending = pycyperus._PendingRequest("/cyperus/list/bus")
+        self.assertIsNone(pending.add_part(parts[0]))
+        self.assertIsNone(pending.add_part(parts[2]))
+        self.assertEqual(pending.add_part(parts[1])[-1], text)
+
+
+class RetransmitTest(TransportTestCase):
+
+    def test_slow_answers_to_aliases_are_discarded(self):
+        self.start(api_options={'retransmit': True})
+        # answers arrive after the first retransmission timeouts
+        self.emulator.latency = 0.05
+        for _ in range(5):
+            self.assertEqual(self.list_children(), self.truth)
+        time.sleep(0.2)
+        stats = self.api.stats()["/cyperus/list/bus"]
+        self.assertGreater(stats['retransmits'], 0)
+        self.assertGreater(stats['duplicates'] + self.api.pending_stats()['late'], 0)
+        self.assertEqual(stats['orphans'], 0)
+
+    def test_keyed_mutation_is_applied_once(self):
+        self.start(buses=0, deduplicate=True)
+        self.emulator.latency = 0.05
+        before = len(self.emulator.buses)
+        self.api.idempotent('once').add_bus(self.root, 'keyed', 'in', 'out')
+        time.sleep(0.2)
+        self.assertEqual(len(self.emulator.buses), before + 1)
+        self.assertGreater(self.api.stats()["/cyperus/add/bus"]['retransmits'], 0)
+
+    def test_request_ids_are_unique(self):
+        ids = {pycyperus._next_request_id() for _ in range(1000)}
+        self.assertEqual(len(ids), 1000)
+        self.assertEqual(len({request_id.split('-')[0] for request_id in ids}), 1)
+
+
+class PendingTableTest(TransportTestCase):
+
+    def test_capacity_is_enforced(self):
+        self.start(buses=0, api_options={'max_outstanding': 4, 'request_ttl': 0.2})
+        self.emulator.latency = 0.5
+        for _ in range(4):
+            self.api.client.list_main(blocking=False)
+        with self.assertRaises(ExceptionGroup) as raised:
+            self.api.client.list_main(blocking=False)
+        self.assertIsInstance(raised.exception.exceptions[0],
+                              exceptions.TooManyPendingRequests)
+        self.assertEqual(self.api.pending_stats()['rejected'], 1)
+
+    def test_entries_expire_and_late_answers_are_counted(self):
+        self.start(buses=0, api_options={'max_outstanding': 4, 'request_ttl': 0.2})
+        self.emulator.latency = 0.3
+        for _ in range(4):
+            self.api.client.list_main(blocking=False)
+        time.sleep(0.25)
+        # a new request sweeps the expired ones and fits again
+        self.api.client.list_main(blocking=False)
+        time.sleep(0.5)
+        stats = self.api.pending_stats()
+        self.assertGreaterEqual(stats['expired'], 4)
+        self.assertGreaterEqual(stats['late'], 4)
+
+    def test_timeout_raises(self):
+        self.start(buses=0, api_options={'request_ttl': 0.2})
+        self.emulator.loss = 1.0
+        with self.assertRaises(exceptions.ResponseTimeout):
+            self.api.list_main()
+
+
+class ConcurrencyTest(TransportTestCase):
+
+    def test_threads_share_one_client(self):
+        self.start(chunk_size=128, seed=5, api_options={'retransmit': True})
+        self.emulator.loss = 0.05
+        failures = []
+
+        def run():
+            try:
+                for _ in range(25):
+                    if self.list_children() != self.truth:
+                        failures.append('wrong listing')
+            except Exception as exc:
+                failures.append(exc)
+
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(failures, [])
+        self.assertEqual(self.api.pending_stats()['outstanding'], 0)
+
+    def test_closing_twice_keeps_the_shared_receiver(self):
+        port_send, port_receive = _free_ports(2)
+        self.emulator = emulator.Emulator(port_send, port_receive)
+        self.addCleanup(self.emulator.close)
+        first = pycyperus.Api(port_receive, port_send, shared=True)
+        second = pycyperus.Api(port_receive, port_send, shared=True)
+        self.addCleanup(second.close)
+        first.close()
+        first.close()
+        self.assertEqual(second.receiver.references, 1)
+        self.assertEqual(len(list(second.list_main())), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()